@@ -0,0 +1,126 @@
+import math
+import os
+import numpy as np
+import pandas as pd
+from utils import haversine
+from transfers import WALKING_SPEED
+
+# Zugangstabelle: je Adresse die k nächsten Haltestellen im Fußwegradius
+DEFAULT_ACCESS_FILE = 'access_stops.npz'
+DEFAULT_ACCESS_STOPS = 5        # k nächste Haltestellen je Adresse
+MAX_ACCESS_DISTANCE = 800       # Meter, maximaler Fußweg zwischen Adresse und Haltestelle
+NO_STOP = -1                    # Platzhalter für fehlende Einträge (weniger als k Haltestellen im Radius)
+
+
+def build_access_table(address_df, stops_df, k=DEFAULT_ACCESS_STOPS, max_distance=MAX_ACCESS_DISTANCE,
+                       walking_speed=WALKING_SPEED, served_stops=None, filename=DEFAULT_ACCESS_FILE):
+    """
+    Offline-Stufe: berechnet für jede Adresse die k nächsten Haltestellen innerhalb von max_distance
+    samt Gehzeit und speichert das Ergebnis als kompakte Binärtabelle (npz, int32/uint16-Arrays).
+    served_stops: optionale Menge von stop_ids, die von Fahrten bedient werden (z.B. Knoten des Graphen mit
+    Kanten) -> Haltestellen ohne Fahrten werden übersprungen. Stationen (location_type != 0) nie.
+    Rasterzellen in Größe des Radius: je Zelle ein vektorisierter Abstandsvergleich mit den Nachbarzellen.
+    """
+    stops = stops_df.dropna(subset=['stop_lat', 'stop_lon'])
+    if 'location_type' in stops.columns:
+        stops = stops[pd.to_numeric(stops['location_type'], errors='coerce').fillna(0) == 0]
+    if served_stops is not None:
+        stops = stops[stops['stop_id'].isin(served_stops)]
+    stop_ids = stops['stop_id'].astype(str).to_numpy()
+    stop_lats = pd.to_numeric(stops['stop_lat'], errors='coerce').to_numpy(dtype=float)
+    stop_lons = pd.to_numeric(stops['stop_lon'], errors='coerce').to_numpy(dtype=float)
+
+    addresses = address_df.dropna(subset=['full_address', 'lat', 'lon']).drop_duplicates('full_address')
+    address_keys = addresses['full_address'].astype(str).str.lower().to_numpy()
+    lats = pd.to_numeric(addresses['lat'], errors='coerce').to_numpy(dtype=float)
+    lons = pd.to_numeric(addresses['lon'], errors='coerce').to_numpy(dtype=float)
+
+    n = len(address_keys)
+    access_stop = np.full((n, k), NO_STOP, dtype=np.int32)
+    access_seconds = np.zeros((n, k), dtype=np.uint16)
+
+    if n and len(stop_ids):
+        cell_lat = max_distance / 111320.0
+        cell_lon = cell_lat / max(math.cos(math.radians(float(np.mean(stop_lats)))), 0.01)
+        stop_cells = {}
+        for i, key in enumerate(zip((stop_lats // cell_lat).astype(np.int64), (stop_lons // cell_lon).astype(np.int64))):
+            stop_cells.setdefault(key, []).append(i)
+        address_cells = {}
+        for i, key in enumerate(zip((lats // cell_lat).astype(np.int64), (lons // cell_lon).astype(np.int64))):
+            address_cells.setdefault(key, []).append(i)
+
+        for (cx, cy), members in address_cells.items():
+            candidates = []
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    candidates.extend(stop_cells.get((cx + dx, cy + dy), ()))
+            if not candidates:
+                continue
+            rows = np.array(members)
+            candidates = np.array(candidates)
+            # Abstandsmatrix Adressen der Zelle x Kandidaten (Meter)
+            dist = haversine(lats[rows, None], lons[rows, None], stop_lats[candidates], stop_lons[candidates]) * 1000.0
+            dist[dist > max_distance] = np.inf
+            take = min(k, len(candidates))
+            nearest = np.argsort(dist, axis=1, kind='stable')[:, :take]
+            nearest_dist = np.take_along_axis(dist, nearest, axis=1)
+            found = np.isfinite(nearest_dist)
+            access_stop[rows, :take] = np.where(found, candidates[nearest], NO_STOP)
+            seconds = np.ceil(np.where(found, nearest_dist, 0) / walking_speed)
+            access_seconds[rows, :take] = np.minimum(seconds, np.iinfo(np.uint16).max)
+
+    np.savez_compressed(filename, address_keys=address_keys.astype(str), stop_ids=stop_ids.astype(str),
+                        access_stop=access_stop, access_seconds=access_seconds)
+    covered = int(np.count_nonzero(access_stop[:, 0] != NO_STOP))
+    print(f"Zugangstabelle gespeichert: {n} Adressen ({covered} mit Haltestelle im Umkreis) -> {filename}")
+    return filename
+
+
+def load_access_table(filename=DEFAULT_ACCESS_FILE):
+    """
+    Lädt die Zugangstabelle. Gibt None zurück, wenn sie (noch) nicht vorberechnet wurde.
+    """
+    if not os.path.exists(filename):
+        return None
+    with np.load(filename, allow_pickle=False) as data:
+        address_keys = data['address_keys'].tolist()
+        table = {
+            'stop_ids': data['stop_ids'].tolist(),
+            'access_stop': data['access_stop'],
+            'access_seconds': data['access_seconds'],
+        }
+    table['address_index'] = {key: i for i, key in enumerate(address_keys)}
+    print(f"Zugangstabelle geladen: {len(address_keys)} Adressen")
+    return table
+
+
+def access_stops_for_address(access_table, address):
+    """
+    Liefert die vorberechneten Zugangshaltestellen einer Adresse als [(stop_id, gehzeit_sekunden)],
+    nach Gehzeit sortiert. Leere Liste, wenn die Adresse nicht in der Tabelle steht.
+    """
+    if access_table is None:
+        return []
+    row = access_table['address_index'].get(str(address).lower())
+    if row is None:
+        return []
+    stop_ids = access_table['stop_ids']
+    return [(stop_ids[stop], int(seconds))
+            for stop, seconds in zip(access_table['access_stop'][row].tolist(), access_table['access_seconds'][row].tolist())
+            if stop != NO_STOP]
+
+
+if __name__ == "__main__":
+    # Offline-Pipeline: nur Haltestellen mit Fahrten (Knoten des Graphen mit Kanten) als Zugang verwenden
+    import pickle
+    from feed_merge import load_merged_gtfs_data
+    from utils import load_address_data
+
+    gtfs = load_merged_gtfs_data()
+    served = None
+    if os.path.exists('graph.pkl'):
+        with open('graph.pkl', 'rb') as f:
+            graph = pickle.load(f)
+        # build_transit_graph legt jede Zeile aus stops.txt als Knoten an, auch Stationen & unbediente Halte
+        served = {stop_id for stop_id in graph if graph.out_degree(stop_id) or graph.in_degree(stop_id)}
+    build_access_table(load_address_data(), gtfs['stops'], served_stops=served)
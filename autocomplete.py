@@ -0,0 +1,124 @@
+import re
+from bisect import bisect_left
+from rapidfuzz import process, fuzz
+
+# Einstellungen für die Vorschläge beim Tippen
+DEFAULT_SUGGESTION_LIMIT = 8
+MIN_FUZZY_LENGTH = 3        # Fuzzy-Suche erst ab 3 Zeichen (vorher zu viele Zufallstreffer)
+FUZZY_MIN_SCORE = 75
+MAX_PREFIX_CANDIDATES = 200 # Obergrenze der betrachteten Präfix-Treffer je Art und Anfrage
+
+KIND_STOP = 'Haltestelle'
+KIND_ADDRESS = 'Adresse'
+
+_WORD_START = re.compile(r'[\w(]+')
+_STREET = re.compile(r'^(\D+?)\s*\d')    # Straßenname = Text vor der Hausnummer
+
+
+def normalize_text(text):
+    """
+    Vereinheitlicht Eingaben für den Vergleich (Kleinschreibung, Leerzeichen).
+    """
+    return ' '.join(str(text).casefold().split())
+
+
+def build_autocomplete_index(stops_df, address_df=None):
+    """
+    Baut den Index für die Vorschläge aus Haltestellennamen (stops.txt) und Adressen.
+    Jeder Eintrag wird ab jedem Wortanfang als Schlüssel abgelegt ("marktplatz" findet auch
+    "Karlsruhe Marktplatz (Pyramide U)"). Die Schlüssel liegen als sortierte Liste vor,
+    eine Anfrage ist damit eine binäre Suche plus ein kurzer Scan.
+    """
+    entries = []    # (Anzeigetext, Art)
+    seen = set()
+    for name in stops_df['stop_name'].dropna().astype(str):
+        if name not in seen:
+            seen.add(name)
+            entries.append((name, KIND_STOP))
+    if address_df is not None and not address_df.empty and 'full_address' in address_df.columns:
+        for address in address_df['full_address'].dropna().astype(str):
+            if address not in seen:
+                seen.add(address)
+                entries.append((address, KIND_ADDRESS))
+
+    # Getrennte Schlüssellisten je Art: Haltestellen werden so nie von der Adressflut verdrängt
+    normalized = [normalize_text(text) for text, _ in entries]
+    keys = {KIND_STOP: [], KIND_ADDRESS: []}
+    for entry_id, text in enumerate(normalized):
+        kind_keys = keys[entries[entry_id][1]]
+        for match in _WORD_START.finditer(text):
+            kind_keys.append((text[match.start():], entry_id))
+    for kind_keys in keys.values():
+        kind_keys.sort()
+
+    # Kleines Vokabular für die unscharfe Suche: Haltestellennamen und Straßennamen ohne Hausnummer.
+    # Die Fuzzy-Suche über alle Adressen wäre für jeden Tastendruck zu langsam.
+    terms = set()
+    for (_, kind), text in zip(entries, normalized):
+        street = _STREET.match(text) if kind == KIND_ADDRESS else None
+        terms.add(street.group(1) if street else text)
+
+    print(f"Autovervollständigung: {len(entries)} Einträge, {sum(len(k) for k in keys.values())} Schlüssel")
+    return {
+        'entries': entries,
+        'normalized': normalized,
+        # Art -> (sortierte Schlüssel, zugehörige Eintragsnummern)
+        'keys': {kind: ([key for key, _ in kind_keys], [entry_id for _, entry_id in kind_keys])
+                 for kind, kind_keys in keys.items()},
+        'fuzzy_terms': sorted(terms),
+    }
+
+
+def _prefix_matches(index, query, cancel_token=None):
+    found = {}
+    for keys, key_entries in index['keys'].values():
+        count = 0
+        position = bisect_left(keys, query)
+        while position < len(keys) and keys[position].startswith(query):
+            entry_id = key_entries[position]
+            # Treffer am Anfang des Eintrags zählen mehr als Treffer in einem späteren Wort
+            at_start = index['normalized'][entry_id].startswith(query)
+            if entry_id not in found:
+                count += 1
+            found[entry_id] = found.get(entry_id, False) or at_start
+            if count >= MAX_PREFIX_CANDIDATES:
+                break
+            position += 1
+            if cancel_token is not None and position % 1024 == 0:
+                cancel_token.check()
+    return found
+
+
+def _ranked(index, found):
+    entries = index['entries']
+    return sorted(found, key=lambda entry_id: (not found[entry_id], entries[entry_id][1] != KIND_STOP,
+                                               len(entries[entry_id][0]), entries[entry_id][0]))
+
+
+def suggest(index, text, limit=DEFAULT_SUGGESTION_LIMIT, cancel_token=None):
+    """
+    Liefert bis zu limit Vorschläge [(Anzeigetext, Art)] für eine (Teil-)Eingabe.
+    Reihenfolge: Treffer am Anfang vor Treffern in späteren Wörtern, Haltestellen vor Adressen,
+    kürzere Namen zuerst. Reichen die Präfix-Treffer nicht, wird unscharf (rapidfuzz) gesucht.
+    """
+    query = normalize_text(text)
+    if not query or index is None:
+        return []
+
+    found = _prefix_matches(index, query, cancel_token)
+    chosen = _ranked(index, found)[:limit]
+
+    # Fuzzy-Fallback bei Tippfehlern: ähnliche Namen suchen und deren Einträge per Präfix nachladen
+    if len(chosen) < limit and len(query) >= MIN_FUZZY_LENGTH:
+        if cancel_token is not None:
+            cancel_token.check()
+        fuzzy = process.extract(query, index['fuzzy_terms'], scorer=fuzz.WRatio,
+                                limit=limit, score_cutoff=FUZZY_MIN_SCORE)
+        for term, _, _ in fuzzy:
+            for entry_id in _ranked(index, _prefix_matches(index, term, cancel_token)):
+                if len(chosen) >= limit:
+                    break
+                if entry_id not in found:
+                    found[entry_id] = False
+                    chosen.append(entry_id)
+    return [index['entries'][entry_id] for entry_id in chosen]
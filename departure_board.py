@@ -0,0 +1,282 @@
+import heapq
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from gtfs_processing import gtfs_time_to_seconds
+from parent_station_utils import build_station_groups
+from utils import get_active_service_ids, seconds_to_time_str
+
+DEFAULT_DEPARTURE_COUNT = 10
+DAY_SECONDS = 24 * 3600
+SCAN_WINDOW = 32        # so viele Abfahrten je Steig werden auf einmal aus den Arrays gelesen
+
+
+def _platform_label(value):
+    # platform_code wird von pandas bei reinen Zahlen als float gelesen (1.0 -> "1")
+    if pd.isna(value):
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def build_departure_index(gtfs):
+    """
+    Baut den Abfahrtsindex für Abfahrtstafeln: je Steig alle Abfahrten nach Zeit sortiert (CSR wie im Umstiegsmodell).
+    Letzte Halte einer Fahrt (keine Abfahrt) und Halte mit pickup_type 1 (kein Einstieg) werden weggelassen.
+    Linie, Ziel und Bedienungstag stehen einmal je Fahrt in eigenen Listen.
+    Taktfahrten aus frequencies.txt stehen nicht im Index: ihre stop_times sind nur Vorlagen (Zeiten relativ
+    zur ersten Abfahrt, eigene CSR je Steig), die einzelnen Abfahrten erzeugt erst departure_board.
+    """
+    stops = gtfs['stops']
+    stop_ids = stops['stop_id'].tolist()
+    stop_index = {stop_id: i for i, stop_id in enumerate(stop_ids)}
+
+    columns = [c for c in ['trip_id', 'stop_id', 'stop_sequence', 'departure_time', 'stop_headsign', 'pickup_type']
+               if c in gtfs['stop_times'].columns]
+    stop_times = gtfs['stop_times'][columns]
+    stop_times = stop_times.assign(
+        stop_idx=stop_times['stop_id'].map(stop_index),
+        stop_sequence=pd.to_numeric(stop_times['stop_sequence'], errors='coerce'),
+        dep=gtfs_time_to_seconds(stop_times['departure_time']),
+    ).dropna(subset=['stop_idx', 'stop_sequence'])
+    stop_times = stop_times.sort_values(['trip_id', 'stop_sequence'], kind='stable')
+    last_stop = stop_times.groupby('trip_id', sort=False)['stop_idx'].transform('last')
+    first_dep = stop_times.groupby('trip_id', sort=False)['dep'].transform('first')
+    final_row = ~stop_times['trip_id'].duplicated(keep='last')
+    boards = ~final_row & (stop_times['dep'] >= 0)
+    if 'pickup_type' in stop_times.columns:
+        boards &= pd.to_numeric(stop_times['pickup_type'], errors='coerce').fillna(0) != 1
+    departures = stop_times[boards].assign(last_stop=last_stop[boards], first_dep=first_dep[boards])
+
+    # Fahrten: Linie, Ziel (Headsign oder Name der Endhaltestelle) und Service
+    trips = gtfs['trips'].merge(gtfs['routes'], on='route_id', how='left')
+    trip_codes, trip_ids = pd.factorize(departures['trip_id'], sort=False)
+    trips = trips.set_index('trip_id').reindex(trip_ids)
+    line = pd.Series('', index=trips.index, dtype=object)
+    for column in ['route_long_name', 'route_short_name']:
+        if column in trips.columns:
+            line = trips[column].where(trips[column].notna() & (trips[column].astype(str) != ''), line)
+    trip_headsign = trips['trip_headsign'] if 'trip_headsign' in trips.columns else pd.Series(np.nan, index=trips.index)
+    service_codes, service_ids = pd.factorize(trips['service_id'], sort=False)
+
+    # Ziel je Abfahrt: stop_headsign > trip_headsign > Endhaltestelle
+    stop_names = stops['stop_name'].astype(str).to_numpy()
+    headsign = pd.Series(stop_names[departures['last_stop'].to_numpy(dtype=np.int64)], index=departures.index)
+    headsign = pd.Series(trip_headsign.to_numpy()[trip_codes], index=departures.index).where(
+        lambda s: s.notna() & (s.astype(str) != ''), headsign)
+    if 'stop_headsign' in departures.columns:
+        headsign = departures['stop_headsign'].where(departures['stop_headsign'].notna(), headsign)
+    headsign_codes, headsigns = pd.factorize(headsign.astype(str), sort=False)
+
+    # Taktfahrten: Fahrten mit Einträgen in frequencies.txt sind nur Vorlagen (wie in build_timetable)
+    frequencies = gtfs.get('frequencies')
+    is_template = np.zeros(len(trip_ids), dtype=bool)
+    if frequencies is not None and not frequencies.empty:
+        freq_trip = pd.Index(trip_ids).get_indexer(frequencies['trip_id'])
+        freq_start = gtfs_time_to_seconds(frequencies['start_time'])
+        freq_end = gtfs_time_to_seconds(frequencies['end_time'])
+        freq_headway = pd.to_numeric(frequencies['headway_secs'], errors='coerce').fillna(0).to_numpy(dtype=np.int64)
+        valid = (freq_trip >= 0) & (freq_start >= 0) & (freq_end > freq_start) & (freq_headway > 0)
+        freq_trip, freq_start, freq_end, freq_headway = (freq_trip[valid], freq_start[valid],
+                                                         freq_end[valid], freq_headway[valid])
+        is_template[freq_trip] = True
+    else:
+        freq_trip = freq_start = freq_end = freq_headway = np.zeros(0, dtype=np.int64)
+    # Takte je Fahrt (CSR), damit eine Vorlagen-Abfahrt ihre Takte findet
+    freq_order = np.argsort(freq_trip, kind='stable')
+    freq_offsets = np.zeros(len(trip_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(freq_trip, minlength=len(trip_ids)), out=freq_offsets[1:])
+
+    # CSR: Abfahrten nach Steig, innerhalb eines Steigs nach Zeit sortiert (ohne Vorlagen)
+    template = is_template[trip_codes]
+    static = ~template
+    stop_idx = departures['stop_idx'].to_numpy(dtype=np.int64)[static]
+    dep = departures['dep'].to_numpy(dtype=np.int32)[static]
+    order = np.lexsort((dep, stop_idx))
+    offsets = np.zeros(len(stop_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(stop_idx, minlength=len(stop_ids)), out=offsets[1:])
+
+    # Vorlagen-Abfahrten je Steig, Zeit relativ zur ersten Abfahrt der Fahrt
+    template_stop = departures['stop_idx'].to_numpy(dtype=np.int64)[template]
+    template_dep = (departures['dep'] - departures['first_dep']).to_numpy(dtype=np.int32)[template]
+    template_order = np.lexsort((template_dep, template_stop))
+    template_offsets = np.zeros(len(stop_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(template_stop, minlength=len(stop_ids)), out=template_offsets[1:])
+
+    platforms = stops['platform_code'] if 'platform_code' in stops.columns else pd.Series('', index=stops.index)
+    print(f"Abfahrtsindex erstellt: {len(dep)} Abfahrten an {int(np.count_nonzero(np.diff(offsets)))} Steigen, "
+          f"{len(freq_trip)} Takte aus frequencies.txt")
+    return {
+        'stop_ids': stop_ids,
+        'stop_index': stop_index,
+        'stop_platform': [_platform_label(p) for p in platforms],
+        'station_groups': build_station_groups(stops),
+        'offsets': offsets,
+        'dep': dep[order],
+        'dep_trip': trip_codes[static][order].astype(np.int32),
+        'dep_headsign': headsign_codes[static][order].astype(np.int32),
+        'freq_offsets': freq_offsets,
+        'freq_start': freq_start[freq_order].astype(np.int32),
+        'freq_end': freq_end[freq_order].astype(np.int32),
+        'freq_headway': freq_headway[freq_order].astype(np.int32),
+        'template_offsets': template_offsets,
+        'template_dep': template_dep[template_order],
+        'template_trip': trip_codes[template][template_order].astype(np.int32),
+        'template_headsign': headsign_codes[template][template_order].astype(np.int32),
+        'headsigns': [str(h) for h in headsigns],
+        'trip_ids': list(trip_ids),
+        'trip_line': [str(x) for x in line],
+        'trip_service': service_codes.astype(np.int32),
+        'service_ids': list(service_ids),
+        'calendar': gtfs.get('calendar'),
+        'calendar_dates': gtfs.get('calendar_dates'),
+        'active_trips': {},     # Cache: Datum -> bool-Array der an diesem Tag verkehrenden Fahrten
+    }
+
+
+def active_trips_on(departure_index, date):
+    """
+    bool-Array über alle Fahrten: verkehrt die Fahrt am Betriebstag date (calendar + calendar_dates)?
+    Wird je Datum einmal berechnet und für alle Tafeln wiederverwendet.
+    """
+    cache = departure_index['active_trips']
+    active = cache.get(date)
+    if active is None:
+        services = get_active_service_ids(departure_index['calendar'], departure_index['calendar_dates'], date)
+        service_active = np.array([s in services for s in departure_index['service_ids']] + [False], dtype=bool)
+        # Fahrten ohne Service (Code -1) landen auf dem letzten Eintrag -> nie aktiv
+        active = service_active[departure_index['trip_service']]
+        if len(cache) > 8:
+            cache.clear()
+        cache[date] = active
+    return active
+
+
+def departure_board(departure_index, station_id, now=None, count=DEFAULT_DEPARTURE_COUNT, delays=None):
+    """
+    Nächste count Abfahrten an einer Station (alle Steige derselben parent_station) ab now.
+    delays: optional dict trip_id -> Verspätung in Sekunden (Echtzeit, negativ = zu früh).
+    Fahrten des Vortags mit Zeiten nach 24:00 und kurz vor Mitternacht die des Folgetags werden berücksichtigt.
+    Rückgabe: Liste von dicts mit 'time', 'scheduled', 'delay', 'line', 'headsign', 'platform', 'stop_id', 'trip_id'.
+    """
+    if now is None:
+        now = datetime.now()
+    stop_index = departure_index['stop_index']
+    members = [stop_index[s] for s in departure_index['station_groups'].get(station_id, [station_id]) if s in stop_index]
+    if not members:
+        return []
+
+    trip_ids = departure_index['trip_ids']
+    delays = delays or {}
+    max_late = max(0, max(delays.values(), default=0))
+    max_early = max(0, -min(delays.values(), default=0))
+    offsets = departure_index['offsets']
+    dep_all = departure_index['dep']
+    trips_all = departure_index['dep_trip']
+    headsigns_all = departure_index['dep_headsign']
+    freq_start = departure_index['freq_start']
+    freq_end = departure_index['freq_end']
+    freq_headway = departure_index['freq_headway']
+    template_trip = departure_index['template_trip']
+    template_headsign = departure_index['template_headsign']
+    now_seconds = now.hour * 3600 + now.minute * 60 + now.second
+
+    # Zeiten relativ zu Mitternacht von now; Betriebstage: heute, gestern (Zeiten nach 24:00), morgen (kurz vor Mitternacht)
+    best = []      # Heap über (-Abfahrt, ...) mit den count frühesten Abfahrten, best[0] = späteste davon
+    for day_offset in (0, DAY_SECONDS, -DAY_SECONDS):
+        service_date = (now - timedelta(seconds=day_offset)).date()
+        active = active_trips_on(departure_index, service_date)
+        query = now_seconds + day_offset
+
+        def offer(scheduled, trip, position, headsign, stop):
+            # Abfahrt übernehmen, wenn sie aktiv ist, nach query liegt und zu den count frühesten gehört
+            if not active[trip]:
+                return
+            actual = scheduled + delays.get(trip_ids[trip], 0)
+            if actual < query:
+                return
+            entry = (-(actual - day_offset), scheduled - day_offset, position, stop, trip, headsign)
+            if len(best) < count:
+                heapq.heappush(best, entry)
+            elif entry > best[0]:
+                heapq.heapreplace(best, entry)
+
+        for stop in members:
+            start, end = int(offsets[stop]), int(offsets[stop + 1])
+            position = start + int(dep_all[start:end].searchsorted(query - max_late, 'left'))
+            done = False
+            while position < end and not done:
+                window_end = min(position + SCAN_WINDOW, end)
+                for k, (scheduled, trip, headsign) in enumerate(zip(dep_all[position:window_end].tolist(),
+                                                                    trips_all[position:window_end].tolist(),
+                                                                    headsigns_all[position:window_end].tolist())):
+                    # Frühestmögliche Abfahrt schon später als die count-te gefundene -> Steig fertig
+                    if len(best) == count and scheduled - day_offset - max_early > -best[0][0]:
+                        done = True
+                        break
+                    offer(scheduled, trip, position + k, headsign, stop)
+                position = window_end
+
+            # Taktfahrten: Abfahrten aus den Vorlagen in Zeitreihenfolge erzeugen (Heap wie in plan_route_timed)
+            virtual = _frequency_heap(departure_index, stop, query - max_late)
+            while virtual:
+                scheduled, row, k, j = virtual[0]
+                if len(best) == count and scheduled - day_offset - max_early > -best[0][0]:
+                    break
+                headway = int(freq_headway[row])
+                if (j + 1) * headway < freq_end[row] - freq_start[row]:
+                    heapq.heapreplace(virtual, (scheduled + headway, row, k, j + 1))
+                else:
+                    heapq.heappop(virtual)
+                # Position hinter allen festen Abfahrten -> bei Gleichstand eindeutig
+                offer(scheduled, int(template_trip[k]), len(dep_all) + k, int(template_headsign[k]), stop)
+
+    board = []
+    for negative_actual, scheduled, position, stop, trip, headsign in sorted(best, reverse=True):
+        board.append({
+            'time': seconds_to_time_str(-negative_actual),
+            'scheduled': seconds_to_time_str(scheduled),
+            'delay': int((-negative_actual - scheduled) / 60),     # Richtung 0 runden: 30 s zu früh -> 0
+            'line': departure_index['trip_line'][trip],
+            'headsign': departure_index['headsigns'][headsign],
+            'platform': departure_index['stop_platform'][stop],
+            'stop_id': departure_index['stop_ids'][stop],
+            'trip_id': trip_ids[trip],
+        })
+    return board
+
+
+def _frequency_heap(departure_index, stop, earliest):
+    """
+    Start-Heap für die Taktfahrten an einem Steig: je (Takt, Vorlagen-Abfahrt) die erste Abfahrt ab earliest
+    als (Abfahrt, Takt, Vorlagen-Abfahrt, Nummer der Fahrt im Takt).
+    """
+    heap = []
+    freq_offsets = departure_index['freq_offsets']
+    template_offsets = departure_index['template_offsets']
+    for k in range(int(template_offsets[stop]), int(template_offsets[stop + 1])):
+        trip = int(departure_index['template_trip'][k])
+        offset = int(departure_index['template_dep'][k])
+        for row in range(int(freq_offsets[trip]), int(freq_offsets[trip + 1])):
+            start, end = int(departure_index['freq_start'][row]), int(departure_index['freq_end'][row])
+            headway = int(departure_index['freq_headway'][row])
+            j = max(0, -(-(earliest - start - offset) // headway))
+            if start + j * headway < end:
+                heap.append((start + j * headway + offset, row, k, j))
+    heapq.heapify(heap)
+    return heap
+
+
+def format_departure_board(board, title=""):
+    """
+    Textdarstellung einer Abfahrtstafel (z.B. für Kiosk-Bildschirme oder die Konsole).
+    """
+    lines = [f"Abfahrten {title}".rstrip()]
+    if not board:
+        lines.append("Keine Abfahrten gefunden.")
+    for entry in board:
+        delay = f" (+{entry['delay']})" if entry['delay'] > 0 else (f" ({entry['delay']})" if entry['delay'] < 0 else "")
+        platform = f"  Steig {entry['platform']}" if entry['platform'] else ""
+        lines.append(f"{entry['time']}{delay}  {entry['line']} -> {entry['headsign']}{platform}")
+    return "\n".join(lines)
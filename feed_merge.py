@@ -0,0 +1,190 @@
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz
+from gtfs_processing import load_gtfs_data
+from utils import haversine
+
+# Zusätzliche Feeds (Nachbarverbünde) liegen als Unterordner hier, z.B. gtfs_feeds/vrn/stops.txt
+DEFAULT_FEEDS_FOLDER = 'gtfs_feeds'
+DEDUP_DISTANCE = 50         # Meter: Haltestellen verschiedener Feeds näher als das gelten als dieselbe ...
+DEDUP_NAME_SCORE = 85       # ... wenn auch der Name ähnlich genug ist (rapidfuzz token_sort_ratio)
+
+# Welche Spalten welche ID-Art enthalten (je Tabelle)
+ID_COLUMNS = {
+    'stops': {'stop_id': 'stop', 'parent_station': 'stop'},
+    'routes': {'route_id': 'route', 'agency_id': 'agency'},
+    'trips': {'trip_id': 'trip', 'route_id': 'route', 'service_id': 'service', 'shape_id': 'shape'},
+    'stop_times': {'trip_id': 'trip', 'stop_id': 'stop'},
+    'calendar': {'service_id': 'service'},
+    'calendar_dates': {'service_id': 'service'},
+    'shapes': {'shape_id': 'shape'},
+    'frequencies': {'trip_id': 'trip'},
+    'transfers': {'from_stop_id': 'stop', 'to_stop_id': 'stop', 'from_trip_id': 'trip', 'to_trip_id': 'trip',
+                  'from_route_id': 'route', 'to_route_id': 'route'},
+}
+
+
+def find_feed_folders(main_folder='gtfs', feeds_folder=DEFAULT_FEEDS_FOLDER):
+    """
+    Liefert den Hauptfeed und alle zusätzlichen Feeds (Unterordner mit stops.txt) in fester Reihenfolge.
+    """
+    folders = [main_folder]
+    if os.path.isdir(feeds_folder):
+        for name in sorted(os.listdir(feeds_folder)):
+            path = os.path.join(feeds_folder, name)
+            if os.path.exists(os.path.join(path, 'stops.txt')):
+                folders.append(path)
+    return folders
+
+
+def _ids_of_kind(gtfs, kind):
+    values = set()
+    for table, columns in ID_COLUMNS.items():
+        if table not in gtfs:
+            continue
+        for column, column_kind in columns.items():
+            if column_kind == kind and column in gtfs[table].columns:
+                values.update(gtfs[table][column].dropna().tolist())
+    return values
+
+
+def _remap(series, mapping):
+    if not mapping:
+        return series
+    return series.map(mapping).fillna(series)
+
+
+def _normalize_name(name):
+    return ' '.join(str(name).casefold().replace(',', ' ').split())
+
+
+def _match_stops(known, stops, dedup_distance, name_score):
+    """
+    Sucht für jede Haltestelle aus stops eine bereits bekannte Haltestelle (gleiche Art, Abstand
+    <= dedup_distance, ähnlicher Name). Raster-Buckets wie beim Umstiegsmodell, Abstände je Zelle vektorisiert.
+    Rückgabe: dict stop_id -> bekannte stop_id.
+    """
+    matches = {}
+    known = known.dropna(subset=['stop_lat', 'stop_lon'])
+    stops = stops.dropna(subset=['stop_lat', 'stop_lon'])
+    if known.empty or stops.empty:
+        return matches
+    known_lats = pd.to_numeric(known['stop_lat'], errors='coerce').to_numpy(dtype=float)
+    known_lons = pd.to_numeric(known['stop_lon'], errors='coerce').to_numpy(dtype=float)
+    known_ids = known['stop_id'].tolist()
+    known_names = [_normalize_name(name) for name in known['stop_name']]
+    known_types = pd.to_numeric(known.get('location_type', pd.Series(0, index=known.index)), errors='coerce').fillna(0).to_numpy()
+    lats = pd.to_numeric(stops['stop_lat'], errors='coerce').to_numpy(dtype=float)
+    lons = pd.to_numeric(stops['stop_lon'], errors='coerce').to_numpy(dtype=float)
+    ids = stops['stop_id'].tolist()
+    names = [_normalize_name(name) for name in stops['stop_name']]
+    types = pd.to_numeric(stops.get('location_type', pd.Series(0, index=stops.index)), errors='coerce').fillna(0).to_numpy()
+
+    cell_lat = dedup_distance / 111320.0
+    cell_lon = cell_lat / max(math.cos(math.radians(float(np.mean(known_lats)))), 0.01)
+    cells = {}
+    for i, key in enumerate(zip((known_lats // cell_lat).astype(np.int64), (known_lons // cell_lon).astype(np.int64))):
+        cells.setdefault(key, []).append(i)
+    new_cells = {}
+    for i, key in enumerate(zip((lats // cell_lat).astype(np.int64), (lons // cell_lon).astype(np.int64))):
+        new_cells.setdefault(key, []).append(i)
+
+    for (cx, cy), members in new_cells.items():
+        candidates = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                candidates.extend(cells.get((cx + dx, cy + dy), ()))
+        if not candidates:
+            continue
+        rows = np.array(members)
+        candidates = np.array(candidates)
+        dist = haversine(lats[rows, None], lons[rows, None], known_lats[candidates], known_lons[candidates]) * 1000.0
+        for r, row in enumerate(rows):
+            # Nächste passende Haltestelle zuerst prüfen
+            for c in np.argsort(dist[r], kind='stable'):
+                if dist[r, c] > dedup_distance:
+                    break
+                j = candidates[c]
+                if known_types[j] == types[row] and fuzz.token_sort_ratio(names[row], known_names[j]) >= name_score:
+                    matches[ids[row]] = known_ids[j]
+                    break
+    return matches
+
+
+def merge_gtfs_feeds(feeds, feed_names, dedup_distance=DEDUP_DISTANCE, name_score=DEDUP_NAME_SCORE):
+    """
+    Führt mehrere geladene GTFS-Feeds (dicts wie aus load_gtfs_data) zu einem zusammen.
+      - IDs des ersten Feeds bleiben unverändert (Graph-Cache & Richtungslogik funktionieren weiter)
+      - gleiche Haltestellen (gleiche ID oder nah beieinander mit ähnlichem Namen) werden zusammengelegt
+      - übrige kollidierende IDs späterer Feeds bekommen den Feed-Namen als Präfix ("vrn:1234")
+    Jede Tabelle erhält eine Spalte 'feed_id'.
+    """
+    merged = {}
+    known_ids = {}      # ID-Art -> Menge der bereits vergebenen IDs
+    for feed, name in zip(feeds, feed_names):
+        if not feed:
+            continue
+        feed = dict(feed)
+        mappings = {}
+        if merged:
+            known_stops = pd.concat(merged['stops'], ignore_index=True)
+            # Gleiche stop_id an (fast) gleicher Stelle -> dieselbe Haltestelle, sonst Kollision
+            same_id = feed['stops'].merge(known_stops[['stop_id', 'stop_lat', 'stop_lon']], on='stop_id', suffixes=('', '_known'))
+            dist = haversine(same_id['stop_lat'].astype(float), same_id['stop_lon'].astype(float),
+                             same_id['stop_lat_known'].astype(float), same_id['stop_lon_known'].astype(float)) * 1000.0
+            shared = set(same_id.loc[(dist <= dedup_distance) | dist.isna(), 'stop_id'])
+            stop_map = _match_stops(known_stops, feed['stops'][~feed['stops']['stop_id'].isin(shared)],
+                                    dedup_distance, name_score)
+            dropped = shared | set(stop_map)
+            for stop_id in _ids_of_kind(feed, 'stop'):
+                if stop_id not in dropped and stop_id in known_ids['stop']:
+                    stop_map[stop_id] = f"{name}:{stop_id}"
+            mappings['stop'] = stop_map
+            for kind in ('route', 'agency', 'trip', 'service', 'shape'):
+                mappings[kind] = {value: f"{name}:{value}" for value in _ids_of_kind(feed, kind) & known_ids.get(kind, set())}
+            # Zusammengelegte Haltestellen nur einmal behalten
+            feed['stops'] = feed['stops'][~feed['stops']['stop_id'].isin(dropped)]
+            prefixed = sum(len(m) for m in mappings.values()) - (len(dropped) - len(shared))
+            print(f"Feed '{name}': {len(dropped)} Haltestellen zusammengelegt, {prefixed} IDs mit Präfix versehen")
+
+        for table, columns in ID_COLUMNS.items():
+            if table not in feed:
+                continue
+            df = feed[table].copy()
+            for column, kind in columns.items():
+                if column in df.columns:
+                    df[column] = _remap(df[column], mappings.get(kind))
+            df['feed_id'] = name
+            merged.setdefault(table, []).append(df)
+        for kind in ('stop', 'route', 'agency', 'trip', 'service', 'shape'):
+            known_ids.setdefault(kind, set()).update(_ids_of_kind(
+                {table: frames[-1] for table, frames in merged.items()}, kind))
+
+    gtfs = {table: pd.concat(frames, ignore_index=True) for table, frames in merged.items()}
+    if gtfs:
+        print(f"{len(feed_names)} Feeds zusammengeführt: {len(gtfs['stops'])} Haltestellen, {len(gtfs['trips'])} Fahrten")
+    return gtfs
+
+
+def load_merged_gtfs_data(gtfs_folders=None, feed_names=None, max_workers=None,
+                          dedup_distance=DEDUP_DISTANCE, name_score=DEDUP_NAME_SCORE):
+    """
+    Lädt mehrere GTFS-Ordner parallel (Threads, pandas liest ohne GIL) und führt sie zusammen.
+    Ohne zusätzliche Feeds entspricht das Ergebnis genau load_gtfs_data().
+    """
+    if gtfs_folders is None:
+        gtfs_folders = find_feed_folders()
+    if len(gtfs_folders) == 1:
+        return load_gtfs_data(gtfs_folders[0])
+    if feed_names is None:
+        feed_names = [os.path.basename(os.path.normpath(folder)) for folder in gtfs_folders]
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(gtfs_folders)) as executor:
+        feeds = list(executor.map(load_gtfs_data, gtfs_folders))
+    for folder, feed in zip(gtfs_folders, feeds):
+        if not feed:
+            print(f"Feed '{folder}' konnte nicht geladen werden und wird übersprungen.")
+    return merge_gtfs_feeds(feeds, feed_names, dedup_distance, name_score)
@@ -0,0 +1,180 @@
+import heapq
+import random
+import time
+import numpy as np
+from utils import haversine
+
+# Anzahl der Landmarken für ALT (A*, Landmarks, Dreiecksungleichung)
+DEFAULT_LANDMARK_COUNT = 8
+
+
+def build_lower_bound_graph(timetable, transfer_model=None):
+    """
+    Baut einen zeitunabhängigen Graphen mit minimalen Fahrzeiten als Kantengewicht.
+    Jede Verbindung im Fahrplan dauert mindestens so lange -> Distanzen darin sind untere Schranken.
+    Rückgabe: (sources, targets, weights) als numpy-Arrays.
+    """
+    n = len(timetable['stop_ids'])
+    sources = timetable['conn_from'].astype(np.int64)
+    targets = timetable['conn_to'].astype(np.int64)
+    weights = (timetable['conn_arr'] - timetable['conn_dep']).astype(np.int64)
+    # Vorlagen der Taktfahrten (frequencies.txt) fahren mit denselben Fahrzeiten
+    sources = np.concatenate((sources, timetable['template_from'].astype(np.int64)))
+    targets = np.concatenate((targets, timetable['template_to'].astype(np.int64)))
+    weights = np.concatenate((weights, (timetable['template_arr'] - timetable['template_dep']).astype(np.int64)))
+    if transfer_model is not None:
+        foot_sources = np.repeat(np.arange(n), np.diff(transfer_model['offsets']))
+        sources = np.concatenate((sources, foot_sources))
+        targets = np.concatenate((targets, transfer_model['targets'].astype(np.int64)))
+        weights = np.concatenate((weights, transfer_model['durations'].astype(np.int64)))
+
+    # Je Haltestellenpaar nur die kürzeste Kante behalten
+    order = np.lexsort((weights, targets, sources))
+    sources, targets, weights = sources[order], targets[order], weights[order]
+    first = np.ones(len(sources), dtype=bool)
+    first[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+    return sources[first], targets[first], np.maximum(weights[first], 0)
+
+
+def _to_csr(n, sources, targets, weights):
+    order = np.argsort(sources, kind='stable')
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=n), out=offsets[1:])
+    return offsets.tolist(), targets[order].tolist(), weights[order].tolist()
+
+
+def _dijkstra(csr, source):
+    offsets, targets, weights = csr
+    dist = [float('inf')] * (len(offsets) - 1)
+    dist[source] = 0
+    heap = [(0, source)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        for k in range(offsets[u], offsets[u + 1]):
+            v = targets[k]
+            nd = d + weights[k]
+            if nd < dist[v]:
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return np.array(dist, dtype=float)
+
+
+def select_landmarks(timetable, count=DEFAULT_LANDMARK_COUNT, candidates=None):
+    """
+    Wählt Landmarken per Farthest-Point-Sampling über die Koordinaten (gut verteilt am Netzrand).
+    """
+    lats, lons = timetable['stop_lat'], timetable['stop_lon']
+    if candidates is None:
+        candidates = np.flatnonzero(~(np.isnan(lats) | np.isnan(lons)))
+    if len(candidates) == 0:
+        return []
+    # Start: Haltestelle am weitesten vom Schwerpunkt entfernt
+    center_lat, center_lon = lats[candidates].mean(), lons[candidates].mean()
+    min_dist = haversine(center_lat, center_lon, lats[candidates], lons[candidates])
+    landmarks = []
+    for _ in range(min(count, len(candidates))):
+        pick = int(candidates[int(np.argmax(min_dist))])
+        landmarks.append(pick)
+        pick_dist = haversine(lats[pick], lons[pick], lats[candidates], lons[candidates])
+        min_dist = pick_dist if len(landmarks) == 1 else np.minimum(min_dist, pick_dist)
+    return landmarks
+
+
+def build_goal_bounds(timetable, transfer_model=None, landmark_count=DEFAULT_LANDMARK_COUNT):
+    """
+    Berechnet die Daten für die zielgerichtete Suche:
+      - 'max_speed': maximale Netzgeschwindigkeit (m/s) für die geografische Schranke
+      - 'landmarks', 'from_landmark', 'to_landmark': ALT-Distanzen (Sekunden)
+    Die Schranken sind zulässig, d.h. die Suchergebnisse bleiben identisch.
+    """
+    n = len(timetable['stop_ids'])
+    sources, targets, weights = build_lower_bound_graph(timetable, transfer_model)
+    lats, lons = timetable['stop_lat'], timetable['stop_lon']
+
+    # Geografische Schranke: nur zulässig, wenn keine Kante schneller als max_speed ist.
+    # Kanten mit 0 Sekunden Fahrzeit (Minutenraster im GTFS) machen sie unbrauchbar -> dann nur ALT.
+    dist_m = np.nan_to_num(haversine(lats[sources], lons[sources], lats[targets], lons[targets]) * 1000.0)
+    moving = dist_m > 1.0
+    if np.any(moving & (weights <= 0)):
+        max_speed = None
+        print("Hinweis: Verbindungen ohne Fahrzeit gefunden, geografische Schranke deaktiviert (nur Landmarken)")
+    elif np.any(moving):
+        max_speed = float(np.max(dist_m[moving] / weights[moving]))
+    else:
+        max_speed = None
+
+    forward = _to_csr(n, sources, targets, weights)
+    backward = _to_csr(n, targets, sources, weights)
+    landmarks = select_landmarks(timetable, landmark_count)
+    from_landmark = np.array([_dijkstra(forward, l) for l in landmarks]).reshape(len(landmarks), n)
+    to_landmark = np.array([_dijkstra(backward, l) for l in landmarks]).reshape(len(landmarks), n)
+
+    print(f"Zielgerichtete Suche vorbereitet: {len(landmarks)} Landmarken, max. Geschwindigkeit {max_speed} m/s")
+    return {
+        'max_speed': max_speed,
+        'landmarks': landmarks,
+        'from_landmark': from_landmark,
+        'to_landmark': to_landmark,
+    }
+
+
+def lower_bounds_to(goal_bounds, timetable, target):
+    """
+    Untere Schranke (Sekunden) der Restfahrzeit von jeder Haltestelle zum Ziel, als Liste.
+    """
+    n = len(timetable['stop_ids'])
+    bound = np.zeros(n)
+    if goal_bounds['max_speed']:
+        lats, lons = timetable['stop_lat'], timetable['stop_lon']
+        dist_m = np.nan_to_num(haversine(lats, lons, lats[target], lons[target]) * 1000.0)
+        bound = np.maximum(bound, dist_m / goal_bounds['max_speed'])
+
+    # ALT: d(x,t) >= d(L,t) - d(L,x) und d(x,t) >= d(x,L) - d(t,L), nur mit endlichen Werten
+    with np.errstate(invalid='ignore'):
+        from_l = goal_bounds['from_landmark']
+        to_l = goal_bounds['to_landmark']
+        if len(from_l):
+            forward = from_l[:, [target]] - from_l
+            backward = to_l - to_l[:, [target]]
+            candidates = np.concatenate((forward, backward))
+            candidates[~np.isfinite(candidates)] = 0
+            bound = np.maximum(bound, candidates.max(axis=0))
+    # Ganze Sekunden abrunden, damit die Schranke sicher zulässig bleibt
+    return np.floor(bound).tolist()
+
+
+def benchmark_goal_directed(timetable, transfer_model, goal_bounds, queries=None, query_count=100, seed=0):
+    """
+    Vergleicht die Suche mit und ohne zielgerichtete Schranken (Laufzeit, Anzahl Label-Updates, Ergebnisse).
+    queries: Liste von (start_stop, end_stop, abfahrt_in_sekunden); sonst zufällige Anfragen.
+    """
+    from routing import plan_route_timed
+
+    if queries is None:
+        rng = random.Random(seed)
+        served = sorted(set(timetable['conn_from'].tolist()))
+        stop_ids = timetable['stop_ids']
+        queries = [(stop_ids[rng.choice(served)], stop_ids[rng.choice(served)], rng.randint(6 * 3600, 20 * 3600))
+                   for _ in range(query_count)]
+
+    results = {'plain': [0.0, 0], 'goal': [0.0, 0]}
+    mismatches = 0
+    for start, end, dep in queries:
+        outputs = {}
+        for mode, bounds in (('plain', None), ('goal', goal_bounds)):
+            stats = {}
+            t0 = time.perf_counter()
+            outputs[mode] = plan_route_timed(timetable, start, end, dep, transfer_model=transfer_model,
+                                             goal_bounds=bounds, stats=stats)
+            results[mode][0] += time.perf_counter() - t0
+            results[mode][1] += stats.get('label_updates', 0)
+        if outputs['plain'] != outputs['goal']:
+            mismatches += 1
+
+    count = max(len(queries), 1)
+    for mode, (seconds, updates) in results.items():
+        print(f"{mode:>5}: {seconds / count * 1000:.2f} ms/Anfrage, {updates / count:.0f} Label-Updates/Anfrage")
+    print(f"Abweichende Ergebnisse: {mismatches} von {len(queries)}")
+    return mismatches == 0
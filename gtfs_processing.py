@@ -1,6 +1,28 @@
+import os
+import pickle
+import numpy as np
 import pandas as pd
 import networkx as nx
-from utils import get_valid_service_ids
+from utils import get_valid_service_ids, time_to_seconds
+
+# Optionale GTFS-Dateien -> werden nur geladen, wenn sie im Feed vorhanden sind
+OPTIONAL_GTFS_FILES = {
+    'shapes': 'shapes.txt',
+    'transfers': 'transfers.txt',
+    'frequencies': 'frequencies.txt',
+}
+
+def load_optional_gtfs_file(gtfs_folder, filename):
+    """
+    Lädt eine optionale GTFS-Datei. Gibt None zurück, wenn die Datei nicht existiert.
+    """
+    path = f'{gtfs_folder}/{filename}'
+    if not os.path.exists(path):
+        return None
+    return pd.read_csv(path, encoding='utf-8-sig', low_memory=False)
+
+# Fallback, wenn weder stop_headsign noch trip_headsign vorhanden sind
+UNKNOWN_DIRECTION = "Fahrtrichtungsdaten konnten nicht geladen werden, bitte informieren Sie sich an den Aushangfahrplänen an den Haltestellen"
 
 # Lädt alle gtfs daten
 def load_gtfs_data(gtfs_folder='gtfs'):
@@ -17,6 +39,11 @@ def load_gtfs_data(gtfs_folder='gtfs'):
             gtfs['calendar'][day] = gtfs['calendar'][day].astype(int)
         gtfs['calendar']['start_date'] = pd.to_datetime(gtfs['calendar']['start_date'], format='%Y%m%d').dt.date
         gtfs['calendar']['end_date'] = pd.to_datetime(gtfs['calendar']['end_date'], format='%Y%m%d').dt.date
+        # Optionale Dateien (z.B. shapes.txt für die Streckengeometrie)
+        for key, filename in OPTIONAL_GTFS_FILES.items():
+            df = load_optional_gtfs_file(gtfs_folder, filename)
+            if df is not None:
+                gtfs[key] = df
     except FileNotFoundError as e:
         print(f'Fehler beim Laden der GTFS-Daten: {e}')
         gtfs = {}
@@ -63,6 +90,18 @@ def parse_time_with_correction(time_series):
         return [None] * len(corrected_times)
 
 
+def gtfs_time_to_seconds(time_series):
+    """
+    Wandelt GTFS-Zeiten ('HH:MM:SS', auch >= 24:00:00) vektorisiert in Sekunden seit Mitternacht des Betriebstags um.
+    Anders als parse_time_with_correction bleibt 25:15:00 als 90900 Sekunden erhalten, damit die Reihenfolge stimmt.
+    Ungültige Einträge werden zu -1.
+    """
+    parts = pd.Series(time_series).astype(str).str.strip().str.extract(r'^(\d{1,2}):(\d{2}):(\d{2})$')
+    parts = parts.apply(pd.to_numeric, errors='coerce')
+    seconds = parts[0] * 3600 + parts[1] * 60 + parts[2]
+    return seconds.fillna(-1).astype('int64').to_numpy()
+
+
 # Netzwerk aufbau (wichtigste Funktion), dient dazu das im hintergrund stehende ÖPNV-Netzwerk aufzubauen
 def build_transit_graph(gtfs, routing_time=None):
     """
@@ -87,72 +126,306 @@ def build_transit_graph(gtfs, routing_time=None):
     # Filtere Trips nach gültigen service_ids für das Routing-Datum
     # Es werden nur Fahrten (Trips) und Stopzeiten berücksichtigt die am gewünschten Tag verkehren
     # get_valid_service_ids muss hierfür korrekt implementiert sein -> könnten sonst zu viel oder zu wenig Fahrten übrig bleiben
+    # Gefilterte Tabellen bleiben lokal -> das gtfs-dict des Aufrufers wird nicht verändert
+    trips, stop_times = _routing_tables(gtfs, routing_time)
+
+    edges = _unique_edges(_trip_edges(trips, stop_times, gtfs['routes'], valid_stops))
+    _add_compact_edges(G, edges)
+    G.graph['trip_index'] = build_trip_index(trips, stop_times, gtfs['routes'])
+    # ==> Kantenattribute: 'trip' (Code in G.graph['trip_ids']) für die Umstiegslogik und 'edge' (Index in die
+    # Arrays edge_dep/edge_arr/edge_route/edge_headsign). Namen werden erst bei der Ausgabe aufgelöst.
+
+    # Kurze Ausgabe um zu erkennen wie viele Knoten und Kanten erstellt worden sind
+    # Dies sollten theoretisch >1000 sein
+    print(f"Transit-Graph erstellt: {G.number_of_nodes()} Knoten, {G.number_of_edges()} Kanten")
+    return G    #Gibt dann schlussendlich den Graphen zurück
+
+
+def _routing_tables(gtfs, routing_time):
+    """
+    trips und stop_times, ggf. gefiltert auf die am Tag von routing_time verkehrenden Fahrten.
+    """
+    trips = gtfs['trips']
+    stop_times = gtfs['stop_times']
     if routing_time is not None:
         valid_services = get_valid_service_ids(gtfs['calendar'], routing_time.date())
-        gtfs['trips'] = gtfs['trips'][gtfs['trips']['service_id'].isin(valid_services)]
+        trips = trips[trips['service_id'].isin(valid_services)]
         #stop_times direkt mitfiltern wegen Speicher
-        gtfs['stop_times'] = gtfs['stop_times'][gtfs['stop_times']['trip_id'].isin(gtfs['trips']['trip_id'])]
+        stop_times = stop_times[stop_times['trip_id'].isin(trips['trip_id'])]
+    return trips, stop_times
+
 
+def _trip_edges(trips, stop_times, routes, valid_stops):
+    """
+    Alle Fahrtabschnitte (aufeinanderfolgende Halte einer Fahrt, beide im Netz) als DataFrame mit
+    u, v, trip_id, dep, arr, route_name, headsign. Zeilen sind nach trip_id und stop_sequence sortiert.
+    Jede Fahrt wird für sich betrachtet -> für eine Teilmenge der Fahrten entstehen genau deren Abschnitte.
+    """
     # Merge stop_times mit trips und routes -> Die Stopzeiten werden mit den Fahrten und Routen zusammengeführt, sodass alle nötigen Infos in einer Tabelle stehen
-    merged = gtfs["stop_times"].merge(gtfs["trips"], on="trip_id")
-    merged = merged.merge(gtfs["routes"], on="route_id")
+    merged = stop_times.merge(trips, on="trip_id")
+    merged = merged.merge(routes, on="route_id")
     
-    # Trips filtern: Start und Ende müssen im Karlsruher Netz sein
-    trip_start_end = merged.groupby("trip_id")["stop_id"].agg(["first", "last"])
-    valid_trips = trip_start_end[
-        (trip_start_end["first"].isin(valid_stops)) & 
-        (trip_start_end["last"].isin(valid_stops))
-    ].index
-    # Mögliche Fehlerquelle: Wenn ein Trip außerhalb des Netzes startet/endet, wird er ausgeschlossen -> eig. gewollt, kann aber zu Lücken führen
-
-    #valid_trip_ids = gtfs['trips'][gtfs['trips']['service_id'].isin(valid_services)]['trip_id']
+    # Trips filtern: mindestens zwei Halte müssen im Netz liegen (stops.txt, ggf. mehrere zusammengeführte Feeds)
+    # Früher mussten Start und Ende im Netz liegen -> Regionalzüge wurden am Netzrand komplett verworfen.
+    # Jetzt bleibt der Teil der Fahrt im Netz erhalten, Kanten zu unbekannten Halten werden unten übersprungen.
+    known_stop_counts = merged[merged["stop_id"].isin(valid_stops)].groupby("trip_id").size()
+    valid_trips = known_stop_counts[known_stop_counts >= 2].index
 
     merged = merged[merged["trip_id"].isin(valid_trips)]
     # Es verbleiben nur die Zeilen mit gültigen Trips
 
-    # Zeitkonvertierung mit Behandlung von 24:xx:xx Zeiten 
-    print("Konvertiere Ankunftszeiten...")
-    merged["arrival_time"] = parse_time_with_correction(merged["arrival_time"])
-    print("Konvertiere Abfahrtszeiten...")
-    merged["departure_time"] = parse_time_with_correction(merged["departure_time"])
-    
-    # Entferne Zeilen mit ungültigen Zeiten
-    merged = merged.dropna(subset=['arrival_time', 'departure_time'])
-    
-    # Kanten zwischen aufeinanderfolgenden Stopps eines Trips
-    for trip_id, group in merged.groupby("trip_id"):
-        group['stop_sequence'] = pd.to_numeric(group['stop_sequence'], errors='coerce')
-        group = group.dropna(subset=['stop_sequence'])
-        group = group.sort_values("stop_sequence")
-        
-        for i in range(1, len(group)):
-            prev = group.iloc[i-1]
-            curr = group.iloc[i]
-            
-            if prev.stop_id in valid_stops and curr.stop_id in valid_stops:
-                
-                route_name = curr.get('route_long_name') or curr.get('route_short_name') or "Unbekannt"                
-                #if pd.isna(route_name) or not route_name:
-                #    route_name = "Linienrichtung nicht gefunden, bitte Aushangfahrplan beachten"               
-                
-                direction = curr.get('stop_headsign') or curr.get('trip_headsign') or "Unbekannt"
-                if pd.isna(direction) or not direction:
-                    direction = "Fahrtrichtungsdaten konnten nicht geladen werden, bitte informieren Sie sich an den Aushangfahrplänen an den Haltestellen"
-
-                G.add_edge(
-                    prev.stop_id,
-                    curr.stop_id,
-                    departure_time=prev.departure_time,
-                    arrival_time=curr.arrival_time,
-                    route_name=route_name,
-                    direction=direction,
-                    trip_id=trip_id
-                )
-    # ==> Für jede Fahrt (Trip) werden die Stopps nach Reihenfolge sortiert
-    # Zwischen jedem aufeinanderfolgenden Stopp wird eine Kante im Graphen angelegt -> mit relevanten Fahrplandaten als Attributen
-    # Attribute werden in der klammer definiert G.add_edge(...)
+    # Zeiten als Sekunden seit Mitternacht des Betriebstags (24:xx:xx bleibt > 86400), ungültige Zeiten entfernen
+    merged = merged.assign(
+        arr=gtfs_time_to_seconds(merged['arrival_time']),
+        dep=gtfs_time_to_seconds(merged['departure_time']),
+        stop_sequence=pd.to_numeric(merged['stop_sequence'], errors='coerce'),
+    )
+    merged = merged[(merged['arr'] >= 0) & (merged['dep'] >= 0)].dropna(subset=['stop_sequence'])
+    merged = merged.sort_values(['trip_id', 'stop_sequence'], kind='stable')
 
-    # Kurze Ausgabe um zu erkennen wie viele Knoten und Kanten erstellt worden sind
-    # Dies sollten theoretisch >1000 sein
-    print(f"Transit-Graph erstellt: {G.number_of_nodes()} Knoten, {G.number_of_edges()} Kanten")
-    return G    #Gibt dann schlussendlich den Graphen zurück
\ No newline at end of file
+    # Kanten zwischen aufeinanderfolgenden Stopps eines Trips (beide Halte im Netz)
+    stop_ids = merged['stop_id'].to_numpy()
+    trip_column = merged['trip_id'].to_numpy()
+    in_network = merged['stop_id'].isin(valid_stops).to_numpy()
+    rows = np.flatnonzero((trip_column[1:] == trip_column[:-1]) & in_network[1:] & in_network[:-1])
+
+    # Linienname und Richtung je Kante (Werte der Ziel-Haltestelle wie bisher)
+    arrivals = merged.iloc[rows + 1]
+    return pd.DataFrame({
+        'u': stop_ids[rows],
+        'v': stop_ids[rows + 1],
+        'trip_id': trip_column[rows],
+        'dep': merged['dep'].to_numpy(dtype=np.int32)[rows],
+        'arr': merged['arr'].to_numpy(dtype=np.int32)[rows + 1],
+        'route_name': _first_text(arrivals, ['route_long_name', 'route_short_name'], "Unbekannt"),
+        'headsign': _first_text(arrivals, ['stop_headsign', 'trip_headsign'], UNKNOWN_DIRECTION),
+    })
+
+
+def _unique_edges(edges):
+    """
+    Eine Kante je Haltestellenpaar: die letzte Fahrt (nach trip_id) gewinnt, die Reihenfolge
+    der Nachbarn im Graphen ergibt sich aus dem ersten Auftreten (wie früher bei add_edge).
+    """
+    pairs = edges[['u', 'v']]
+    order = np.flatnonzero(~pairs.duplicated(keep='first').to_numpy())
+    last_rows = np.flatnonzero(~pairs.duplicated(keep='last').to_numpy())
+    chosen = last_rows[pd.MultiIndex.from_frame(pairs.iloc[last_rows]).get_indexer(
+        pd.MultiIndex.from_frame(pairs.iloc[order]))]
+    return edges.iloc[chosen].reset_index(drop=True)
+
+
+def _add_compact_edges(G, edges):
+    """
+    Fügt die Kanten (DataFrame wie aus _unique_edges, in Einfügereihenfolge) im kompakten Format ein.
+    """
+    # Strings nur einmal speichern (Codes je Kante), Zeiten als int32-Arrays
+    trip_codes, trip_ids = pd.factorize(edges['trip_id'])
+    route_codes, route_names = pd.factorize(edges['route_name'])
+    headsign_codes, headsigns = pd.factorize(edges['headsign'])
+    G.graph.update(
+        trip_ids=list(trip_ids),
+        route_names=[str(x) for x in route_names],
+        headsigns=[str(x) for x in headsigns],
+        edge_dep=edges['dep'].to_numpy(dtype=np.int32),
+        edge_arr=edges['arr'].to_numpy(dtype=np.int32),
+        edge_route=route_codes.astype(np.int32),
+        edge_headsign=headsign_codes.astype(np.int32),
+    )
+    G.add_edges_from((u, v, {'trip': int(trip), 'edge': edge})
+                     for edge, (u, v, trip) in enumerate(zip(edges['u'].to_numpy(), edges['v'].to_numpy(),
+                                                             trip_codes.tolist())))
+
+
+def _first_text(df, columns, default):
+    """
+    Erster nicht-leere Text aus den Spalten (in dieser Reihenfolge), sonst default.
+    """
+    result = pd.Series(default, index=df.index, dtype=object)
+    for column in reversed(columns):
+        if column in df.columns:
+            result = df[column].where(df[column].notna() & (df[column].astype(str) != ''), result)
+    return result.astype(str).to_numpy()
+
+
+def is_compact_graph(G):
+    """
+    True, wenn der Graph das kompakte Kantenformat hat (Codes & int-Arrays statt Strings und time-Objekten).
+    """
+    return 'edge_dep' in G.graph
+
+
+def compact_transit_graph(G):
+    """
+    Wandelt einen Graphen im alten Format (graph.pkl mit route_name/direction/trip_id und time-Objekten
+    je Kante) in das kompakte Format um. Die Reihenfolge der Knoten und Nachbarn bleibt erhalten.
+    """
+    if is_compact_graph(G):
+        return G
+    trip_codes, route_codes, headsign_codes = {}, {}, {}
+    edge_dep, edge_arr, edge_route, edge_headsign = [], [], [], []
+    for edge, (_, _, data) in enumerate(G.edges(data=True)):
+        trip = trip_codes.setdefault(data.get('trip_id'), len(trip_codes))
+        edge_route.append(route_codes.setdefault(str(data.get('route_name', 'Unbekannt')), len(route_codes)))
+        edge_headsign.append(headsign_codes.setdefault(str(data.get('direction', UNKNOWN_DIRECTION)), len(headsign_codes)))
+        departure, arrival = data.get('departure_time'), data.get('arrival_time')
+        edge_dep.append(time_to_seconds(departure) if departure is not None else -1)
+        edge_arr.append(time_to_seconds(arrival) if arrival is not None else -1)
+        data.clear()
+        data.update(trip=trip, edge=edge)
+    G.graph.update(
+        trip_ids=list(trip_codes),
+        route_names=list(route_codes),
+        headsigns=list(headsign_codes),
+        edge_dep=np.array(edge_dep, dtype=np.int32),
+        edge_arr=np.array(edge_arr, dtype=np.int32),
+        edge_route=np.array(edge_route, dtype=np.int32),
+        edge_headsign=np.array(edge_headsign, dtype=np.int32),
+    )
+    print(f"Graph in kompaktes Format umgewandelt: {G.number_of_edges()} Kanten, {len(trip_codes)} Fahrten")
+    return G
+
+
+def build_trip_index(trips, stop_times, routes):
+    """
+    Fahrtenindex für den inkrementellen Neubau: je Fahrt ein Fingerabdruck (Hash über alle Daten, die in
+    die Kanten eingehen) und die angefahrenen Haltestellen (CSR, Reihenfolge egal).
+    Wird mit dem Graphen gespeichert (G.graph['trip_index']), siehe update_transit_graph.
+    """
+    stop_columns = [c for c in ['trip_id', 'stop_id', 'stop_sequence', 'arrival_time', 'departure_time', 'stop_headsign']
+                    if c in stop_times.columns]
+    stop_times = stop_times[stop_columns].dropna(subset=['trip_id', 'stop_id'])
+    trip_codes, trip_ids = pd.factorize(stop_times['trip_id'])
+    # Summe der Zeilen-Hashes je Fahrt (uint64, Überlauf gewollt) -> unabhängig von der Zeilenreihenfolge
+    fingerprints = np.zeros(len(trip_ids), dtype=np.uint64)
+    np.add.at(fingerprints, trip_codes, pd.util.hash_pandas_object(stop_times, index=False).to_numpy())
+
+    # Fahrt-Daten (Linie, Ziel) mit einrechnen
+    trip_info = trips.drop_duplicates('trip_id').merge(routes.drop_duplicates('route_id'), on='route_id', how='left')
+    trip_columns = [c for c in ['trip_id', 'route_id', 'trip_headsign', 'route_long_name', 'route_short_name']
+                    if c in trip_info.columns]
+    trip_hash = pd.util.hash_pandas_object(trip_info[trip_columns], index=False).to_numpy()
+    rows = pd.Index(trip_info['trip_id']).get_indexer(trip_ids)
+    fingerprints[rows >= 0] += trip_hash[rows[rows >= 0]]
+
+    stop_codes, stop_ids = pd.factorize(stop_times['stop_id'])
+    order = np.argsort(trip_codes, kind='stable')
+    offsets = np.zeros(len(trip_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(trip_codes, minlength=len(trip_ids)), out=offsets[1:])
+    return {
+        'trip_ids': list(trip_ids),
+        'fingerprints': fingerprints,
+        'stop_ids': list(stop_ids),
+        'stop_offsets': offsets,
+        'stops': stop_codes[order].astype(np.int32),
+    }
+
+
+def _trip_stops(trip_index, positions):
+    # Menge aller Haltestellen, die die Fahrten an den Positionen positions anfahren
+    offsets = trip_index['stop_offsets']
+    stops = trip_index['stops']
+    stop_ids = trip_index['stop_ids']
+    result = set()
+    for i in positions:
+        result.update(stop_ids[s] for s in stops[offsets[i]:offsets[i + 1]].tolist())
+    return result
+
+
+def _trips_at(trip_index, stop_set):
+    # Positionen der Fahrten, die mindestens eine Haltestelle aus stop_set anfahren
+    hit = np.array([stop_id in stop_set for stop_id in trip_index['stop_ids']], dtype=bool)
+    visits = hit[trip_index['stops']]
+    trip_of_visit = np.repeat(np.arange(len(trip_index['trip_ids'])), np.diff(trip_index['stop_offsets']))
+    return np.unique(trip_of_visit[visits]).tolist()
+
+
+def update_transit_graph(G, gtfs, routing_time=None):
+    """
+    Inkrementeller Neubau nach einem Feed-Update: vergleicht die Fingerabdrücke der Fahrten mit dem
+    Fahrtenindex des gespeicherten Graphen und baut nur die Kanten neu, die an Haltestellen geänderter,
+    neuer oder entfallener Fahrten beginnen. Dafür werden nur die Fahrten neu verarbeitet, die dort halten.
+    Das Ergebnis ist ein NEUER Graph (G bleibt unverändert, kann also bis zum Austausch weiter genutzt werden),
+    Nachbarn und Kantendaten entsprechen einem vollständigen build_transit_graph.
+    Ohne Änderungen wird G selbst zurückgegeben, ohne Fahrtenindex (ältere Caches) wird komplett neu gebaut.
+    """
+    required_keys = ['stops', 'routes', 'trips', 'stop_times']
+    for key in required_keys:
+        if key not in gtfs or gtfs[key].empty:
+            print(f"Fehler: GTFS-Daten unvollständig. '{key}' fehlt oder ist leer. Gespeicherter Graph bleibt unverändert.")
+            return G
+    old_index = G.graph.get('trip_index')
+    if old_index is None or not is_compact_graph(G):
+        print("Gespeicherter Graph hat keinen Fahrtenindex -> vollständiger Neubau")
+        return build_transit_graph(gtfs, routing_time)
+
+    trips, stop_times = _routing_tables(gtfs, routing_time)
+    new_index = build_trip_index(trips, stop_times, gtfs['routes'])
+
+    # Geänderte, neue und entfallene Fahrten
+    old_fingerprints = dict(zip(old_index['trip_ids'], old_index['fingerprints'].tolist()))
+    new_fingerprints = dict(zip(new_index['trip_ids'], new_index['fingerprints'].tolist()))
+    changed_new = [i for i, trip_id in enumerate(new_index['trip_ids'])
+                   if old_fingerprints.get(trip_id) != new_fingerprints[trip_id]]
+    changed_old = [i for i, trip_id in enumerate(old_index['trip_ids'])
+                   if new_fingerprints.get(trip_id) != old_fingerprints[trip_id]]
+    removed = len(old_fingerprints.keys() - new_fingerprints.keys())
+
+    # Neue oder entfallene Haltestellen ändern die Kanten aller Fahrten, die dort halten
+    stops = gtfs['stops']
+    nodes = list(dict.fromkeys(stops['stop_id']))
+    names = dict(zip(stops['stop_id'], stops['stop_name']))
+    valid_stops = set(nodes)
+    stop_changes = valid_stops.symmetric_difference(G.nodes)
+    if stop_changes:
+        changed_new = sorted(set(changed_new).union(_trips_at(new_index, stop_changes)))
+        changed_old = sorted(set(changed_old).union(_trips_at(old_index, stop_changes)))
+    if not changed_new and not changed_old and not stop_changes and \
+            all(G.nodes[stop_id].get('name') == name for stop_id, name in names.items()):
+        print("Transit-Graph ist aktuell, keine geänderten Fahrten")
+        return G
+
+    # Betroffene Abfahrts-Haltestellen: alle Halte der geänderten Fahrten (alte und neue Fassung)
+    affected = (_trip_stops(old_index, changed_old) | _trip_stops(new_index, changed_new)) & valid_stops
+    # Alle Fahrten, die dort halten, neu verarbeiten -> vollständige Nachbarlisten dieser Haltestellen
+    subset = stop_times['trip_id'][stop_times['stop_id'].isin(affected)].unique()
+    edges = _trip_edges(trips[trips['trip_id'].isin(subset)], stop_times[stop_times['trip_id'].isin(subset)],
+                        gtfs['routes'], valid_stops)
+    edges = _unique_edges(edges[edges['u'].isin(affected)].reset_index(drop=True))
+    rebuilt = {}
+    for row in edges.itertuples(index=False):
+        rebuilt.setdefault(row.u, []).append(tuple(row))
+
+    # Neuer Graph: betroffene Haltestellen neu, alle anderen Kanten unverändert aus G übernehmen
+    graph = G.graph
+    rows = []
+    for stop_id in nodes:
+        if stop_id in affected:
+            rows.extend(rebuilt.get(stop_id, ()))
+        elif stop_id in G:
+            for next_stop, data in G[stop_id].items():
+                if next_stop in valid_stops:
+                    edge = data['edge']
+                    rows.append((stop_id, next_stop, graph['trip_ids'][data['trip']], graph['edge_dep'][edge],
+                                 graph['edge_arr'][edge], graph['route_names'][graph['edge_route'][edge]],
+                                 graph['headsigns'][graph['edge_headsign'][edge]]))
+    updated = nx.DiGraph()
+    updated.add_nodes_from((stop_id, {'name': names[stop_id]}) for stop_id in nodes)
+    _add_compact_edges(updated, pd.DataFrame(rows, columns=edges.columns))
+    updated.graph['trip_index'] = new_index
+    print(f"Transit-Graph aktualisiert: {len(changed_new)} neue/geänderte und "
+          f"{removed} entfallene Fahrten, "
+          f"{len(affected)} Haltestellen neu verknüpft ({len(subset)} Fahrten neu verarbeitet), "
+          f"{updated.number_of_edges()} Kanten")
+    return updated
+
+
+def save_transit_graph(G, filename='graph.pkl'):
+    """
+    Speichert den Graphen atomar: erst in eine temporäre Datei, dann per os.replace austauschen.
+    Andere Prozesse lesen so immer entweder den alten oder den vollständigen neuen Graphen.
+    """
+    temp_name = filename + '.tmp'
+    with open(temp_name, 'wb') as f:
+        pickle.dump(G, f)
+    os.replace(temp_name, filename)
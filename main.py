@@ -2,16 +2,22 @@ import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
 from threading import Thread
 import sys
-import io
 import gc
-from contextlib import redirect_stdout, redirect_stderr
 
 # Import der bestehenden Module
-from gtfs_processing import load_gtfs_data, build_transit_graph
-from routing import plan_route_with_transfers_ignore_time
-from utils import is_stop_name, geocode_address, choose_stop, load_address_data, print_route_grouped
-from auto_choose import auto_choose_stop_direction_aware
-from visualize_route import visualize_route
+from gtfs_processing import build_transit_graph, is_compact_graph, compact_transit_graph, update_transit_graph, save_transit_graph
+from feed_merge import load_merged_gtfs_data
+from utils import load_address_data
+from search_jobs import SearchScheduler, SearchCancelled
+from transfers import build_transfer_model
+from network_context import (build_network_context, route_query, route_alternatives, alternative_label,
+                             render_query_result, render_route_map)
+from autocomplete import build_autocomplete_index, suggest
+from access_stops import load_access_table
+
+# Autovervollständigung: Wartezeit nach dem letzten Tastendruck, bevor gesucht wird
+AUTOCOMPLETE_DELAY_MS = 150
+AUTOCOMPLETE_TIMEOUT = 2
 
 class OPNVRouterGUI:
     def __init__(self, root):
@@ -24,6 +30,19 @@ class OPNVRouterGUI:
         self.transit_graph = None
         self.address_df = None
         self.current_route = None
+        # Ergebnisse der letzten Suche als (Bezeichnung, Text, itinerary), bei Alternativen mehrere
+        self.current_results = []
+        self.transfer_model = None
+        # Unveränderlicher Netz-Kontext, den alle Suchaufträge nur lesen
+        self.context = None
+        # Suchaufträge: neue Suche ersetzt die vorherige, Abbruch über Token im Router
+        self.search_scheduler = SearchScheduler()
+        # Vorschläge beim Tippen: eigener Worker, neue Eingabe ersetzt die vorherige Anfrage
+        self.autocomplete_index = None
+        self.suggest_scheduler = SearchScheduler(max_workers=1, timeout=AUTOCOMPLETE_TIMEOUT)
+        self._suggest_pending = {}      # Entry -> after-ID (Entprellung)
+        self._suggest_entry = None      # Entry, zu dem die Vorschlagsliste gerade gehört
+        self._suggestions = []
         
         self.setup_ui()
         self.load_data()
@@ -52,6 +71,11 @@ class OPNVRouterGUI:
         self.end_entry = ttk.Entry(input_frame, width=50, font=('Arial', 10))
         self.end_entry.grid(row=1, column=1, sticky=(tk.W, tk.E), pady=5, padx=(10, 0))
         
+        # Alternativen: mehrere verschiedene Routen aus einer erweiterten Suche
+        self.alternatives_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(input_frame, text="Alternativen anzeigen", variable=self.alternatives_var).grid(
+            row=3, column=1, sticky=tk.W)
+        
         # Buttons
         button_frame = ttk.Frame(input_frame)
         button_frame.grid(row=2, column=0, columnspan=2, pady=15)
@@ -60,6 +84,10 @@ class OPNVRouterGUI:
                                        command=self.search_route, width=15)
         self.search_button.pack(side=tk.LEFT, padx=(0, 10))
         
+        self.cancel_button = ttk.Button(button_frame, text="Abbrechen", 
+                                       command=self.cancel_search, state=tk.DISABLED, width=15)
+        self.cancel_button.pack(side=tk.LEFT, padx=(0, 10))
+        
         self.clear_button = ttk.Button(button_frame, text="Leeren", 
                                       command=self.clear_inputs, width=15)
         self.clear_button.pack(side=tk.LEFT, padx=(0, 10))
@@ -72,10 +100,16 @@ class OPNVRouterGUI:
         results_frame = ttk.LabelFrame(main_frame, text="Ergebnisse", padding="15")
         results_frame.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S))
         
+        # Liste der Alternativen (nur sichtbar, wenn es mehrere gibt)
+        self.alternative_list = tk.Listbox(results_frame, height=4, font=('Arial', 10), exportselection=False)
+        self.alternative_list.grid(row=0, column=0, sticky=(tk.W, tk.E), pady=(0, 10))
+        self.alternative_list.bind('<<ListboxSelect>>', lambda e: self._show_selected_alternative())
+        self.alternative_list.grid_remove()
+        
         # Results text area
         self.results_text = scrolledtext.ScrolledText(results_frame, height=20, width=80, 
                                                      font=('Consolas', 10))
-        self.results_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.results_text.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         
         # Progress and status section
         progress_frame = ttk.Frame(main_frame)
@@ -94,12 +128,24 @@ class OPNVRouterGUI:
         main_frame.rowconfigure(2, weight=1)
         input_frame.columnconfigure(1, weight=1)
         results_frame.columnconfigure(0, weight=1)
-        results_frame.rowconfigure(0, weight=1)
+        results_frame.rowconfigure(1, weight=1)
         progress_frame.columnconfigure(0, weight=1)
         
         # Bind Enter key to search
-        self.start_entry.bind('<Return>', lambda e: self.search_route())
-        self.end_entry.bind('<Return>', lambda e: self.search_route())
+        self.start_entry.bind('<Return>', lambda e: self._search_from_entry())
+        self.end_entry.bind('<Return>', lambda e: self._search_from_entry())
+        
+        # Vorschlagsliste (liegt über dem Fenster, wird unter dem aktiven Eingabefeld platziert)
+        self.suggestion_list = tk.Listbox(self.root, height=8, font=('Arial', 10), activestyle='dotbox')
+        self.suggestion_list.bind('<Return>', lambda e: self._apply_suggestion())
+        self.suggestion_list.bind('<ButtonRelease-1>', lambda e: self._apply_suggestion())
+        self.suggestion_list.bind('<Escape>', lambda e: self._hide_suggestions(focus_entry=True))
+        self.suggestion_list.bind('<FocusOut>', lambda e: self.root.after(100, self._hide_if_unfocused))
+        for entry in (self.start_entry, self.end_entry):
+            entry.bind('<KeyRelease>', lambda e, entry=entry: self._on_entry_key(entry, e))
+            entry.bind('<Down>', lambda e, entry=entry: self._focus_suggestions(entry))
+            entry.bind('<Escape>', lambda e: self._hide_suggestions())
+            entry.bind('<FocusOut>', lambda e: self.root.after(100, self._hide_if_unfocused))
         
     def load_data(self):
         # Lade Daten in separatem Thread
@@ -115,9 +161,9 @@ class OPNVRouterGUI:
             self.root.after(0, lambda: self.status_label.config(text="Lade Adressdaten..."))
             self.address_df = load_address_data()
             
-            # GTFS-Daten laden
+            # GTFS-Daten laden (gtfs/ plus ggf. weitere Feeds aus gtfs_feeds/, parallel)
             self.root.after(0, lambda: self.status_label.config(text="Lade GTFS-Daten..."))
-            self.gtfs = load_gtfs_data()
+            self.gtfs = load_merged_gtfs_data()
             
             # Transit-Graph laden/erstellen
             self.root.after(0, lambda: self.status_label.config(text="Erstelle Transit-Graph..."))
@@ -126,9 +172,32 @@ class OPNVRouterGUI:
                 if self.transit_graph is None:
                     self.transit_graph = build_transit_graph(self.gtfs)
                     self.save_transit_graph(self.transit_graph)
+                elif not is_compact_graph(self.transit_graph):
+                    # Alter Cache (Strings & time-Objekte je Kante) -> einmal umwandeln und kleiner neu speichern
+                    self.transit_graph = compact_transit_graph(self.transit_graph)
+                    self.save_transit_graph(self.transit_graph)
+                else:
+                    # Feed-Update: nur geänderte Fahrten neu verarbeiten, neuer Graph ersetzt den Cache atomar
+                    updated = update_transit_graph(self.transit_graph, self.gtfs)
+                    if updated is not self.transit_graph:
+                        self.transit_graph = updated
+                        self.save_transit_graph(updated)
             except Exception as e:
                 self.transit_graph = build_transit_graph(self.gtfs)
             
+            # Umstiegsmodell (transfers.txt, Stationen, Fußwege im Umkreis)
+            self.root.after(0, lambda: self.status_label.config(text="Erstelle Umstiegsmodell..."))
+            self.transfer_model = build_transfer_model(self.gtfs['stops'], self.gtfs.get('transfers'))
+            
+            # Kontext inkl. Indizes für die Kartenansicht (Koordinaten & Streckenverlauf aus shapes.txt)
+            # Vorberechnete Zugangshaltestellen je Adresse (optional, siehe access_stops.py)
+            access_table = load_access_table()
+            self.context = build_network_context(self.gtfs, self.transit_graph, self.address_df, self.transfer_model,
+                                                 access_table)
+            
+            # Index für die Vorschläge beim Tippen (Haltestellen & Adressen)
+            self.autocomplete_index = build_autocomplete_index(self.gtfs['stops'], self.address_df)
+            
             gc.collect()
             
             self.root.after(0, self._data_loaded)
@@ -147,8 +216,77 @@ class OPNVRouterGUI:
         self.status_label.config(text="Fehler beim Laden")
         messagebox.showerror("Fehler", error_msg)
         
+    def _on_entry_key(self, entry, event):
+        if event.keysym in ('Return', 'Escape', 'Down', 'Up', 'Tab', 'Left', 'Right'):
+            return
+        # Entprellen: erst suchen, wenn eine Weile nicht getippt wurde
+        pending = self._suggest_pending.pop(entry, None)
+        if pending is not None:
+            self.root.after_cancel(pending)
+        self._suggest_pending[entry] = self.root.after(AUTOCOMPLETE_DELAY_MS, self._request_suggestions, entry)
+        
+    def _request_suggestions(self, entry):
+        self._suggest_pending.pop(entry, None)
+        text = entry.get().strip()
+        if self.autocomplete_index is None or not text:
+            self._hide_suggestions()
+            return
+        # Suche im Worker-Thread, die Tk-Schleife blockiert nie
+        self.suggest_scheduler.submit(
+            suggest, self.autocomplete_index, text,
+            on_done=lambda result, error: self.root.after(0, self._show_suggestions, entry, text, result, error))
+        
+    def _show_suggestions(self, entry, text, suggestions, error):
+        # Veraltete Ergebnisse (Eingabe hat sich inzwischen geändert) verwerfen
+        if error is not None or entry.get().strip() != text or self.root.focus_get() is not entry:
+            return
+        if not suggestions:
+            self._hide_suggestions()
+            return
+        self.suggestion_list.delete(0, tk.END)
+        for name, kind in suggestions:
+            self.suggestion_list.insert(tk.END, f"{name}  [{kind}]")
+        self._suggestions = [name for name, _ in suggestions]
+        self._suggest_entry = entry
+        self.suggestion_list.config(height=len(suggestions))
+        self.suggestion_list.place(in_=entry, relx=0, rely=1, relwidth=1)
+        self.suggestion_list.lift()
+        
+    def _focus_suggestions(self, entry):
+        if self._suggest_entry is entry and self.suggestion_list.winfo_ismapped():
+            self.suggestion_list.focus_set()
+            self.suggestion_list.selection_clear(0, tk.END)
+            self.suggestion_list.selection_set(0)
+            self.suggestion_list.activate(0)
+        return 'break'
+        
+    def _apply_suggestion(self):
+        selection = self.suggestion_list.curselection()
+        entry = self._suggest_entry
+        if not selection or entry is None:
+            return
+        entry.delete(0, tk.END)
+        entry.insert(0, self._suggestions[selection[0]])
+        self._hide_suggestions(focus_entry=True)
+        
+    def _hide_suggestions(self, focus_entry=False):
+        entry = self._suggest_entry
+        self.suggestion_list.place_forget()
+        self._suggest_entry = None
+        if focus_entry and entry is not None:
+            entry.focus_set()
+            entry.icursor(tk.END)
+            
+    def _hide_if_unfocused(self):
+        if self.root.focus_get() not in (self.suggestion_list, self._suggest_entry):
+            self._hide_suggestions()
+        
+    def _search_from_entry(self):
+        self._hide_suggestions()
+        self.search_route()
+        
     def search_route(self):
-        if not self.gtfs or not self.transit_graph:
+        if self.context is None:
             messagebox.showwarning("Daten nicht geladen", "Bitte warten Sie, bis die Daten geladen sind.")
             return
             
@@ -159,73 +297,79 @@ class OPNVRouterGUI:
             messagebox.showwarning("Eingabe fehlt", "Bitte geben Sie Start und Ziel ein.")
             return
         
-        # Starte Suche in Hintergrund-Thread
-        self.search_button.config(state=tk.DISABLED)
+        # Suchbutton bleibt aktiv: eine neue Suche ersetzt die laufende
         self.show_map_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
         self.progress.start()
         self.status_label.config(text="Suche Route...")
         
         # Lösche vorherige Ergebnisse
         self.results_text.delete(1.0, tk.END)
+        self._set_alternatives([])
         
-        # Starte Suche in separatem Thread
-        thread = Thread(target=self._search_route_thread, args=(start, end))
-        thread.daemon = True
-        thread.start()
+        # Starte Suche im Worker-Pool (ältere Suchen werden abgebrochen)
+        self.search_scheduler.submit(
+            self._search_route_job, start, end, self.alternatives_var.get(),
+            on_done=lambda result, error: self.root.after(0, self._search_finished, result, error))
         
-    def _search_route_thread(self, start, end):
-        try:
-            # Capture stdout to redirect print statements
-            output_buffer = io.StringIO()
-            
-            with redirect_stdout(output_buffer), redirect_stderr(output_buffer):
-                # Bestimme Start- und Zielhaltestellen
-                if is_stop_name(start, self.gtfs['stops']) and is_stop_name(end, self.gtfs['stops']):
-                    start_stop, end_stop, itinerary = auto_choose_stop_direction_aware(
-                        start, end, self.gtfs['stops'], self.transit_graph, None, None, self.gtfs)
-                else:
-                    # Einzelbehandlung für Start und Ziel
-                    if is_stop_name(start, self.gtfs['stops']):
-                        start_stop = choose_stop(start, self.gtfs['stops'])
-                    else:
-                        if not self.address_df.empty:
-                            _, start_stop = geocode_address(start, self.gtfs['stops'], self.address_df)
-                        else:
-                            raise ValueError(f"'{start}' ist weder Haltestelle noch Adresse verfügbar.")
-                    
-                    if is_stop_name(end, self.gtfs['stops']):
-                        end_stop = choose_stop(end, self.gtfs['stops'])
-                    else:
-                        if not self.address_df.empty:
-                            _, end_stop = geocode_address(end, self.gtfs['stops'], self.address_df)
-                        else:
-                            raise ValueError(f"'{end}' ist weder Haltestelle noch Adresse verfügbar.")
-                    
-                    itinerary = plan_route_with_transfers_ignore_time(
-                        self.transit_graph, start_stop, end_stop, self.gtfs['stops'])
-                
-                # Formatiere Ergebnisse
-                if itinerary:
-                    print_route_grouped(itinerary, self.gtfs['stops'])
-                    self.current_route = itinerary
-                    success = True
-                else:
-                    print("Keine Route gefunden.")
-                    success = False
-            
-            # Hole gesamten Output
-            output_text = output_buffer.getvalue()
-            
-            # Update GUI im Hauptthread
-            self.root.after(0, self._update_results, output_text, success)
-            
-        except Exception as e:
-            error_msg = f"Fehler bei der Routensuche:\n{str(e)}"
-            self.root.after(0, self._update_results, error_msg, False)
+    def cancel_search(self):
+        # Abgebrochene Suchen melden sich nicht mehr -> Rückmeldung sofort anzeigen
+        self.search_scheduler.cancel()
+        self._update_results("Suche abgebrochen.", False)
+        self.status_label.config(text="Suche abgebrochen")
+        
+    def _search_route_job(self, start, end, alternatives, cancel_token):
+        # Läuft im Worker-Thread und liest nur den unveränderlichen Kontext
+        if alternatives:
+            results = route_alternatives(self.context, start, end, cancel_token=cancel_token)
+            return [(alternative_label(result, number), render_query_result(self.context, result), result['itinerary'])
+                    for number, result in enumerate(results, 1)]
+        result = route_query(self.context, start, end, cancel_token=cancel_token)
+        return [(None, render_query_result(self.context, result), result['itinerary'])]
+    
+    def _search_finished(self, result, error):
+        # Läuft im Hauptthread, nur für die neueste Suche
+        if error is not None:
+            if isinstance(error, SearchCancelled):
+                self._update_results("Suche abgebrochen.", False)
+                self.status_label.config(text="Suche abgebrochen")
+            else:
+                self._update_results(f"Fehler bei der Routensuche:\n{str(error)}", False)
+            return
+        if not result:
+            self._update_results("Keine Route gefunden.", False)
+            return
+        self._set_alternatives(result)
+        _, output_text, itinerary = result[0]
+        if itinerary:
+            self.current_route = itinerary
+        self._update_results(output_text, bool(itinerary))
+    
+    def _set_alternatives(self, results):
+        # Liste nur bei mehreren Routen anzeigen, die erste ist vorausgewählt
+        self.current_results = results
+        self.alternative_list.delete(0, tk.END)
+        if len(results) > 1:
+            for label, _, _ in results:
+                self.alternative_list.insert(tk.END, label)
+            self.alternative_list.selection_set(0)
+            self.alternative_list.grid()
+        else:
+            self.alternative_list.grid_remove()
+    
+    def _show_selected_alternative(self):
+        selection = self.alternative_list.curselection()
+        if not selection:
+            return
+        _, output_text, itinerary = self.current_results[selection[0]]
+        self.current_route = itinerary
+        self.results_text.delete(1.0, tk.END)
+        self.results_text.insert(tk.END, output_text)
     
     def _update_results(self, result, success):
+        self.results_text.delete(1.0, tk.END)
         self.results_text.insert(tk.END, result)
-        self.search_button.config(state=tk.NORMAL)
+        self.cancel_button.config(state=tk.DISABLED)
         self.progress.stop()
         
         if success:
@@ -238,7 +382,13 @@ class OPNVRouterGUI:
         if self.current_route:
             try:
                 self.status_label.config(text="Erstelle Karte...")
-                visualize_route(self.current_route, self.gtfs['stops'])
+                routes = [(label, itinerary) for label, _, itinerary in self.current_results if itinerary]
+                if len(routes) > 1:
+                    # Alle Alternativen gemeinsam, jede mit eigener Legende
+                    render_route_map(self.context, [itinerary for _, itinerary in routes],
+                                     labels=[label for label, _ in routes])
+                else:
+                    render_route_map(self.context, [self.current_route])
                 self.status_label.config(text="Karte gespeichert, Sie können diese nun über ihren Browser öffnen")
             except Exception as e:
                 messagebox.showerror("Fehler", f"Fehler beim Erstellen der Karte: {str(e)}")
@@ -247,17 +397,20 @@ class OPNVRouterGUI:
             messagebox.showwarning("Keine Route", "Bitte suchen Sie zuerst eine Route.")
     
     def clear_inputs(self):
+        self.search_scheduler.cancel()
+        self.progress.stop()
+        self.cancel_button.config(state=tk.DISABLED)
+        self._hide_suggestions()
         self.start_entry.delete(0, tk.END)
         self.end_entry.delete(0, tk.END)
         self.results_text.delete(1.0, tk.END)
+        self._set_alternatives([])
         self.current_route = None
         self.show_map_button.config(state=tk.DISABLED)
     
     def save_transit_graph(self, graph, filename='graph.pkl'):
-        import pickle
         try:
-            with open(filename, 'wb') as f:
-                pickle.dump(graph, f)
+            save_transit_graph(graph, filename)
         except Exception as e:
             print(f"Fehler beim Speichern des Graphen: {e}")
     
@@ -277,6 +430,8 @@ def main():
     root = tk.Tk()
     app = OPNVRouterGUI(root)
     root.mainloop()
+    app.search_scheduler.shutdown()
+    app.suggest_scheduler.shutdown()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,198 @@
+from types import MappingProxyType
+from typing import Any, NamedTuple, Optional
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+from routing import plan_route_multi_source, plan_route_alternatives, decode_itinerary, DEFAULT_ALTERNATIVES
+from access_stops import access_stops_for_address
+from serving_index import build_serving_index
+from utils import is_stop_name, choose_stop, geocode_address, format_route_grouped, get_all_direction_variants
+from auto_choose import auto_choose_stop_direction_aware
+from visualize_route import build_stop_index, build_shape_index, visualize_routes
+
+
+class NetworkContext(NamedTuple):
+    """
+    Unveränderlicher Kontext eines geladenen Netzes. Wird einmal gebaut und von allen Anfragen
+    (auch parallel aus mehreren Threads) nur gelesen -> keine Locks und keine Kopien nötig.
+    """
+    gtfs: MappingProxyType          # schreibgeschützte Sicht auf das gtfs-dict
+    stops: pd.DataFrame
+    graph: Any                      # Transit-Graph aus build_transit_graph
+    transfer_model: Optional[MappingProxyType]
+    address_df: pd.DataFrame
+    stop_names: MappingProxyType    # stop_id -> Name
+    stop_index: MappingProxyType    # stop_id -> (lat, lon, name) für die Karte
+    shape_index: dict
+    access_table: Optional[dict] = None     # vorberechnete Zugangshaltestellen je Adresse (access_stops.py)
+    serving_index: Optional[dict] = None    # Linienverläufe je Haltestelle (serving_index.py)
+
+
+def _freeze_arrays(data):
+    """
+    Setzt alle numpy-Arrays eines dicts auf schreibgeschützt (versehentliche Änderungen werfen einen Fehler).
+    """
+    if data is None:
+        return None
+    for value in data.values():
+        if isinstance(value, np.ndarray):
+            value.setflags(write=False)
+    return MappingProxyType(data)
+
+
+def build_network_context(gtfs, transit_graph, address_df=None, transfer_model=None, access_table=None):
+    """
+    Baut den unveränderlichen NetworkContext aus den Ergebnissen von load_gtfs_data/build_transit_graph.
+    """
+    stops = gtfs['stops']
+    return NetworkContext(
+        gtfs=MappingProxyType(dict(gtfs)),
+        stops=stops,
+        graph=transit_graph,
+        transfer_model=_freeze_arrays(transfer_model),
+        address_df=address_df if address_df is not None else pd.DataFrame(),
+        stop_names=MappingProxyType(dict(zip(stops['stop_id'], stops['stop_name']))),
+        stop_index=MappingProxyType(build_stop_index(stops)),
+        shape_index=build_shape_index(gtfs),
+        access_table=_freeze_arrays(access_table),
+        serving_index=MappingProxyType(build_serving_index(gtfs, transfer_model)),
+    )
+
+
+def resolve_endpoint(ctx, text):
+    """
+    Löst eine Eingabe (Haltestellenname oder Adresse) in eine stop_id auf. Verändert ctx nicht.
+    """
+    if is_stop_name(text, ctx.stops):
+        return choose_stop(text, ctx.stops)
+    if ctx.address_df.empty:
+        raise ValueError(f"'{text}' ist weder Haltestelle noch Adresse verfügbar.")
+    _, stop_id = geocode_address(text, ctx.stops, ctx.address_df)
+    return stop_id
+
+
+def resolve_access(ctx, text):
+    """
+    Löst eine Eingabe in Zugangshaltestellen [(stop_id, gehzeit_sekunden)] auf.
+    Adressen aus der Zugangstabelle liefern alle nahen Haltestellen, sonst wie resolve_endpoint eine einzige.
+    """
+    if not is_stop_name(text, ctx.stops):
+        access = access_stops_for_address(ctx.access_table, text)
+        if access:
+            return access
+    return [(resolve_endpoint(ctx, text), 0)]
+
+
+def route_query(ctx, start, end, cancel_token=None):
+    """
+    Beantwortet eine Routenanfrage rein funktional auf dem Kontext.
+    Rückgabe: dict mit 'start_stop', 'end_stop', 'itinerary' (leere Liste, wenn keine Route gefunden)
+    sowie 'access_walk'/'egress_walk' (Gehzeit in Sekunden zwischen Adresse und Haltestelle)
+    und 'walk_only' (Start und Ziel teilen sich eine Zugangshaltestelle -> zu Fuß erreichbar).
+    """
+    if is_stop_name(start, ctx.stops) and is_stop_name(end, ctx.stops):
+        start_stop, end_stop, itinerary = auto_choose_stop_direction_aware(
+            start, end, ctx.stops, ctx.graph, None, None, ctx.gtfs,
+            transfer_model=ctx.transfer_model, cancel_token=cancel_token, serving_index=ctx.serving_index)
+        return {'start_stop': start_stop, 'end_stop': end_stop, 'itinerary': itinerary,
+                'access_walk': 0, 'egress_walk': 0, 'walk_only': False}
+
+    # Adressen: alle Zugangshaltestellen als Starts bzw. Ziele der Suche
+    origins = resolve_access(ctx, start)
+    if cancel_token is not None:
+        cancel_token.check()
+    destinations = resolve_access(ctx, end)
+    if cancel_token is not None:
+        cancel_token.check()
+    start_stop, end_stop, itinerary = plan_route_multi_source(
+        ctx.graph, origins, destinations, ctx.stops,
+        transfer_model=ctx.transfer_model, cancel_token=cancel_token)
+    return {'start_stop': start_stop, 'end_stop': end_stop, 'itinerary': itinerary,
+            'access_walk': dict(origins).get(start_stop, 0), 'egress_walk': dict(destinations).get(end_stop, 0),
+            'walk_only': start_stop is not None and start_stop == end_stop}
+
+
+def route_alternatives(ctx, start, end, k=DEFAULT_ALTERNATIVES, cancel_token=None):
+    """
+    Wie route_query, liefert aber bis zu k verschiedene Routen aus einer erweiterten Suche
+    (plan_route_alternatives). Bei Haltestellennamen sind alle Steige der Station Start bzw. Ziel.
+    Rückgabe: Liste von dicts wie bei route_query plus 'travel_time' (geschätzt, Sekunden), schnellste zuerst.
+    """
+    endpoints = []
+    for text in (start, end):
+        if is_stop_name(text, ctx.stops) and ctx.serving_index is not None:
+            stop_id = resolve_endpoint(ctx, text)
+            endpoints.append([(stop, 0) for stop in get_all_direction_variants(stop_id, ctx.serving_index)] or [(stop_id, 0)])
+        else:
+            endpoints.append(resolve_access(ctx, text))
+        if cancel_token is not None:
+            cancel_token.check()
+    origins, destinations = endpoints
+    alternatives = plan_route_alternatives(ctx.graph, origins, destinations, ctx.stops, k=k,
+                                           transfer_model=ctx.transfer_model, cancel_token=cancel_token)
+    access, egress = dict(origins), dict(destinations)
+    return [{'start_stop': start_stop, 'end_stop': end_stop, 'itinerary': itinerary,
+             'access_walk': access.get(start_stop, 0), 'egress_walk': egress.get(end_stop, 0),
+             'walk_only': start_stop == end_stop, 'travel_time': travel_time}
+            for start_stop, end_stop, itinerary, travel_time in alternatives]
+
+
+def alternative_label(result, number):
+    """
+    Kurzbeschreibung einer Alternative für Listen und die Kartenlegende.
+    """
+    transfers = sum(1 for leg in result['itinerary'] if leg['transfer'])
+    minutes = max(1, round(result['travel_time'] / 60))
+    return f"Möglichkeit {number}: ca. {minutes} min, {transfers} Umstieg{'e' if transfers != 1 else ''}"
+
+
+def render_route_text(ctx, itinerary, access_walk=0, egress_walk=0):
+    """
+    Formatiert eine Route als Text (ohne stdout-Umleitung), optional mit Fußweg von/zur Adresse.
+    Linien- und Richtungsnamen werden erst hier aus den Codes der Legs aufgelöst.
+    """
+    text = format_route_grouped(decode_itinerary(ctx.graph, itinerary), ctx.stops, stop_names=ctx.stop_names)
+    if not itinerary:
+        return text
+    if access_walk:
+        text = f"Fußweg zur Starthaltestelle: {max(1, round(access_walk / 60))} min\n" + text
+    if egress_walk:
+        text += f"\nFußweg von der Zielhaltestelle: {max(1, round(egress_walk / 60))} min"
+    return text
+
+
+def render_query_result(ctx, result):
+    """
+    Text für ein Ergebnis von route_query (Route, reiner Fußweg oder keine Route).
+    """
+    if result['itinerary']:
+        return render_route_text(ctx, result['itinerary'], result['access_walk'], result['egress_walk'])
+    if result['walk_only']:
+        minutes = max(1, round((result['access_walk'] + result['egress_walk']) / 60))
+        return f"Start und Ziel liegen nah beieinander: ca. {minutes} min zu Fuß (über {ctx.stop_names.get(result['start_stop'], result['start_stop'])})."
+    return "Keine Route gefunden."
+
+
+def render_route_map(ctx, itineraries, filename="route_map.html", labels=None):
+    """
+    Zeichnet eine oder mehrere Routen mit den vorab gebauten Indizes des Kontexts.
+    """
+    itineraries = [decode_itinerary(ctx.graph, itinerary) for itinerary in itineraries]
+    return visualize_routes(itineraries, ctx.stops, filename=filename, labels=labels,
+                            stop_index=ctx.stop_index, shape_index=ctx.shape_index)
+
+
+def route_many(ctx, queries, max_workers=4):
+    """
+    Beantwortet viele (start, ziel)-Anfragen parallel auf demselben Kontext.
+    Fehler einzelner Anfragen werden als {'error': ...} zurückgegeben.
+    """
+    def run(query):
+        try:
+            return route_query(ctx, *query)
+        except Exception as e:
+            return {'error': str(e)}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(run, queries))
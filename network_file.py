@@ -0,0 +1,421 @@
+import json
+import mmap
+import os
+import time
+from multiprocessing import Pool, cpu_count
+import numpy as np
+import pandas as pd
+from routing import plan_route_timed, plan_route_with_transfers_ignore_time, decode_itinerary
+
+# Netzdatei: Fahrplan, Umstiegsmodell, Haltestellen und Graph als flache Arrays in EINER Datei.
+# Worker-Prozesse mappen sie nur lesend -> eine physische Kopie im Page-Cache für alle Prozesse.
+DEFAULT_NETWORK_FILE = 'network.bin'
+MAGIC = b'OEPNVNET'
+FORMAT_VERSION = 3
+ALIGNMENT = 64          # Arrays beginnen an 64-Byte-Grenzen (passend für numpy-Zugriffe)
+
+# Speicherart je Abschnitt und Schlüssel: 'array' (numpy), 'str_list' (IDs/Namen, immer per str() gespeichert),
+# 'index' (dict wie stop_index, wird nicht gespeichert -> StringIndex der ID-Liste beim Laden)
+SCHEMA = {
+    'graph': {
+        'node_ids': 'str_list', 'node_names': 'str_list', 'adj_offsets': 'array', 'adj_target': 'array',
+        'adj_trip': 'array', 'adj_edge': 'array', 'trip_ids': 'str_list', 'route_names': 'str_list',
+        'headsigns': 'str_list', 'edge_dep': 'array', 'edge_arr': 'array', 'edge_route': 'array',
+        'edge_headsign': 'array',
+    },
+    'timetable': {
+        'stop_ids': 'str_list', 'stop_index': 'index', 'stop_lat': 'array', 'stop_lon': 'array',
+        'conn_dep': 'array', 'conn_arr': 'array', 'conn_from': 'array', 'conn_to': 'array', 'conn_trip': 'array',
+        'conn_pos': 'array', 'trip_ids': 'str_list', 'trip_route_name': 'str_list', 'trip_headsign': 'str_list',
+        'trip_offsets': 'array', 'trip_conns': 'array', 'freq_trip': 'array', 'freq_start': 'array',
+        'freq_end': 'array', 'freq_headway': 'array', 'template_offsets': 'array', 'template_from': 'array',
+        'template_to': 'array', 'template_dep': 'array', 'template_arr': 'array',
+    },
+    'transfer_model': {
+        'stop_ids': 'str_list', 'stop_index': 'index', 'offsets': 'array', 'targets': 'array', 'durations': 'array',
+        'min_change_time': 'array', 'reverse_offsets': 'array', 'reverse_sources': 'array',
+        'reverse_durations': 'array',
+    },
+    'stops': {
+        'stop_ids': 'str_list', 'stop_names': 'str_list', 'stop_lat': 'array', 'stop_lon': 'array',
+    },
+}
+
+ADJACENCY_CACHE_SIZE = 4096     # so viele Nachbar-Dicts hält ein Prozess höchstens vor
+
+# Worker-Prozesse: geöffnete Netzdatei (einmal pro Prozess)
+_worker = {}
+
+
+class StringTable:
+    """
+    Schreibgeschützte String-Liste direkt auf der Netzdatei (utf-8-Block + Offsets).
+    Einträge werden erst beim Zugriff dekodiert, es entsteht keine Python-Liste je Prozess.
+    index: Zuordnung String -> Position über die sortierten IDs (StringIndex).
+    """
+
+    def __init__(self, data, offsets, sorted_values, order):
+        self._data = data
+        self._offsets = offsets
+        self.index = StringIndex(self, sorted_values, order)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self._data[int(self._offsets[i]):int(self._offsets[i + 1])].tobytes().decode('utf-8')
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def tolist(self):
+        return list(self)
+
+
+class StringIndex:
+    """
+    Ersetzt dicts wie stop_index ({stop_id: Position}): np.searchsorted über die beim Speichern sortierten
+    IDs (Bytes-Array in der Netzdatei). Bei doppelten IDs gilt wie beim dict die letzte Position.
+    """
+
+    def __init__(self, table, sorted_values, order):
+        self._table = table
+        self._sorted = sorted_values
+        self._order = order
+
+    def get(self, key, default=None):
+        value = str(key).encode('utf-8')
+        if len(self._sorted) == 0 or len(value) > self._sorted.dtype.itemsize:
+            return default
+        position = int(np.searchsorted(self._sorted, value, side='right')) - 1
+        if position < 0 or self._sorted[position] != value:
+            return default
+        return int(self._order[position])
+
+    def __getitem__(self, key):
+        i = self.get(key)
+        if i is None:
+            raise KeyError(key)
+        return i
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return len(self._table)
+
+    def __iter__(self):
+        return iter(self._table)
+
+
+class _MappedNodes:
+    # G.nodes für MappedGraph: Zugehörigkeit per StringIndex, Name erst beim Zugriff dekodieren
+    def __init__(self, node_ids, node_names):
+        self._node_ids = node_ids
+        self._node_names = node_names
+
+    def __contains__(self, stop_id):
+        return stop_id in self._node_ids.index
+
+    def __getitem__(self, stop_id):
+        return {'name': self._node_names[self._node_ids.index[stop_id]]}
+
+    def __iter__(self):
+        return iter(self._node_ids)
+
+    def __len__(self):
+        return len(self._node_ids)
+
+
+class MappedGraph:
+    """
+    Schreibgeschützte Sicht auf den Transit-Graphen aus der Netzdatei (CSR statt networkx-Dicts).
+    Bietet die Teile der networkx-Schnittstelle, die der Router nutzt: G.nodes, G[stop], G.pred[stop], G.graph,
+    G.edges(data=True).
+    Alle Tabellen bleiben Views auf die Datei; nur die Nachbar-Dicts der zuletzt benutzten Haltestellen
+    werden je Prozess vorgehalten (höchstens ADJACENCY_CACHE_SIZE).
+    """
+
+    def __init__(self, section):
+        self.graph = {key: section[key] for key in ('trip_ids', 'route_names', 'headsigns', 'edge_dep', 'edge_arr',
+                                                    'edge_route', 'edge_headsign')}
+        self._node_ids = section['node_ids']
+        self._index = self._node_ids.index
+        self.nodes = _MappedNodes(self._node_ids, section['node_names'])
+        self._offsets = section['adj_offsets']
+        self._target = section['adj_target']
+        self._trip = section['adj_trip']
+        self._edge = section['adj_edge']
+        self._adjacency = {}
+        self.pred = _MappedPredecessors(self)
+
+    def __contains__(self, stop_id):
+        return stop_id in self._index
+
+    def __getitem__(self, stop_id):
+        neighbours = self._adjacency.get(stop_id)
+        if neighbours is None:
+            i = self._index[stop_id]
+            start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+            node_ids = self._node_ids
+            neighbours = {node_ids[target]: {'trip': trip, 'edge': edge}
+                          for target, trip, edge in zip(self._target[start:end].tolist(), self._trip[start:end].tolist(),
+                                                        self._edge[start:end].tolist())}
+            if len(self._adjacency) >= ADJACENCY_CACHE_SIZE:
+                self._adjacency.clear()
+            self._adjacency[stop_id] = neighbours
+        return neighbours
+
+    def edges(self, data=False):
+        for stop_id in self._node_ids:
+            for next_stop, edge_data in self[stop_id].items():
+                yield (stop_id, next_stop, edge_data) if data else (stop_id, next_stop)
+
+    def number_of_nodes(self):
+        return len(self._node_ids)
+
+    def number_of_edges(self):
+        return len(self._target)
+
+
+class _MappedPredecessors:
+    """
+    G.pred[stop] für MappedGraph (Rückwärtssuche): umgekehrte CSR-Sortierung wird erst beim ersten Zugriff berechnet.
+    """
+
+    def __init__(self, graph):
+        self._graph = graph
+        self._order = None
+        self._sources = None
+        self._offsets = None
+        self._adjacency = {}
+
+    def __getitem__(self, stop_id):
+        neighbours = self._adjacency.get(stop_id)
+        if neighbours is None:
+            graph = self._graph
+            n = len(graph._node_ids)
+            if self._order is None:
+                sources = np.repeat(np.arange(n, dtype=np.int32), np.diff(graph._offsets))
+                self._order = np.argsort(graph._target, kind='stable')
+                self._sources = sources[self._order]
+                self._offsets = np.zeros(n + 1, dtype=np.int64)
+                np.cumsum(np.bincount(graph._target, minlength=n), out=self._offsets[1:])
+            i = graph._index[stop_id]
+            start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+            positions = self._order[start:end]
+            node_ids = graph._node_ids
+            neighbours = {node_ids[source]: {'trip': trip, 'edge': edge}
+                          for source, trip, edge in zip(self._sources[start:end].tolist(), graph._trip[positions].tolist(),
+                                                        graph._edge[positions].tolist())}
+            if len(self._adjacency) >= ADJACENCY_CACHE_SIZE:
+                self._adjacency.clear()
+            self._adjacency[stop_id] = neighbours
+        return neighbours
+
+
+def _graph_section(G):
+    """
+    Zerlegt einen kompakten Transit-Graphen (build_transit_graph) in CSR-Arrays, Reihenfolge der Nachbarn bleibt erhalten.
+    """
+    node_ids = list(G.nodes)
+    index = {stop_id: i for i, stop_id in enumerate(node_ids)}
+    offsets = np.zeros(len(node_ids) + 1, dtype=np.int64)
+    target, trip, edge = [], [], []
+    for i, stop_id in enumerate(node_ids):
+        for next_stop, edge_data in G[stop_id].items():
+            target.append(index[next_stop])
+            trip.append(edge_data['trip'])
+            edge.append(edge_data['edge'])
+        offsets[i + 1] = len(target)
+    section = {
+        'node_ids': node_ids,
+        'node_names': [str(G.nodes[stop_id].get('name', stop_id)) for stop_id in node_ids],
+        'adj_offsets': offsets,
+        'adj_target': np.array(target, dtype=np.int32),
+        'adj_trip': np.array(trip, dtype=np.int32),
+        'adj_edge': np.array(edge, dtype=np.int32),
+    }
+    section.update({key: G.graph[key] for key in ('trip_ids', 'route_names', 'headsigns', 'edge_dep', 'edge_arr',
+                                                  'edge_route', 'edge_headsign')})
+    return section
+
+
+def _encode_strings(values):
+    # Liste von Strings -> utf-8-Bytes hintereinander + Offsets, dazu sortierte IDs + Positionen für StringIndex
+    encoded = [str(value).encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    values = np.array(encoded, dtype=bytes)
+    order = np.argsort(values, kind='stable')
+    return {'data': np.frombuffer(b''.join(encoded), dtype=np.uint8), 'offsets': offsets,
+            'sorted': values[order], 'order': order.astype(np.int32)}
+
+
+def save_network_file(filename=DEFAULT_NETWORK_FILE, graph=None, timetable=None, transfer_model=None, stops_df=None,
+                      meta=None):
+    """
+    Schreibt die Netzdaten als flache Arrays in eine Datei (Header als JSON, danach die Rohdaten).
+    Die Speicherart jedes Schlüssels steht in SCHEMA (unbekannte Schlüssel -> ValueError). ID- und Namenslisten
+    werden per str() als utf-8-Block mit Offsets abgelegt, zusätzlich sortiert für die Suche String -> Position
+    (ersetzt dicts wie stop_index, die nicht gespeichert werden). Numerische IDs sind nach dem Laden also Strings.
+    """
+    sections = {}
+    if graph is not None:
+        sections['graph'] = _graph_section(graph)
+    if timetable is not None:
+        sections['timetable'] = timetable
+    if transfer_model is not None:
+        sections['transfer_model'] = transfer_model
+    if stops_df is not None:
+        sections['stops'] = {
+            'stop_ids': stops_df['stop_id'].tolist(),
+            'stop_names': stops_df['stop_name'].tolist(),
+            'stop_lat': pd.to_numeric(stops_df['stop_lat'], errors='coerce').to_numpy(dtype=float),
+            'stop_lon': pd.to_numeric(stops_df['stop_lon'], errors='coerce').to_numpy(dtype=float),
+        }
+
+    header = {'version': FORMAT_VERSION, 'meta': meta or {}, 'sections': {}}
+    blocks = []
+    position = 0
+    for name, data in sections.items():
+        entries = header['sections'][name] = {}
+        schema = SCHEMA[name]
+        unknown = set(data) - set(schema)
+        if unknown:
+            raise ValueError(f"Netzdatei: unbekannte Schlüssel in '{name}': {sorted(unknown)}")
+        for key, value in data.items():
+            kind = schema[key]
+            if kind == 'index':
+                continue
+            if kind == 'str_list':
+                arrays = _encode_strings(value)
+            else:
+                arrays = {'': np.ascontiguousarray(value)}
+                if arrays[''].dtype == object:
+                    raise ValueError(f"Netzdatei: '{name}.{key}' ist kein Zahlen-Array.")
+            entry = entries[key] = {'kind': kind, 'arrays': {}}
+            for part, array in arrays.items():
+                position = -(-position // ALIGNMENT) * ALIGNMENT
+                entry['arrays'][part] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': position}
+                blocks.append((position, array))
+                position += array.nbytes
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = -(-(len(MAGIC) + 8 + len(header_bytes)) // ALIGNMENT) * ALIGNMENT
+    temp_name = filename + '.tmp'
+    with open(temp_name, 'wb') as f:
+        f.write(MAGIC)
+        f.write(np.uint64(len(header_bytes)).tobytes())
+        f.write(header_bytes)
+        for offset, array in blocks:
+            f.seek(data_start + offset)
+            f.write(array.tobytes())
+        f.truncate(data_start + position)
+    os.replace(temp_name, filename)
+    print(f"Netzdatei gespeichert: {filename} ({(data_start + position) / 1e6:.1f} MB, {len(blocks)} Arrays)")
+    return filename
+
+
+def load_network_file(filename=DEFAULT_NETWORK_FILE):
+    """
+    Öffnet die Netzdatei per Memory-Map (nur lesend). Die numpy-Arrays zeigen direkt in die Datei,
+    mehrere Prozesse teilen sich so dieselben Seiten im Speicher. Auch Listen werden nicht kopiert:
+    Zahlenlisten bleiben Arrays, String-Listen sind StringTable-Views, stop_index ist ein StringIndex.
+    Gibt None zurück, wenn die Datei fehlt.
+    Rückgabe: dict mit 'graph' (MappedGraph), 'timetable', 'transfer_model', 'stops', 'meta' (soweit gespeichert).
+    """
+    if not os.path.exists(filename):
+        return None
+    with open(filename, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if buffer[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"'{filename}' ist keine Netzdatei.")
+    header_length = int(np.frombuffer(buffer, dtype=np.uint64, count=1, offset=len(MAGIC))[0])
+    header = json.loads(buffer[len(MAGIC) + 8:len(MAGIC) + 8 + header_length].decode('utf-8'))
+    if header['version'] != FORMAT_VERSION:
+        raise ValueError(f"Netzdatei '{filename}' hat Version {header['version']}, erwartet {FORMAT_VERSION}.")
+    data_start = -(-(len(MAGIC) + 8 + header_length) // ALIGNMENT) * ALIGNMENT
+
+    def view(spec):
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape'], dtype=np.int64))
+        return np.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + spec['offset']).reshape(spec['shape'])
+
+    sections = {}
+    for name, entries in header['sections'].items():
+        data = sections[name] = {}
+        for key, entry in entries.items():
+            arrays = {part: view(spec) for part, spec in entry['arrays'].items()}
+            if entry['kind'] == 'array':
+                data[key] = arrays['']
+            else:
+                data[key] = StringTable(arrays['data'], arrays['offsets'], arrays['sorted'], arrays['order'])
+
+    # stop_index wie bei build_timetable/build_transfer_model, hier ohne dict
+    for name in ('timetable', 'transfer_model'):
+        if name in sections:
+            sections[name]['stop_index'] = sections[name]['stop_ids'].index
+    if 'graph' in sections:
+        sections['graph'] = MappedGraph(sections['graph'])
+    sections['meta'] = header['meta']
+    return sections
+
+
+def _init_worker(filename):
+    _worker['network'] = load_network_file(filename)
+
+
+def _route_job(query):
+    network = _worker['network']
+    start_stop, end_stop, dep_time = query
+    if dep_time is None:
+        # Legs mit Codes (kompakter Graph) -> wie bei plan_route_timed lesbare Legs zurückgeben
+        itinerary = plan_route_with_transfers_ignore_time(network['graph'], start_stop, end_stop, None,
+                                                          transfer_model=network.get('transfer_model'))
+        return decode_itinerary(network['graph'], itinerary)
+    return plan_route_timed(network['timetable'], start_stop, end_stop, dep_time,
+                            transfer_model=network.get('transfer_model'))
+
+
+def route_many_shared(queries, filename=DEFAULT_NETWORK_FILE, processes=None, chunksize=16):
+    """
+    Beantwortet viele Anfragen (start_stop, end_stop, abfahrtszeit oder None) in mehreren Prozessen.
+    Jeder Worker mappt nur die Netzdatei (Start in Millisekunden, keine eigene Kopie des Netzes).
+    Mit Abfahrtszeit wird der Connection Scan genutzt, ohne (None) die topologische Suche.
+    Rückgabe: je Anfrage die Legs mit trip_id, Linie und Richtung (wie im Prozess nach decode_itinerary).
+    """
+    with Pool(processes or cpu_count(), initializer=_init_worker, initargs=(filename,)) as pool:
+        return pool.map(_route_job, queries, chunksize=chunksize)
+
+
+if __name__ == "__main__":
+    # Offline-Pipeline: Netz aus GTFS bauen und als Netzdatei für die Worker ablegen
+    import pickle
+    from datetime import date
+    from feed_merge import load_merged_gtfs_data
+    from gtfs_processing import build_transit_graph, compact_transit_graph
+    from timetable import build_timetable
+    from transfers import build_transfer_model
+
+    gtfs = load_merged_gtfs_data()
+    if os.path.exists('graph.pkl'):
+        with open('graph.pkl', 'rb') as f:
+            graph = compact_transit_graph(pickle.load(f))
+    else:
+        graph = build_transit_graph(gtfs)
+    model = build_transfer_model(gtfs['stops'], gtfs.get('transfers'))
+    routing_date = date.today()
+    save_network_file(graph=graph, timetable=build_timetable(gtfs, routing_date), transfer_model=model,
+                      stops_df=gtfs['stops'], meta={'routing_date': routing_date.isoformat()})
+    started = time.perf_counter()
+    load_network_file()
+    print(f"Netzdatei geöffnet in {(time.perf_counter() - started) * 1000:.1f} ms")
@@ -36,3 +36,18 @@ def is_same_station_area(stop_id1, stop_id2, stops_df):
     group1 = set(get_all_stop_ids_for_station(stops_df, stop_id1))
     group2 = set(get_all_stop_ids_for_station(stops_df, stop_id2))
     return not group1.isdisjoint(group2)
+
+def build_station_groups(stops_df):
+    """
+    Berechnet get_all_stop_ids_for_station für alle Haltestellen auf einmal (ein groupby statt einer Suche je stop_id).
+    Rückgabe: dict stop_id -> Liste der stop_ids derselben Station.
+    """
+    groups = {stop_id: [stop_id] for stop_id in stops_df['stop_id']}
+    if 'parent_station' not in stops_df.columns:
+        return groups
+    for parent, members in stops_df.dropna(subset=['parent_station']).groupby('parent_station', sort=False)['stop_id']:
+        members = members.tolist()
+        groups[parent] = members
+        for stop_id in members:
+            groups[stop_id] = members
+    return groups
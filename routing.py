@@ -1,5 +1,27 @@
+import heapq
+import random
+import time
 from datetime import datetime, timedelta
 from collections import deque
+from transfers import get_footpaths, get_reverse_footpaths
+from utils import time_to_seconds, seconds_to_time_str
+from timetable import trip_connections
+from goal_directed import lower_bounds_to
+
+# Connection-Scan arbeitet blockweise auf Python-Listen (schneller als Einzelzugriffe auf numpy-Arrays)
+SCAN_CHUNK = 4096
+CANCEL_CHECK_INTERVAL = 1024    # Breitensuche prüft das Abbruch-Token alle N Zustände
+INFINITY = float('inf')
+_END = object()                 # Rückwärtssuche: Zustand am Ziel (keine weitere Fahrt)
+
+# Alternativen (plan_route_alternatives)
+DEFAULT_ALTERNATIVES = 3
+ALTERNATIVE_MAX_EXTRA_TIME = 20 * 60    # Sekunden, die eine Alternative länger dauern darf als die schnellste
+ALTERNATIVE_MAX_OVERLAP = 0.6           # Anteil gemeinsamer Fahrabschnitte, ab dem zwei Routen als gleich gelten
+ALTERNATIVE_EXTRA_DEPTH = 12            # so viele Kanten tiefer als der erste Treffer wird weitergesucht
+MAX_ALTERNATIVE_CANDIDATES = 60         # so viele schnellste (verschiedene) Kandidaten bleiben im Vergleich
+TRANSFER_PENALTY = 5 * 60               # Bewertung eines Umstiegs in Sekunden
+DEFAULT_HOP_SECONDS = 120               # Fahrzeit je Kante, wenn der Graph keine Zeiten enthält
 
 def find_next_departure_time(G, start_stop, end_stop, dep_time, search_hours=6):    #G = ÖPNV-Netzwerk, start_stop = Start-Halte, end_stop = End-Halte, dep_time = Gewünschte Abfahrtszeit, search_hours = Wie lang (in Std.) maximal gesucht werden soll (Standard = 6)
     
@@ -24,51 +46,750 @@ def find_next_departure_time(G, start_stop, end_stop, dep_time, search_hours=6):
     return []   # Falls innerhalb des Suchzeitraums keine Route gefunden -> Funktion gibt leere Liste zurück
 
 
-def plan_route_with_transfers_ignore_time(G, start_stop, end_stop, stops_df, max_transfers=4, max_depth=200):
+def plan_route_with_transfers_ignore_time(G, start_stop, end_stop, stops_df, max_transfers=4, max_depth=200, transfer_model=None,
+                                          cancel_token=None, bidirectional=False, stats=None):
     """
     Routenplanung mit Umstiegslogik OHNE Zeitangaben.
     Arbeitet rein topologisch (d.h. auf Basis von Haltestellen und Linienwechseln).
     Nutzt trip_id zur Umstiegsdetektion.
+    Mit transfer_model (Umstiegsmodell aus build_transfer_model) sind zusätzlich Fußwege zwischen Haltestellen möglich.
+    cancel_token (siehe search_jobs.CancelToken) wird regelmäßig geprüft -> SearchCancelled bei Abbruch.
+    bidirectional=True: Suche gleichzeitig vom Start und vom Ziel (plan_route_bidirectional). Beide Suchen finden
+    dieselben Verbindungen mit derselben (kleinsten) Anzahl Kanten, die Routen können sich bei gleicher Länge
+    unterscheiden. Es werden weniger Zustände untersucht, vor allem bei Anfragen mit Verbindung
+    (siehe benchmark_bidirectional).
+    stats: optionales dict, wird mit 'expanded_states' gefüllt (erweiterte Zustände, wie bei plan_route_bidirectional).
     """
     if start_stop not in G.nodes or end_stop not in G.nodes:
         return []
+    if bidirectional:
+        return plan_route_bidirectional(G, start_stop, end_stop, max_transfers, max_depth, transfer_model, cancel_token,
+                                        stats)
 
-    queue = deque()
-    queue.append((start_stop, None, 0, []))  # (aktuelle Haltestelle, letztes trip_id, Umstiege, Pfad)
+    expanded = 0
+    for curr_stop, _, _, node in iterate_route_states(G, start_stop, max_transfers, max_depth, transfer_model, cancel_token):
+        if curr_stop == end_stop:
+            if stats is not None:
+                stats['expanded_states'] = expanded
+            return path_from_node(node)
+        expanded += 1
+
+    if stats is not None:
+        stats['expanded_states'] = expanded
+    return []
+
+
+def plan_route_bidirectional(G, start_stop, end_stop, max_transfers=4, max_depth=200, transfer_model=None,
+                             cancel_token=None, stats=None):
+    """
+    Bidirektionale Breitensuche: vorwärts vom Start über G[stop], rückwärts vom Ziel über G.pred[stop]
+    (Fußwege rückwärts über get_reverse_footpaths). Es wird immer die kleinere Front um eine Ebene erweitert.
+    Zustände und Regeln wie in iterate_route_states: (Haltestelle, trip), Fußwege nur am Start oder nach
+    einer Fahrt, höchstens max_transfers Umstiege, erneute Aufnahme mit weniger Umstiegen (_admit_label).
+    Treffen sich die Suchen an einer Haltestelle, wird die Route zusammengesetzt; die Suche endet, sobald
+    die beiden vollständig erweiterten Tiefen zusammen die Länge der besten Route erreichen (kürzere
+    Routen wären dann schon gefunden worden).
+    Ist eine Seite erschöpft, ohne dass sich die Suchen getroffen haben, gibt es keine gültige Route
+    (jede Seite kennt dann alle Ankünfte mit den wenigsten Umstiegen) -> Suche endet.
+    stats: optionales dict, wird mit 'expanded_states' gefüllt.
+    """
+    if start_stop == end_stop:
+        return []
+    # Knoten: (Vorgänger, Schritt, Tiefe), Schritt = (von, nach, Kantendaten oder None, Gehzeit)
+    # Vorwärts: Zustand (Haltestelle, trip der Ankunft); rückwärts: (Haltestelle, trip der Abfahrt, None = Fußweg)
+    forward_seen = {(start_stop, None): [1, 0]}     # wie visited in iterate_route_states (_admit_label)
+    backward_seen = {(end_stop, _END): [1, 0]}
+    forward_at = {start_stop: [(None, 0, None, 0)]}        # Haltestelle -> [(trip, Umstiege, Knoten, Tiefe)]
+    backward_at = {end_stop: [(_END, 0, None, 0)]}
+    forward_front = [(start_stop, None, 0, None)]
+    backward_front = [(end_stop, _END, 0, None)]
+    forward_depth = backward_depth = 0
+    best = None         # (Länge, Vorwärtsknoten, Rückwärtsknoten)
+    expanded = 0
+
+    def join(trip_in, forward_transfers, forward_node, forward_length, trip_out, backward_transfers, backward_node,
+             backward_length):
+        nonlocal best
+        if trip_out is None and trip_in is None and forward_length > 0:
+            return      # keine zwei Fußwege hintereinander
+        transfers = forward_transfers + backward_transfers
+        if trip_in is not None and trip_out is not _END and trip_out != trip_in:
+            transfers += 1
+        length = forward_length + backward_length
+        if transfers <= max_transfers and length <= max_depth and (best is None or length < best[0]):
+            best = (length, forward_node, backward_node)
+
+    while forward_front or backward_front:
+        if best is not None and best[0] <= forward_depth + backward_depth:
+            break
+        if best is None and not (forward_front and backward_front):
+            break
+        expand_forward = bool(forward_front) and (not backward_front or len(forward_front) <= len(backward_front))
+        next_front = []
+        if expand_forward:
+            forward_depth += 1
+            for stop, trip, transfers, node in forward_front:
+                expanded += 1
+                if cancel_token is not None and expanded % CANCEL_CHECK_INTERVAL == 0:
+                    cancel_token.check()
+                steps = [(next_stop, edge_data['trip'], (stop, next_stop, edge_data, 0),
+                          trip is not None and edge_data['trip'] != trip) for next_stop, edge_data in G[stop].items()]
+                if transfer_model is not None and (trip is not None or node is None):
+                    steps.extend((next_stop, None, (stop, next_stop, None, duration), trip is not None)
+                                 for next_stop, duration in get_footpaths(transfer_model, stop) if next_stop in G.nodes)
+                for next_stop, next_trip, step, transfer_needed in steps:
+                    new_transfers = transfers + 1 if transfer_needed else transfers
+                    if forward_depth > max_depth or not _admit_label(forward_seen, (next_stop, next_trip),
+                                                                     new_transfers, max_transfers):
+                        continue
+                    new_node = (node, step, forward_depth)
+                    forward_at.setdefault(next_stop, []).append((next_trip, new_transfers, new_node, forward_depth))
+                    next_front.append((next_stop, next_trip, new_transfers, new_node))
+                    for trip_out, backward_transfers, backward_node, backward_length in backward_at.get(next_stop, ()):
+                        join(next_trip, new_transfers, new_node, forward_depth, trip_out, backward_transfers,
+                             backward_node, backward_length)
+            forward_front = next_front
+        else:
+            backward_depth += 1
+            for stop, trip_out, transfers, node in backward_front:
+                expanded += 1
+                if cancel_token is not None and expanded % CANCEL_CHECK_INTERVAL == 0:
+                    cancel_token.check()
+                # Vorgänger-Fahrten: Umstieg an stop, wenn danach eine andere Fahrt oder ein Fußweg folgt
+                steps = [(previous, edge_data['trip'], (previous, stop, edge_data, 0),
+                          trip_out is not _END and trip_out != edge_data['trip']) for previous, edge_data in G.pred[stop].items()]
+                if transfer_model is not None and trip_out is not None:
+                    steps.extend((previous, None, (previous, stop, None, duration), False)
+                                 for previous, duration in get_reverse_footpaths(transfer_model, stop) if previous in G.nodes)
+                for previous, previous_trip, step, transfer_needed in steps:
+                    new_transfers = transfers + 1 if transfer_needed else transfers
+                    if backward_depth > max_depth or not _admit_label(backward_seen, (previous, previous_trip),
+                                                                      new_transfers, max_transfers):
+                        continue
+                    new_node = (node, step, backward_depth)
+                    backward_at.setdefault(previous, []).append((previous_trip, new_transfers, new_node, backward_depth))
+                    next_front.append((previous, previous_trip, new_transfers, new_node))
+                    for trip_in, forward_transfers, forward_node, forward_length in forward_at.get(previous, ()):
+                        join(trip_in, forward_transfers, forward_node, forward_length, previous_trip, new_transfers,
+                             new_node, backward_depth)
+            backward_front = next_front
+
+    if stats is not None:
+        stats['expanded_states'] = expanded
+    if best is None:
+        return []
+
+    # Schritte: Vorwärtskette umgedreht, dann Rückwärtskette in Fahrtrichtung
+    _, forward_node, backward_node = best
+    steps = []
+    while forward_node is not None:
+        forward_node, step, _ = forward_node
+        steps.append(step)
+    steps.reverse()
+    while backward_node is not None:
+        backward_node, step, _ = backward_node
+        steps.append(step)
+
+    # Umstiegs-Flags wie in iterate_route_states neu setzen (hängen vom vorherigen Abschnitt ab)
+    itinerary = []
+    previous_trip = None
+    for from_stop, to_stop, edge_data, duration in steps:
+        if edge_data is None:
+            itinerary.append(make_walk_leg(from_stop, to_stop, duration, previous_trip is not None))
+            previous_trip = None
+        else:
+            itinerary.append(make_ride_leg(from_stop, to_stop, edge_data,
+                                           previous_trip is not None and edge_data['trip'] != previous_trip))
+            previous_trip = edge_data['trip']
+    return itinerary
+
+
+def benchmark_bidirectional(G, transfer_model=None, queries=None, query_count=100, seed=0):
+    """
+    Vergleicht die Vorwärtssuche mit plan_route_bidirectional (Laufzeit, erweiterte Zustände, Routenlänge),
+    getrennt nach Anfragen mit und ohne gefundene Verbindung.
+    queries: Liste von (start_stop, end_stop); sonst zufällige Paare aus Haltestellen mit Fahrten.
+    Rückgabe: True, wenn die bidirektionale Suche bei den Anfragen mit Verbindung weniger Zustände erweitert
+    und nie eine längere (oder keine) Route liefert, wo die Vorwärtssuche eine findet.
+    """
+    if queries is None:
+        rng = random.Random(seed)
+        served = sorted(stop for stop in G.nodes if G[stop])
+        queries = [tuple(rng.sample(served, 2)) for _ in range(query_count)]
+
+    # Gruppe (True = Verbindung gefunden) -> Modus -> [Sekunden, erweiterte Zustände, Anfragen]
+    results = {found: {'forward': [0.0, 0, 0], 'bidirectional': [0.0, 0, 0]} for found in (True, False)}
+    worse = 0
+    for start, end in queries:
+        runs = {}
+        for mode in ('forward', 'bidirectional'):
+            stats = {}
+            t0 = time.perf_counter()
+            itinerary = plan_route_with_transfers_ignore_time(G, start, end, None, transfer_model=transfer_model,
+                                                              bidirectional=mode == 'bidirectional', stats=stats)
+            runs[mode] = (time.perf_counter() - t0, stats.get('expanded_states', 0),
+                          len(itinerary) if itinerary else INFINITY)
+        found = runs['forward'][2] != INFINITY
+        for mode, (seconds, expanded, _) in runs.items():
+            results[found][mode][0] += seconds
+            results[found][mode][1] += expanded
+            results[found][mode][2] += 1
+        if runs['bidirectional'][2] > runs['forward'][2]:
+            worse += 1
+
+    for found, label in ((True, 'mit Verbindung'), (False, 'ohne Verbindung')):
+        for mode, (seconds, expanded, count) in results[found].items():
+            count = max(count, 1)
+            print(f"{label:>15} {mode:>13}: {seconds / count * 1000:.2f} ms/Anfrage, "
+                  f"{expanded / count:.0f} erweiterte Zustände/Anfrage")
+    print(f"Anfragen mit Verbindung: {results[True]['forward'][2]} von {len(queries)}")
+    print(f"Schlechtere Ergebnisse (bidirektional): {worse} von {len(queries)}")
+    return worse == 0 and results[True]['bidirectional'][1] < results[True]['forward'][1]
+
+
+def plan_route_multi_source(G, origins, destinations, stops_df, max_transfers=4, max_depth=200, transfer_model=None,
+                            cancel_token=None):
+    """
+    Wie plan_route_with_transfers_ignore_time, aber mit mehreren Start- und Zielhaltestellen
+    (z.B. alle Haltestellen im Fußwegradius einer Adresse aus der Zugangstabelle).
+    origins/destinations: Listen von (stop_id, Gehzeit in Sekunden).
+    Alle Ankünfte bis zur Tiefe des ersten Treffers werden verglichen; gewählt wird die kleinste Summe aus
+    Zugangsweg, estimate_travel_time und Abgangsweg. Eine Haltestelle in beiden Listen ist ebenfalls ein Kandidat
+    (nur Zugangs- plus Abgangsweg, keine Fahrt).
+    Rückgabe: (start_stop, end_stop, itinerary) bzw. (None, None, []) ohne Route.
+    """
+    access, egress = _walk_times(G, origins), _walk_times(G, destinations)
+    if not access or not egress:
+        return None, None, []
+
+    # Start und Ziel fallen zusammen -> Kandidat ohne Fahrt (nur die Gehzeiten)
+    best = min(((access[stop] + egress[stop], stop, stop, []) for stop in access if stop in egress),
+               key=lambda candidate: candidate[0], default=None)
 
-    visited = set()  # (Haltestelle, trip_id)
+    depth_limit = max_depth
+    for curr_stop, _, _, node in iterate_route_states(G, sorted(access, key=access.get), max_transfers, max_depth,
+                                                      transfer_model, cancel_token):
+        if node is None:
+            continue
+        if node[2] > depth_limit:
+            break
+        if curr_stop in egress:
+            depth_limit = node[2]
+            path = path_from_node(node)
+            start_stop = path[0]['from_stop']
+            cost = access[start_stop] + estimate_travel_time(G, path) + egress[curr_stop]
+            if best is None or cost < best[0]:
+                best = (cost, start_stop, curr_stop, path)
+
+    if best is None:
+        return None, None, []
+    return best[1], best[2], best[3]
+
+
+def _walk_times(G, stops):
+    """
+    (stop_id, Gehzeit)-Liste -> {stop_id: kürzeste Gehzeit}, nur Haltestellen im Graphen.
+    """
+    walks = {}
+    for stop, walk in stops:
+        if stop in G.nodes:
+            walks[stop] = min(walk, walks.get(stop, walk))
+    return walks
+
+
+def plan_route_alternatives(G, origins, destinations, stops_df, k=DEFAULT_ALTERNATIVES, max_extra_time=ALTERNATIVE_MAX_EXTRA_TIME,
+                            max_overlap=ALTERNATIVE_MAX_OVERLAP, max_transfers=4, max_depth=200, transfer_model=None,
+                            cancel_token=None):
+    """
+    Bis zu k möglichst verschiedene Routen aus EINER Breitensuche (statt k Suchen nacheinander).
+    Jeder Zustand darf k+1-mal über verschiedene Vorgänger erreicht werden; die Suche läuft nach dem ersten
+    Treffer noch ALTERNATIVE_EXTRA_DEPTH Kanten weiter und sammelt jede Ankunft am Ziel als Kandidaten. Kandidaten werden nach geschätzter Reisezeit (estimate_travel_time
+    plus Gehzeiten) sortiert; Ankünfte mit denselben Fahrabschnitten zählen nur einmal (die schnellere bleibt),
+    behalten werden die MAX_ALTERNATIVE_CANDIDATES schnellsten. Übernommen wird nur, was höchstens max_extra_time länger dauert als die
+    schnellste Route und mit keiner gewählten Route mehr als max_overlap der Fahrabschnitte teilt.
+    origins/destinations wie bei plan_route_multi_source.
+    Rückgabe: Liste von (start_stop, end_stop, itinerary, reisezeit_sekunden), schnellste zuerst.
+    """
+    access, egress = _walk_times(G, origins), _walk_times(G, destinations)
+    if not access or not egress:
+        return []
+
+    # Haltestelle in Start- und Zielliste: Kandidat ohne Fahrt, konkurriert über die Gehzeiten mit den Routen
+    candidates = [(access[stop] + egress[stop], i, stop, stop, [])
+                  for i, stop in enumerate(stop for stop in access if stop in egress)]
+    routed = {}     # Fahrabschnitte -> schnellster Kandidat damit
+    found = len(candidates)     # laufende Nummer (eindeutiger Gleichstandsbrecher beim Sortieren)
+    depth_limit = max_depth
+    for curr_stop, _, _, node in iterate_route_states(G, sorted(access, key=access.get), max_transfers, max_depth,
+                                                      transfer_model, cancel_token, labels_per_state=k + 1):
+        if node is None:
+            continue
+        if node[2] > depth_limit:
+            break
+        if curr_stop in egress:
+            if not routed:
+                depth_limit = min(max_depth, node[2] + ALTERNATIVE_EXTRA_DEPTH)
+            path = path_from_node(node)
+            stops_on_path = [leg['from_stop'] for leg in path]
+            if len(set(stops_on_path)) < len(stops_on_path) or curr_stop in stops_on_path:
+                continue    # Schleife (durch Mehrfach-Erreichung möglich)
+            start_stop = path[0]['from_stop']
+            cost = access[start_stop] + estimate_travel_time(G, path) + egress[curr_stop]
+            key = frozenset(ride_segments(path))
+            if key not in routed or cost < routed[key][0]:
+                routed[key] = (cost, found, start_stop, curr_stop, path)
+                found += 1
+            if len(routed) > 2 * MAX_ALTERNATIVE_CANDIDATES:
+                routed = {candidate_key: candidate for candidate_key, candidate in
+                          heapq.nsmallest(MAX_ALTERNATIVE_CANDIDATES, routed.items(), key=lambda item: item[1])}
+    candidates.extend(heapq.nsmallest(MAX_ALTERNATIVE_CANDIDATES, routed.values()))
+    if not candidates:
+        return []
+
+    candidates.sort()
+    best_cost = candidates[0][0]
+    chosen = []
+    chosen_segments = []
+    for cost, _, start_stop, end_stop, path in candidates:
+        if cost > best_cost + max_extra_time or len(chosen) >= k:
+            break
+        segments = ride_segments(path)
+        if any(len(segments & other) > max_overlap * min(len(segments), len(other))
+               for other in chosen_segments):
+            continue
+        chosen.append((start_stop, end_stop, path, cost))
+        chosen_segments.append(segments)
+    return chosen
+
+
+def ride_segments(itinerary):
+    """
+    Menge der befahrenen Abschnitte (von, nach) einer Route ohne Fußwege (Vergleich von Alternativen).
+    """
+    return {(leg['from_stop'], leg['to_stop']) for leg in itinerary if not leg.get('walk')}
+
+
+def estimate_travel_time(G, itinerary):
+    """
+    Geschätzte Reisezeit einer topologischen Route in Sekunden: Fahrzeiten der Kanten (Abfahrt/Ankunft
+    der im Graphen gespeicherten Fahrt), Fußwege und TRANSFER_PENALTY je Umstieg.
+    """
+    edge_dep, edge_arr = G.graph['edge_dep'], G.graph['edge_arr']
+    total = 0
+    for leg in itinerary:
+        if leg.get('walk'):
+            total += leg['duration']
+        else:
+            departure, arrival = int(edge_dep[leg['edge']]), int(edge_arr[leg['edge']])
+            if departure < 0 or arrival < 0:
+                total += DEFAULT_HOP_SECONDS
+            else:
+                total += (arrival - departure) % (24 * 3600)
+        if leg['transfer']:
+            total += TRANSFER_PENALTY
+    return total
+
+
+def iterate_route_states(G, start_stop, max_transfers=4, max_depth=200, transfer_model=None, cancel_token=None,
+                         labels_per_state=1):
+    """
+    Kern der topologischen Breitensuche: liefert alle erreichbaren Zustände in Suchreihenfolge
+    als (Haltestelle, trip_id, Umstiege, Knoten). Der Knoten (Vorgänger, Leg, Tiefe) verweist auf den
+    Vorgänger statt den ganzen Pfad zu kopieren -> Pfad über path_from_node.
+    start_stop darf auch eine Liste von Haltestellen sein (Suche mit mehreren Starts).
+    labels_per_state > 1: jeder Zustand darf so oft über verschiedene Vorgänger erreicht werden
+    (erweiterte Suche für Alternativen, siehe plan_route_alternatives).
+    Zusätzlich wird ein Zustand erneut aufgenommen, wenn er mit weniger Umstiegen als bisher erreicht wird
+    (sonst könnte eine frühere Ankunft mit zu vielen Umstiegen die kürzeste gültige Route verdecken).
+    """
+    start_stops = start_stop if isinstance(start_stop, (list, tuple)) else [start_stop]
+    queue = deque()
+    visited = {}  # (Haltestelle, trip_id) -> [Anzahl Erreichungen, wenigste Umstiege]
+    for stop in start_stops:
+        queue.append((stop, None, 0, None))  # (aktuelle Haltestelle, letztes trip_id, Umstiege, Knoten)
+        visited[(stop, None)] = [1, 0]
+    steps = 0
 
     while queue:
-        curr_stop, curr_trip, transfers, path = queue.popleft()
+        curr_stop, curr_trip, transfers, node = queue.popleft()
+        depth = node[2] if node is not None else 0
+
+        steps += 1
+        if cancel_token is not None and steps % CANCEL_CHECK_INTERVAL == 0:
+            cancel_token.check()
 
-        if transfers > max_transfers or len(path) > max_depth:
+        if transfers > max_transfers or depth > max_depth:
             continue
 
-        if curr_stop == end_stop:
-            return path
+        yield curr_stop, curr_trip, transfers, node
 
         for next_stop, edge_data in G[curr_stop].items():
-            next_trip = edge_data.get('trip_id')
-            transfer_needed = curr_trip is not None and next_trip != curr_trip        
+            next_trip = edge_data['trip']
+            transfer_needed = curr_trip is not None and next_trip != curr_trip
             new_transfers = transfers + 1 if transfer_needed else transfers
-            #if curr_trip and next_trip and curr_trip != next_trip:
-            #    if not is_same_station_area(curr_stop, next_stop, stops_df):
-            #        continue
 
-            state = (next_stop, next_trip)
-            if state in visited:
+            if not _admit_label(visited, (next_stop, next_trip), new_transfers, max_transfers, labels_per_state):
                 continue
-            visited.add(state)
+            leg = make_ride_leg(curr_stop, next_stop, edge_data, transfer_needed)
+            queue.append((next_stop, next_trip, new_transfers, (node, leg, depth + 1)))
 
-            leg = {
-                'from_stop': curr_stop,
-                'to_stop': next_stop,
-                'route_name': edge_data.get('route_name', 'Unbekannt'),
-                'direction': edge_data.get('direction', 'Unbekannt'),
-                'trip_id': next_trip,
-                'transfer': transfer_needed
-            }
+        # Fußwege: nur am Start oder nach einer Fahrt (keine Ketten aus mehreren Fußwegen)
+        if transfer_model is not None and (curr_trip is not None or node is None):
+            for next_stop, duration in get_footpaths(transfer_model, curr_stop):
+                if next_stop not in G.nodes:
+                    continue
+                transfer_needed = curr_trip is not None
+                new_transfers = transfers + 1 if transfer_needed else transfers
+                if not _admit_label(visited, (next_stop, None), new_transfers, max_transfers, labels_per_state):
+                    continue
+                leg = make_walk_leg(curr_stop, next_stop, duration, transfer_needed)
+                queue.append((next_stop, None, new_transfers, (node, leg, depth + 1)))
 
-            queue.append((next_stop, next_trip, new_transfers, path + [leg]))
 
-    return []
+def _admit_label(visited, state, transfers, max_transfers, labels_per_state=1):
+    """
+    Nimmt eine neue Ankunft an einem Zustand (Haltestelle, trip) in die Breitensuche auf, wenn das
+    Umstiegslimit eingehalten ist und der Zustand noch Platz hat oder mit weniger Umstiegen erreicht wird.
+    Da die Suche nach Tiefe geordnet ist, sind spätere Ankünfte nie kürzer -> nur weniger Umstiege zählen.
+    """
+    if transfers > max_transfers:
+        return False
+    label = visited.get(state)
+    if label is None:
+        visited[state] = [1, transfers]
+        return True
+    if label[0] >= labels_per_state and transfers >= label[1]:
+        return False
+    label[0] += 1
+    label[1] = min(label[1], transfers)
+    return True
+
+
+def path_from_node(node):
+    """
+    Baut aus einem Suchknoten (Vorgänger, Leg, Tiefe) die Liste der Legs vom Start bis zum Knoten.
+    """
+    path = []
+    while node is not None:
+        node, leg, _ = node
+        path.append(leg)
+    path.reverse()
+    return path
+
+
+def make_ride_leg(from_stop, to_stop, edge_data, transfer=False):
+    """
+    Baut ein Leg für eine Fahrt auf einer Kante des Transit-Graphen.
+    Enthält nur die Codes der Kante ('trip', 'edge'); Linienname, Richtung und trip_id
+    setzt erst decode_itinerary bei der Ausgabe ein.
+    """
+    return {
+        'from_stop': from_stop,
+        'to_stop': to_stop,
+        'trip': edge_data['trip'],
+        'edge': edge_data['edge'],
+        'transfer': transfer
+    }
+
+
+def decode_itinerary(G, itinerary):
+    """
+    Löst die Codes der Fahrt-Legs aus dem topologischen Router in lesbare Legs auf
+    ('route_name', 'direction', 'trip_id' aus den Tabellen in G.graph). Andere Legs bleiben unverändert.
+    """
+    decoded = []
+    for leg in itinerary:
+        if 'edge' not in leg:
+            decoded.append(leg)
+            continue
+        edge = leg['edge']
+        decoded.append({
+            'from_stop': leg['from_stop'],
+            'to_stop': leg['to_stop'],
+            'route_name': G.graph['route_names'][G.graph['edge_route'][edge]],
+            'direction': G.graph['headsigns'][G.graph['edge_headsign'][edge]],
+            'trip_id': G.graph['trip_ids'][leg['trip']],
+            'transfer': leg['transfer'],
+        })
+    return decoded
+
+
+def make_walk_leg(from_stop, to_stop, duration, transfer=False, departure=None):
+    """
+    Baut ein Leg für einen Fußweg im selben Format wie die Fahrt-Legs.
+    """
+    minutes = max(1, round(duration / 60))
+    leg = {
+        'from_stop': from_stop,
+        'to_stop': to_stop,
+        'route_name': 'Fußweg',
+        'direction': f"{minutes} min zu Fuß",
+        'trip_id': None,
+        'transfer': transfer,
+        'walk': True,
+        'duration': duration,
+    }
+    if departure is not None:
+        leg['departure_time'] = seconds_to_time_str(departure)
+        leg['arrival_time'] = seconds_to_time_str(departure + duration)
+    return leg
+
+
+def plan_route_timed(timetable, start_stop, end_stop, dep_time, transfer_model=None, search_hours=6,
+                     goal_bounds=None, stats=None, cancel_token=None):
+    """
+    Zeitabhängige Routenplanung (Connection Scan) mit Mindestumstiegszeiten und Fußwegen.
+    timetable: Ergebnis von build_timetable, transfer_model: Ergebnis von build_transfer_model.
+    goal_bounds: optional aus build_goal_bounds -> Verbindungen, die das Ziel nicht mehr früher erreichen
+    können, werden übersprungen (A*-artiges Pruning, gleiches Ergebnis).
+    stats: optionales dict, wird mit 'scanned_connections' und 'label_updates' gefüllt.
+    cancel_token: wird je Block von Verbindungen geprüft -> SearchCancelled bei Abbruch.
+    Liefert die Verbindung mit der frühesten Ankunft als Liste von Legs (inkl. Abfahrts-/Ankunftszeit).
+    """
+    return plan_route_timed_multi(timetable, [(start_stop, 0)], [(end_stop, 0)], dep_time, transfer_model,
+                                  search_hours, goal_bounds, stats, cancel_token)
+
+
+def plan_route_timed_multi(timetable, origins, destinations, dep_time, transfer_model=None, search_hours=6,
+                           goal_bounds=None, stats=None, cancel_token=None):
+    """
+    Connection Scan mit mehreren Starts und Zielen, je mit Gehzeit (z.B. aus der Zugangstabelle einer Adresse).
+    origins/destinations: Listen von (stop_id, Gehzeit in Sekunden). Optimiert wird die Ankunft
+    am Ziel inklusive Gehzeit ab der Zielhaltestelle. Legs wie bei plan_route_timed.
+    """
+    stop_index = timetable['stop_index']
+    sources = {}
+    for stop, walk in origins:
+        if stop in stop_index:
+            sources[stop_index[stop]] = min(walk, sources.get(stop_index[stop], walk))
+    egress = {}
+    for stop, walk in destinations:
+        if stop in stop_index:
+            egress[stop_index[stop]] = min(walk, egress.get(stop_index[stop], walk))
+    if not sources or not egress:
+        return []
+    departure = time_to_seconds(dep_time)
+
+    n = len(timetable['stop_ids'])
+    if transfer_model is not None:
+        offsets = transfer_model['offsets']
+        foot_targets = transfer_model['targets']
+        foot_durations = transfer_model['durations']
+        min_change = transfer_model['min_change_time']
+    else:
+        offsets = None
+        min_change = None
+
+    if goal_bounds is not None:
+        # Schranke zur nächsten Zielhaltestelle (Minimum über alle Ziele inkl. Gehzeit bleibt zulässig)
+        lower_bound = None
+        for target, walk in egress.items():
+            bound = [b + walk for b in lower_bounds_to(goal_bounds, timetable, target)]
+            lower_bound = bound if lower_bound is None else list(map(min, lower_bound, bound))
+    else:
+        lower_bound = [0] * n
+    egress_time = [INFINITY] * n
+    for target, walk in egress.items():
+        egress_time[target] = walk
+    best = INFINITY             # früheste Ankunft am Ziel inkl. Gehzeit
+    scanned = 0
+    updates = 0
+
+    arrival = [INFINITY] * n    # früheste Ankunft je Haltestelle
+    ready = [INFINITY] * n      # frühester Zeitpunkt zum Einsteigen in eine andere Fahrt
+    journey = [None] * n        # (Einstiegs-Connection, Ausstiegs-Connection) oder ('walk', von, Dauer)
+    trip_board = {}             # Fahrt -> Connection, an der eingestiegen wurde
+
+    def relax_footpaths(stop, time):
+        nonlocal updates, best
+        if offsets is None:
+            return
+        for k in range(offsets[stop], offsets[stop + 1]):
+            other = int(foot_targets[k])
+            walk_arrival = time + int(foot_durations[k])
+            if walk_arrival < arrival[other] and walk_arrival + lower_bound[other] < best:
+                updates += 1
+                arrival[other] = walk_arrival
+                ready[other] = walk_arrival
+                journey[other] = ('walk', stop, int(foot_durations[k]))
+                best = min(best, walk_arrival + egress_time[other])
+
+    for source, walk in sources.items():
+        arrival[source] = ready[source] = departure + walk
+        best = min(best, arrival[source] + egress_time[source])
+    for source in sorted(sources, key=sources.get):
+        relax_footpaths(source, arrival[source])
+
+    conn_dep = timetable['conn_dep']
+    limit = departure + search_hours * 3600
+    start = int(conn_dep.searchsorted(departure, 'left'))
+
+    # Taktfahrten: je Vorlagen-Connection ein Eintrag im Heap mit der nächsten Abfahrt.
+    # Die Abfahrten werden erst beim Scan erzeugt -> Speicher unabhängig von der Taktdichte.
+    virtual = _frequency_heap(timetable, departure, limit)
+    template_from = timetable['template_from'].tolist() if virtual else None
+    template_to = timetable['template_to'].tolist() if virtual else None
+
+    def scan_virtual(until_dep, until_arr):
+        # Takt-Connections bis (until_dep, until_arr) in Abfahrtsreihenfolge einmischen
+        nonlocal scanned, updates, best
+        while virtual and virtual[0][:2] <= (until_dep, until_arr):
+            c_dep, c_arr, row, k, j = virtual[0]
+            if c_dep >= best or c_dep > limit:
+                virtual.clear()
+                break
+            headway = int(timetable['freq_headway'][row])
+            if (j + 1) * headway < timetable['freq_end'][row] - timetable['freq_start'][row]:
+                heapq.heapreplace(virtual, (c_dep + headway, c_arr + headway, row, k, j + 1))
+            else:
+                heapq.heappop(virtual)
+            scanned += 1
+            trip = (row, j)
+            from_stop, to = template_from[k], template_to[k]
+            if trip not in trip_board:
+                if ready[from_stop] > c_dep or c_dep + lower_bound[from_stop] >= best:
+                    continue
+                trip_board[trip] = k
+            if c_arr < arrival[to] and c_arr + lower_bound[to] < best:
+                updates += 1
+                arrival[to] = c_arr
+                best = min(best, c_arr + egress_time[to])
+                change = int(min_change[to]) if min_change is not None else 0
+                ready[to] = min(ready[to], c_arr + change)
+                journey[to] = ('freq', row, j, trip_board[trip], k)
+                relax_footpaths(to, c_arr)
+        return virtual[0][0] if virtual else INFINITY
+
+    next_virtual = virtual[0][0] if virtual else INFINITY
+    total = len(conn_dep)
+
+    for chunk_start in range(start, total, SCAN_CHUNK):
+        if cancel_token is not None:
+            cancel_token.check()
+        chunk_end = min(chunk_start + SCAN_CHUNK, total)
+        deps = conn_dep[chunk_start:chunk_end].tolist()
+        arrs = timetable['conn_arr'][chunk_start:chunk_end].tolist()
+        froms = timetable['conn_from'][chunk_start:chunk_end].tolist()
+        tos = timetable['conn_to'][chunk_start:chunk_end].tolist()
+        trips = timetable['conn_trip'][chunk_start:chunk_end].tolist()
+        done = False
+        for k in range(chunk_end - chunk_start):
+            c_dep = deps[k]
+            if c_dep >= next_virtual:
+                next_virtual = scan_virtual(c_dep, arrs[k])
+            if c_dep >= best or c_dep > limit:
+                done = True
+                break
+            scanned += 1
+            trip = trips[k]
+            if trip not in trip_board:
+                if ready[froms[k]] > c_dep or c_dep + lower_bound[froms[k]] >= best:
+                    continue
+                trip_board[trip] = chunk_start + k
+            c_arr = arrs[k]
+            to = tos[k]
+            # Pruning: auch mit der optimistischen Restzeit wäre das Ziel nicht früher erreichbar
+            if c_arr < arrival[to] and c_arr + lower_bound[to] < best:
+                updates += 1
+                arrival[to] = c_arr
+                best = min(best, c_arr + egress_time[to])
+                change = int(min_change[to]) if min_change is not None else 0
+                ready[to] = min(ready[to], c_arr + change)
+                journey[to] = (trip_board[trip], chunk_start + k)
+                relax_footpaths(to, c_arr)
+        if done:
+            break
+    scan_virtual(INFINITY, INFINITY)
+
+    if stats is not None:
+        stats['scanned_connections'] = scanned
+        stats['label_updates'] = updates
+    if best == INFINITY:
+        return []
+    target = min(egress, key=lambda stop: (arrival[stop] + egress[stop], egress[stop]))
+    return _reconstruct_timed_journey(timetable, journey, target, arrival)
+
+
+def _frequency_heap(timetable, departure, limit):
+    """
+    Start-Heap für die Taktfahrten: je (Takt, Vorlagen-Connection) die erste Abfahrt ab departure
+    als (Abfahrt, Ankunft, Takt, Connection, Nummer der Fahrt im Takt).
+    """
+    heap = []
+    template_offsets = timetable['template_offsets']
+    template_dep = timetable['template_dep']
+    template_arr = timetable['template_arr']
+    for row, (trip, start, end, headway) in enumerate(zip(timetable['freq_trip'].tolist(), timetable['freq_start'].tolist(),
+                                                          timetable['freq_end'].tolist(), timetable['freq_headway'].tolist())):
+        for k in range(int(template_offsets[trip]), int(template_offsets[trip + 1])):
+            offset = int(template_dep[k])
+            j = max(0, -(-(departure - start - offset) // headway))
+            if start + j * headway < end and start + j * headway + offset <= limit:
+                heap.append((start + j * headway + offset, start + j * headway + int(template_arr[k]), row, k, j))
+    heapq.heapify(heap)
+    return heap
+
+
+def _reconstruct_timed_journey(timetable, journey, target, arrival):
+    """
+    Baut aus den Journey-Zeigern der Connection-Scan-Suche die Legs (Start -> Ziel).
+    Die Kette endet an einer Starthaltestelle (ohne Journey-Zeiger).
+    """
+    stop_ids = timetable['stop_ids']
+    parts = []
+    current = target
+    while journey[current] is not None:
+        entry = journey[current]
+        if entry[0] == 'walk':
+            _, previous, duration = entry
+            parts.append(('walk', previous, current, duration))
+            current = previous
+        elif entry[0] == 'freq':
+            parts.append(entry)
+            current = int(timetable['template_from'][entry[3]])
+        else:
+            board, alight = entry
+            parts.append(('ride', board, alight))
+            current = int(timetable['conn_from'][board])
+    parts.reverse()
+
+    itinerary = []
+    for index, part in enumerate(parts):
+        transfer = index > 0
+        if part[0] == 'walk':
+            _, previous, current, duration = part
+            itinerary.append(make_walk_leg(stop_ids[previous], stop_ids[current], duration, transfer,
+                                           departure=arrival[current] - duration))
+            continue
+        if part[0] == 'freq':
+            _, row, j, board, alight = part
+            trip = int(timetable['freq_trip'][row])
+            base = int(timetable['freq_start'][row]) + j * int(timetable['freq_headway'][row])
+            for c in range(board, alight + 1):
+                itinerary.append({
+                    'from_stop': stop_ids[timetable['template_from'][c]],
+                    'to_stop': stop_ids[timetable['template_to'][c]],
+                    'route_name': timetable['trip_route_name'][trip],
+                    'direction': timetable['trip_headsign'][trip],
+                    'trip_id': timetable['trip_ids'][trip],
+                    'transfer': transfer,
+                    'departure_time': seconds_to_time_str(base + int(timetable['template_dep'][c])),
+                    'arrival_time': seconds_to_time_str(base + int(timetable['template_arr'][c])),
+                })
+                transfer = False
+            continue
+        _, board, alight = part
+        trip = int(timetable['conn_trip'][board])
+        for c in trip_connections(timetable, trip, int(timetable['conn_pos'][board]), int(timetable['conn_pos'][alight])):
+            itinerary.append({
+                'from_stop': stop_ids[timetable['conn_from'][c]],
+                'to_stop': stop_ids[timetable['conn_to'][c]],
+                'route_name': timetable['trip_route_name'][trip],
+                'direction': timetable['trip_headsign'][trip],
+                'trip_id': timetable['trip_ids'][trip],
+                'transfer': transfer,
+                'departure_time': seconds_to_time_str(timetable['conn_dep'][c]),
+                'arrival_time': seconds_to_time_str(timetable['conn_arr'][c]),
+            })
+            transfer = False
+    return itinerary
@@ -0,0 +1,112 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+
+# Standardwerte für die Suchaufträge der GUI
+DEFAULT_WORKERS = 1         # Anzahl gleichzeitig rechnender Suchen
+DEFAULT_TIMEOUT = 30        # Sekunden bis eine Suche automatisch abgebrochen wird
+
+
+class SearchCancelled(Exception):
+    """
+    Wird im Router ausgelöst, wenn eine Suche abgebrochen oder ihre Deadline überschritten wurde.
+    """
+
+
+class CancelToken:
+    """
+    Kooperatives Abbruch-Signal für eine Suche (mit optionaler Deadline).
+    Der Router ruft regelmäßig check() auf.
+    """
+    def __init__(self, timeout=None):
+        self._event = threading.Event()
+        self.deadline = time.monotonic() + timeout if timeout else None
+
+    def cancel(self):
+        self._event.set()
+
+    def is_cancelled(self):
+        if self._event.is_set():
+            return True
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self._event.set()
+            return True
+        return False
+
+    def check(self):
+        if self.is_cancelled():
+            raise SearchCancelled("Suche abgebrochen")
+
+
+class SearchScheduler:
+    """
+    Führt Suchaufträge in einem begrenzten Thread-Pool aus.
+    Ein neuer Auftrag ersetzt alle vorherigen: wartende werden verworfen, laufende per Token abgebrochen.
+    Nur das Ergebnis des neuesten Auftrags wird an on_done übergeben.
+    """
+    def __init__(self, max_workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='routensuche')
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._current = None    # (Future, CancelToken) des neuesten Auftrags
+
+    def submit(self, fn, *args, on_done=None, timeout=None, **kwargs):
+        """
+        Startet fn(*args, cancel_token=token, **kwargs) im Pool.
+        on_done(result, error) wird nur für den neuesten Auftrag aufgerufen (im Worker-Thread).
+        """
+        token = CancelToken(timeout if timeout is not None else self._timeout)
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            previous = self._current
+            future = self._executor.submit(self._run, token, fn, args, kwargs)
+            self._current = (future, token)
+        # Außerhalb des Locks abbrechen: Future.cancel() ruft die Callbacks sofort auf
+        self._cancel(previous)
+
+        def finished(done_future):
+            with self._lock:
+                if generation != self._generation:
+                    return  # überholt -> Ergebnis verwerfen
+            if on_done is None:
+                return
+            # Nur das Ergebnis im try holen: Fehler im Callback selbst dürfen ihn nicht ein zweites Mal auslösen
+            result = error = None
+            try:
+                result = done_future.result()
+            except CancelledError:
+                error = SearchCancelled("Suche abgebrochen")
+            except Exception as e:
+                error = e
+            on_done(result, error)
+
+        future.add_done_callback(finished)
+        return token
+
+    def _run(self, token, fn, args, kwargs):
+        token.check()   # Auftrag wurde überholt, bevor er starten konnte
+        return fn(*args, cancel_token=token, **kwargs)
+
+    @staticmethod
+    def _cancel(job):
+        if job is not None:
+            future, token = job
+            token.cancel()
+            future.cancel()     # greift nur, wenn der Auftrag noch wartet
+
+    def cancel(self):
+        """
+        Bricht den aktuellen Auftrag ab. Sein on_done wird nicht mehr aufgerufen
+        (Rückmeldung an den Nutzer gibt der Aufrufer direkt).
+        """
+        with self._lock:
+            self._generation += 1
+            current = self._current
+            self._current = None
+        self._cancel(current)
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+import networkx as nx
+
+
+def build_serving_index(gtfs, transfer_model=None):
+    """
+    Baut aus stop_times einen Index, welche Linienverläufe (Route-Patterns = gleiche Haltfolge)
+    eine Haltestelle bedienen und welche Haltestellen von dort ohne Umstieg erreichbar sind.
+    Zusätzlich wird die Erreichbarkeit mit Umstiegen (inkl. Fußwegen aus transfer_model) über die
+    starken Zusammenhangskomponenten vorberechnet -> can_reach(a, b) ist ein Bit-Test.
+    Die Bitmatrix (np.uint8, ein Bit je Komponente) enthält nur Komponenten mit Haltestellen, an denen
+    Fahrten oder Fußwege beginnen bzw. enden; isolierte Haltestellen erreichen nur sich selbst.
+    Ersetzt die Richtungs-Heuristik über stop_id-Endungen (':1:1', ':2:2', ...).
+    """
+    stops = gtfs['stops']
+    known = set(stops['stop_id'])
+    stop_times = gtfs['stop_times'][['trip_id', 'stop_id', 'stop_sequence']]
+    stop_times = stop_times.assign(stop_sequence=pd.to_numeric(stop_times['stop_sequence'], errors='coerce'))
+    stop_times = stop_times[stop_times['stop_id'].isin(known)].dropna(subset=['stop_sequence'])
+    stop_times = stop_times.sort_values(['trip_id', 'stop_sequence'], kind='stable')
+
+    # Linienverläufe: Fahrten mit identischer Haltfolge zusammenfassen
+    trip_route = dict(zip(gtfs['trips']['trip_id'], gtfs['trips']['route_id'])) if 'trips' in gtfs else {}
+    pattern_ids = {}
+    patterns = []
+    pattern_routes = []
+    for trip_id, trip_stops in stop_times.groupby('trip_id', sort=False)['stop_id']:
+        sequence = tuple(trip_stops)
+        if len(sequence) < 2:
+            continue
+        pattern = pattern_ids.get(sequence)
+        if pattern is None:
+            pattern = pattern_ids[sequence] = len(patterns)
+            patterns.append(sequence)
+            pattern_routes.append(set())
+        route_id = trip_route.get(trip_id)
+        if route_id is not None:
+            pattern_routes[pattern].add(route_id)
+
+    stop_patterns = {}
+    downstream = {}
+    upstream = {}
+    for pattern, sequence in enumerate(patterns):
+        for position, stop_id in enumerate(sequence):
+            stop_patterns.setdefault(stop_id, []).append((pattern, position))
+            downstream.setdefault(stop_id, set()).update(sequence[position + 1:])
+            upstream.setdefault(stop_id, set()).update(sequence[:position])
+
+    # Erreichbarkeit mit Umstiegen: Kondensation des Haltestellengraphen (Fahrten + Fußwege) zu einem DAG
+    graph = nx.DiGraph()
+    graph.add_nodes_from(known)
+    for sequence in patterns:
+        graph.add_edges_from(zip(sequence[:-1], sequence[1:]))
+    if transfer_model is not None:
+        stop_ids = transfer_model['stop_ids']
+        offsets = transfer_model['offsets']
+        sources = np.repeat(np.arange(len(stop_ids)), np.diff(offsets))
+        graph.add_edges_from((stop_ids[i], stop_ids[j]) for i, j in zip(sources.tolist(), transfer_model['targets'].tolist()))
+    condensed = nx.condensation(graph)
+    component = condensed.graph['mapping']
+    connected = np.zeros(condensed.number_of_nodes(), dtype=bool)
+    connected[[component[stop_id] for stop_id in graph if graph.degree(stop_id)]] = True
+    # Komponente -> Zeile/Spalte der Bitmatrix (-1 = isoliert)
+    component_index = np.full(len(connected), -1, dtype=np.int64)
+    component_index[connected] = np.arange(int(connected.sum()))
+    count = int(connected.sum())
+    rows = np.zeros((len(connected), (count + 7) // 8), dtype=np.uint8)
+    for c in reversed(list(nx.topological_sort(condensed))):
+        row = rows[c]
+        k = component_index[c]
+        if k >= 0:
+            row[k >> 3] |= np.uint8(1 << (k & 7))
+        for successor in condensed.successors(c):
+            np.bitwise_or(row, rows[successor], out=row)
+    reachable = rows[connected]
+
+    # Steige derselben Station (parent_station) für die Richtungsvarianten
+    station_stops = {}
+    if 'parent_station' in stops.columns:
+        for parent, members in stops.dropna(subset=['parent_station']).groupby('parent_station')['stop_id']:
+            group = tuple(members)
+            for stop_id in group:
+                station_stops[stop_id] = group
+            station_stops.setdefault(parent, group)
+
+    print(f"Bedienungsindex erstellt: {len(patterns)} Linienverläufe, {len(reachable)} verbundene Zusammenhangskomponenten")
+    return {
+        'patterns': patterns,
+        'pattern_routes': [sorted(routes, key=str) for routes in pattern_routes],
+        'stop_patterns': stop_patterns,
+        'downstream': {stop_id: frozenset(s) for stop_id, s in downstream.items()},
+        'upstream': {stop_id: frozenset(s) for stop_id, s in upstream.items()},
+        'component': component,
+        'component_index': component_index,
+        'reachable': reachable,
+        'station_stops': station_stops,
+    }
+
+
+def direct_connection(serving_index, start_stop, end_stop):
+    """
+    True, wenn mindestens ein Linienverlauf von start_stop ohne Umstieg nach end_stop fährt.
+    """
+    return end_stop in serving_index['downstream'].get(start_stop, ())
+
+
+def can_reach(serving_index, start_stop, end_stop):
+    """
+    False, wenn end_stop von start_stop aus mit keiner Kombination aus Fahrten und Fußwegen erreichbar ist.
+    (True heißt nur "nicht ausgeschlossen": Umstiegs- und Tiefenlimits der Suche gelten zusätzlich.)
+    """
+    component = serving_index['component']
+    if start_stop not in component or end_stop not in component:
+        return False
+    row = serving_index['component_index'][component[start_stop]]
+    k = serving_index['component_index'][component[end_stop]]
+    if row < 0 or k < 0:
+        return start_stop == end_stop
+    return bool(serving_index['reachable'][row, k >> 3] >> (k & 7) & 1)
+
+
+def rank_stop_pairs(serving_index, start_ids, end_ids):
+    """
+    Filtert Kandidatenpaare (Start-Steig, Ziel-Steig) auf verbindbare Paare.
+    Reihenfolge: Direktverbindungen zuerst, dann Paare, die nur mit Umstieg erreichbar sind.
+    """
+    direct = []
+    other = []
+    for start_stop in start_ids:
+        for end_stop in end_ids:
+            if start_stop == end_stop or not can_reach(serving_index, start_stop, end_stop):
+                continue
+            if direct_connection(serving_index, start_stop, end_stop):
+                direct.append((start_stop, end_stop))
+            else:
+                other.append((start_stop, end_stop))
+    return direct + other
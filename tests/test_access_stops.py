@@ -0,0 +1,26 @@
+import pandas as pd
+from access_stops import build_access_table, load_access_table, access_stops_for_address
+
+STOPS = pd.DataFrame({
+    'stop_id': ['S', 'S:1', 'S:2', 'X'],
+    'stop_name': ['Station', 'Station Steig 1', 'Station Steig 2', 'Ohne Fahrten'],
+    'stop_lat': [49.0, 49.0001, 49.0002, 49.0],
+    'stop_lon': [8.4, 8.4, 8.4, 8.4001],
+    'location_type': [1, 0, None, 0],
+})
+ADDRESSES = pd.DataFrame({'full_address': ['Hauptstraße 1'], 'lat': [49.0], 'lon': [8.4]})
+
+
+def test_stations_are_skipped_even_if_served(tmp_path):
+    # Auch wenn die Station in served_stops steht, bekommt sie keinen Zugangsplatz
+    filename = str(tmp_path / 'access.npz')
+    build_access_table(ADDRESSES, STOPS, k=5, served_stops={'S', 'S:1', 'S:2'}, filename=filename)
+    access = access_stops_for_address(load_access_table(filename), 'Hauptstraße 1')
+    assert [stop_id for stop_id, _ in access] == ['S:1', 'S:2']
+
+
+def test_without_served_stops_only_platforms(tmp_path):
+    filename = str(tmp_path / 'access.npz')
+    build_access_table(ADDRESSES, STOPS, k=5, filename=filename)
+    access = access_stops_for_address(load_access_table(filename), 'Hauptstraße 1')
+    assert sorted(stop_id for stop_id, _ in access) == ['S:1', 'S:2', 'X']
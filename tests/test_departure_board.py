@@ -0,0 +1,51 @@
+from datetime import date, datetime
+import pandas as pd
+from departure_board import build_departure_index, departure_board
+
+
+def _feed():
+    # TF fährt laut frequencies.txt 08:00-09:00 alle 10 Minuten, die stop_times sind nur die Vorlage
+    return {
+        'stops': pd.DataFrame({'stop_id': ['C1', 'C2'], 'stop_name': ['C1', 'C2']}),
+        'routes': pd.DataFrame({'route_id': ['R'], 'route_short_name': ['1'], 'route_long_name': ['Linie 1']}),
+        'trips': pd.DataFrame({'route_id': ['R', 'R'], 'service_id': ['WD', 'WD'], 'trip_id': ['T1b', 'TF'],
+                               'trip_headsign': ['C2', 'C2']}),
+        'stop_times': pd.DataFrame({
+            'trip_id': ['T1b', 'T1b', 'TF', 'TF'],
+            'arrival_time': ['08:15:00', '08:20:00', '00:00:00', '00:05:00'],
+            'departure_time': ['08:15:00', '08:20:00', '00:00:00', '00:05:00'],
+            'stop_id': ['C1', 'C2', 'C1', 'C2'],
+            'stop_sequence': [1, 2, 1, 2],
+        }),
+        'calendar': pd.DataFrame({'service_id': ['WD'], 'monday': [1], 'tuesday': [1], 'wednesday': [1],
+                                  'thursday': [1], 'friday': [1], 'saturday': [1], 'sunday': [1],
+                                  'start_date': [date(2026, 1, 1)], 'end_date': [date(2026, 12, 31)]}),
+        'frequencies': pd.DataFrame({'trip_id': ['TF'], 'start_time': ['08:00:00'], 'end_time': ['09:00:00'],
+                                     'headway_secs': [600]}),
+    }
+
+
+def test_frequency_trip_departures_on_board():
+    index = build_departure_index(_feed())
+    board = departure_board(index, 'C1', now=datetime(2026, 10, 19, 8, 11), count=4)
+    assert [(entry['time'], entry['trip_id']) for entry in board] == [
+        ('08:15', 'T1b'), ('08:20', 'TF'), ('08:30', 'TF'), ('08:40', 'TF')]
+
+
+def test_frequency_template_is_not_a_departure():
+    index = build_departure_index(_feed())
+    board = departure_board(index, 'C1', now=datetime(2026, 10, 19, 0, 0), count=3)
+    assert [(entry['time'], entry['trip_id']) for entry in board] == [
+        ('08:00', 'TF'), ('08:10', 'TF'), ('08:15', 'T1b')]
+    # Kein Takt um 09:00 (Ende exklusiv) -> nächste Abfahrten erst am Folgetag
+    board = departure_board(index, 'C1', now=datetime(2026, 10, 19, 8, 51), count=3)
+    assert [entry['time'] for entry in board] == ['08:00', '08:10', '08:15']
+
+
+def test_delay_rounds_toward_zero():
+    # 30 s zu früh ist keine Minute zu früh, 90 s Verspätung ist +1
+    index = build_departure_index(_feed())
+    board = departure_board(index, 'C1', now=datetime(2026, 10, 19, 8, 11), count=2, delays={'T1b': -30, 'TF': 90})
+    assert [(entry['trip_id'], entry['delay']) for entry in board] == [('TF', 1), ('T1b', 0)]
+    board = departure_board(index, 'C1', now=datetime(2026, 10, 19, 8, 11), count=1, delays={'T1b': -90})
+    assert [(entry['scheduled'], entry['delay']) for entry in board] == [('08:15', -1)]
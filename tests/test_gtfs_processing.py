@@ -0,0 +1,89 @@
+import pandas as pd
+import pytest
+from gtfs_processing import build_transit_graph, update_transit_graph
+
+
+def _feed():
+    # Linie 1: A-B-C-D (zwei Fahrten), Linie 2: B-E-D, Linie 3 teilt sich B-C mit Linie 1
+    trips = {'L1a': ('R1', ['A', 'B', 'C', 'D'], 8), 'L1b': ('R1', ['A', 'B', 'C', 'D'], 9),
+             'L2a': ('R2', ['B', 'E', 'D'], 8), 'L3a': ('R3', ['B', 'C'], 10)}
+    rows = [(trip_id, f'{hour:02d}:{5 * k:02d}:00', f'{hour:02d}:{5 * k:02d}:00', stop_id, k + 1)
+            for trip_id, (_, trip_stops, hour) in trips.items() for k, stop_id in enumerate(trip_stops)]
+    return {
+        'stops': pd.DataFrame({'stop_id': list('ABCDE'), 'stop_name': [f'Halt {s}' for s in 'ABCDE']}),
+        'routes': pd.DataFrame({'route_id': ['R1', 'R2', 'R3'], 'route_short_name': ['1', '2', '3'],
+                                'route_long_name': ['Linie 1', 'Linie 2', 'Linie 3']}),
+        'trips': pd.DataFrame({'route_id': [route for route, _, _ in trips.values()],
+                               'service_id': ['WD'] * len(trips), 'trip_id': list(trips),
+                               'trip_headsign': [trip_stops[-1] for _, trip_stops, _ in trips.values()]}),
+        'stop_times': pd.DataFrame(rows, columns=['trip_id', 'arrival_time', 'departure_time', 'stop_id',
+                                                  'stop_sequence']),
+    }
+
+
+def _decoded(G):
+    # Nachbarn je Haltestelle mit aufgelösten Kantendaten (Reihenfolge wie im Graphen)
+    graph = G.graph
+    return {stop_id: (G.nodes[stop_id]['name'],
+                      [(next_stop, graph['trip_ids'][data['trip']], int(graph['edge_dep'][data['edge']]),
+                        int(graph['edge_arr'][data['edge']]), graph['route_names'][graph['edge_route'][data['edge']]],
+                        graph['headsigns'][graph['edge_headsign'][data['edge']]])
+                       for next_stop, data in G[stop_id].items()])
+            for stop_id in G.nodes}
+
+
+def _change_trip(gtfs):
+    stop_times = gtfs['stop_times'].copy()
+    later = stop_times['trip_id'] == 'L3a'
+    stop_times.loc[later, ['arrival_time', 'departure_time']] = [['11:00:00', '11:00:00'], ['11:07:00', '11:07:00']]
+    return dict(gtfs, stop_times=stop_times)
+
+
+def _add_trip(gtfs):
+    trips = pd.concat([gtfs['trips'], pd.DataFrame({'route_id': ['R2'], 'service_id': ['WD'], 'trip_id': ['L2b'],
+                                                     'trip_headsign': ['A']})], ignore_index=True)
+    stop_times = pd.concat([gtfs['stop_times'], pd.DataFrame(
+        [('L2b', '12:00:00', '12:00:00', 'E', 1), ('L2b', '12:04:00', '12:04:00', 'A', 2)],
+        columns=gtfs['stop_times'].columns)], ignore_index=True)
+    return dict(gtfs, trips=trips, stop_times=stop_times)
+
+
+def _remove_trip(gtfs):
+    return dict(gtfs, trips=gtfs['trips'][gtfs['trips']['trip_id'] != 'L1b'],
+                stop_times=gtfs['stop_times'][gtfs['stop_times']['trip_id'] != 'L1b'])
+
+
+def _remove_stop(gtfs):
+    return dict(gtfs, stops=gtfs['stops'][gtfs['stops']['stop_id'] != 'C'])
+
+
+def _rename_route(gtfs):
+    routes = gtfs['routes'].copy()
+    routes.loc[routes['route_id'] == 'R2', 'route_long_name'] = 'Linie 2 (Umleitung)'
+    return dict(gtfs, routes=routes)
+
+
+@pytest.mark.parametrize('mutate', [_change_trip, _add_trip, _remove_trip, _remove_stop, _rename_route])
+def test_update_matches_full_build(mutate):
+    old = _feed()
+    new = mutate(old)
+    G = build_transit_graph(old)
+    before = _decoded(G)
+    updated = update_transit_graph(G, new)
+    expected = _decoded(build_transit_graph(new))
+    assert updated is not G and _decoded(updated) == expected
+    assert before != expected and _decoded(G) == before     # Änderung kommt an, alter Graph bleibt unverändert
+
+
+def test_update_without_changes_keeps_graph():
+    G = build_transit_graph(_feed())
+    assert update_transit_graph(G, _feed()) is G
+
+
+def test_chained_updates_match_full_build():
+    gtfs = _feed()
+    G = build_transit_graph(gtfs)
+    for mutate in (_add_trip, _change_trip, _remove_stop, _rename_route, _remove_trip):
+        gtfs = mutate(gtfs)
+        G = update_transit_graph(G, gtfs)
+        assert _decoded(G) == _decoded(build_transit_graph(gtfs))
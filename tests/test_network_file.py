@@ -0,0 +1,118 @@
+import multiprocessing
+import os
+from datetime import date
+import pandas as pd
+import pytest
+from gtfs_processing import build_transit_graph
+from network_file import load_network_file, route_many_shared, save_network_file
+from routing import decode_itinerary, plan_route_timed, plan_route_with_transfers_ignore_time
+from timetable import build_timetable
+from transfers import build_transfer_model, get_footpaths
+
+
+def _feed():
+    # Linie 1: A-B-C, Linie 2: B-D-E, Linie 3: C-E
+    stops = ['A', 'B', 'C', 'D', 'E']
+    trips = {'L1a': ('R1', ['A', 'B', 'C']), 'L2a': ('R2', ['B', 'D', 'E']), 'L3a': ('R3', ['C', 'E']),
+             'L1b': ('R1', ['C', 'B', 'A'])}
+    stop_times = [(trip_id, f'08:{10 * k:02d}:00', stop_id, k + 1)
+                  for trip_id, (_, trip_stops) in trips.items() for k, stop_id in enumerate(trip_stops)]
+    return {
+        'stops': pd.DataFrame({'stop_id': stops, 'stop_name': [f'Halt {s}' for s in stops],
+                               'stop_lat': [49.0 + 0.01 * i for i in range(5)], 'stop_lon': [8.4] * 5}),
+        'routes': pd.DataFrame({'route_id': ['R1', 'R2', 'R3'], 'route_short_name': ['1', '2', '3'],
+                                'route_long_name': ['Linie 1', 'Linie 2', 'Linie 3']}),
+        'trips': pd.DataFrame({'route_id': [route for route, _ in trips.values()], 'service_id': ['WD'] * len(trips),
+                               'trip_id': list(trips), 'trip_headsign': [s[-1] for _, s in trips.values()]}),
+        'stop_times': pd.DataFrame(
+            [(trip_id, t, t, stop_id, seq) for trip_id, t, stop_id, seq in stop_times],
+            columns=['trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence']),
+        'calendar': pd.DataFrame({'service_id': ['WD'], 'monday': [1], 'tuesday': [1], 'wednesday': [1],
+                                  'thursday': [1], 'friday': [1], 'saturday': [1], 'sunday': [1],
+                                  'start_date': [date(2026, 1, 1)], 'end_date': [date(2026, 12, 31)]}),
+    }
+
+
+def test_shared_topological_routes_match_in_process(tmp_path):
+    gtfs = _feed()
+    graph = build_transit_graph(gtfs)
+    model = build_transfer_model(gtfs['stops'], None)
+    filename = str(tmp_path / 'network.bin')
+    save_network_file(filename, graph=graph, transfer_model=model)
+
+    queries = [(a, b, None) for a in graph.nodes for b in graph.nodes if a != b]
+    expected = [decode_itinerary(graph, plan_route_with_transfers_ignore_time(graph, a, b, None,
+                                                                              transfer_model=model))
+                for a, b, _ in queries]
+    assert route_many_shared(queries, filename, processes=2) == expected
+    assert any(expected) and all('trip_id' in leg for legs in expected for leg in legs)
+
+
+def test_shared_timed_routes_match_in_process(tmp_path):
+    gtfs = _feed()
+    timetable = build_timetable(gtfs, date(2026, 10, 19))
+    model = build_transfer_model(gtfs['stops'], None)
+    filename = str(tmp_path / 'network.bin')
+    save_network_file(filename, timetable=timetable, transfer_model=model)
+
+    queries = [(a, b, dep) for a in 'ABCDE' for b in 'ABCDE' if a != b for dep in (7 * 3600, 8 * 3600 + 300)]
+    expected = [plan_route_timed(timetable, a, b, dep, transfer_model=model) for a, b, dep in queries]
+    assert route_many_shared(queries, filename, processes=2) == expected
+    assert any(expected)
+
+
+def test_numeric_ids_and_empty_lists(tmp_path):
+    # pandas liest rein numerische stop_id-Spalten als int64 -> werden als Strings gespeichert
+    stops = pd.DataFrame({'stop_id': [1, 2, 3], 'stop_name': ['Eins', 'Zwei', 'Drei'],
+                          'stop_lat': [49.0, 49.0005, 49.2], 'stop_lon': [8.4, 8.4, 8.4]})
+    model = build_transfer_model(stops, None)
+    filename = str(tmp_path / 'network.bin')
+    save_network_file(filename, transfer_model=model, stops_df=stops.iloc[:0])
+    network = load_network_file(filename)
+    assert list(network['transfer_model']['stop_ids']) == ['1', '2', '3']
+    assert network['transfer_model']['stop_index'][2] == 1 and 4 not in network['transfer_model']['stop_index']
+    footpaths = get_footpaths(model, 1)
+    assert footpaths and get_footpaths(network['transfer_model'], 1) == [(str(j), d) for j, d in footpaths]
+    assert list(network['stops']['stop_ids']) == [] and len(network['stops']['stop_names']) == 0
+
+
+def test_unknown_keys_are_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        save_network_file(str(tmp_path / 'network.bin'), timetable={'stop_ids': ['A'], 'extra': {'A': 1}})
+
+
+def _anonymous_kb():
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            if line.startswith('Anonymous:'):
+                return int(line.split()[1])
+
+
+def _memory_growth(filename):
+    # Laufzeit in einem frischen Worker: privater Speicher vor/nach Laden und einigen Abfragen
+    before = _anonymous_kb()
+    network = load_network_file(filename)
+    timetable = network['timetable']
+    count = len(timetable['stop_ids'])
+    for i in range(0, count, count // 1000):
+        assert timetable['stop_index'][timetable['stop_ids'][i]] == i
+    total = int(timetable['conn_dep'][-1])
+    return _anonymous_kb() - before, total
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/smaps_rollup'), reason='braucht /proc/self/smaps_rollup')
+def test_workers_do_not_copy_the_network(tmp_path):
+    count = 300000
+    timetable = {'stop_ids': [f'de:08212:{i}:0:{i % 7}' for i in range(count)],
+                 'trip_ids': [f'trip-{i}' for i in range(count)],
+                 'conn_dep': list(range(3 * count))}
+    filename = str(tmp_path / 'network.bin')
+    save_network_file(filename, timetable=timetable)
+    file_kb = os.path.getsize(filename) // 1024
+
+    with multiprocessing.get_context('fork').Pool(2) as pool:
+        results = pool.map(_memory_growth, [filename] * 2, chunksize=1)
+    for growth_kb, total in results:
+        assert total == 3 * count - 1
+        # Eigene Listen/dicts kosten ein Vielfaches der Datei, Views praktisch nichts
+        assert growth_kb < file_kb // 10
@@ -0,0 +1,110 @@
+import os
+import pickle
+import random
+import pandas as pd
+import pytest
+from gtfs_processing import build_transit_graph, compact_transit_graph
+from routing import (benchmark_bidirectional, plan_route_alternatives, plan_route_multi_source,
+                     plan_route_with_transfers_ignore_time)
+
+GRAPH_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'graph.pkl')
+
+
+@pytest.fixture(scope='module')
+def graph():
+    with open(GRAPH_FILE, 'rb') as f:
+        return compact_transit_graph(pickle.load(f))
+
+
+def _queries(graph, count, seed=0):
+    rng = random.Random(seed)
+    served = sorted(stop for stop in graph.nodes if graph[stop])
+    return [tuple(rng.sample(served, 2)) for _ in range(count)]
+
+
+def _connected_queries(graph, count, seed=0):
+    # Nur Paare, die die Vorwärtssuche verbindet (zufällige Paare in graph.pkl sind meist nicht verbunden)
+    return [(start, end) for start, end in _queries(graph, 25 * count, seed)
+            if plan_route_with_transfers_ignore_time(graph, start, end, None)][:count]
+
+
+def test_bidirectional_expands_fewer_states(graph):
+    # Benchmark-Stichprobe: weniger erweiterte Zustände bei Anfragen mit Verbindung, nie schlechtere Routen
+    assert benchmark_bidirectional(graph, queries=_connected_queries(graph, 60))
+
+
+def test_bidirectional_same_length_as_forward(graph):
+    queries = _connected_queries(graph, 60, seed=1)
+    assert len(queries) == 60
+    for start, end in queries:
+        forward = plan_route_with_transfers_ignore_time(graph, start, end, None)
+        stats = {}
+        itinerary = plan_route_with_transfers_ignore_time(graph, start, end, None, bidirectional=True, stats=stats)
+        assert stats['expanded_states'] > 0
+        assert len(itinerary) == len(forward)
+        assert itinerary[0]['from_stop'] == start and itinerary[-1]['to_stop'] == end
+        previous_trip = None
+        for i, leg in enumerate(itinerary):
+            assert i == 0 or itinerary[i - 1]['to_stop'] == leg['from_stop']
+            edge = graph[leg['from_stop']][leg['to_stop']]
+            assert (edge['trip'], edge['edge']) == (leg['trip'], leg['edge'])
+            assert leg['transfer'] == (previous_trip is not None and leg['trip'] != previous_trip)
+            previous_trip = leg['trip']
+        assert sum(leg['transfer'] for leg in itinerary) <= 4
+
+
+def test_bidirectional_finds_same_connections(graph):
+    for start, end in _queries(graph, 300, seed=2):
+        forward = plan_route_with_transfers_ignore_time(graph, start, end, None)
+        assert bool(plan_route_with_transfers_ignore_time(graph, start, end, None, bidirectional=True)) == bool(forward)
+
+
+def _small_graph(trips):
+    # trips: {trip_id: [(stop_id, 'HH:MM:SS'), ...]}, eine Linie je Fahrt
+    stops = sorted({stop for calls in trips.values() for stop, _ in calls})
+    rows = [(trip_id, time, time, stop, seq + 1) for trip_id, calls in trips.items()
+            for seq, (stop, time) in enumerate(calls)]
+    return build_transit_graph({
+        'stops': pd.DataFrame({'stop_id': stops, 'stop_name': stops}),
+        'routes': pd.DataFrame({'route_id': list(trips), 'route_short_name': list(trips),
+                                'route_long_name': list(trips)}),
+        'trips': pd.DataFrame({'route_id': list(trips), 'service_id': ['WD'] * len(trips), 'trip_id': list(trips),
+                               'trip_headsign': [calls[-1][0] for calls in trips.values()]}),
+        'stop_times': pd.DataFrame(rows, columns=['trip_id', 'arrival_time', 'departure_time', 'stop_id',
+                                                  'stop_sequence']),
+    })
+
+
+def test_shared_access_stop_competes_with_routes():
+    # X liegt in beiden Zugangslisten, aber 700 s entfernt; A->B fährt direkt in 3 Minuten
+    graph = _small_graph({'T1': [('A', '08:00:00'), ('B', '08:03:00')], 'T2': [('X', '08:00:00'), ('Y', '08:05:00')]})
+    origins, destinations = [('A', 30), ('X', 700)], [('X', 700), ('B', 30)]
+    start_stop, end_stop, itinerary = plan_route_multi_source(graph, origins, destinations, None)
+    assert (start_stop, end_stop, [leg['to_stop'] for leg in itinerary]) == ('A', 'B', ['B'])
+    alternatives = plan_route_alternatives(graph, origins, destinations, None)
+    assert [(start, end, cost) for start, end, _, cost in alternatives] == [('A', 'B', 240), ('X', 'X', 1400)]
+
+    # Ohne schnelle Fahrt bleibt der Fußweg über die gemeinsame Haltestelle
+    start_stop, end_stop, itinerary = plan_route_multi_source(graph, [('X', 300)], [('X', 200), ('Y', 30)], None)
+    assert (start_stop, end_stop, itinerary) == ('X', 'X', [])
+
+
+def test_multi_source_counts_walk_times():
+    # B und D sind beide eine Kante entfernt, D ist aber vom Ziel aus viel näher
+    graph = _small_graph({'T1': [('A', '08:00:00'), ('B', '08:03:00')], 'T2': [('A', '08:00:00'), ('D', '08:05:00')]})
+    start_stop, end_stop, itinerary = plan_route_multi_source(graph, [('A', 30)], [('B', 900), ('D', 30)], None)
+    assert (start_stop, end_stop) == ('A', 'D')
+
+
+def test_alternatives_keep_faster_route_with_more_hops(monkeypatch):
+    # Erster Treffer A->B (1 Kante) und zwei Umwege über X1/X2 sind langsam, A-C-D-B (3 Kanten) ist am schnellsten
+    monkeypatch.setattr('routing.MAX_ALTERNATIVE_CANDIDATES', 2)
+    graph = _small_graph({
+        'S1': [('A', '08:00:00'), ('B', '09:00:00')],
+        'S2': [('A', '08:00:00'), ('X1', '08:30:00'), ('B', '09:00:00')],
+        'S3': [('A', '08:00:00'), ('X2', '08:30:00'), ('B', '09:00:00')],
+        'F': [('A', '08:00:00'), ('C', '08:02:00'), ('D', '08:04:00'), ('B', '08:06:00')],
+    })
+    alternatives = plan_route_alternatives(graph, [('A', 0)], [('B', 0)], None, k=3, max_extra_time=3600)
+    assert [leg['to_stop'] for leg in alternatives[0][2]] == ['C', 'D', 'B']
+    assert alternatives[0][3] == 360
@@ -0,0 +1,58 @@
+import threading
+from search_jobs import SearchScheduler, SearchCancelled
+
+
+def _wait_job(started, release, cancel_token):
+    started.set()
+    release.wait(5)
+    cancel_token.check()
+    return 'fertig'
+
+
+def test_failing_callback_is_called_once():
+    scheduler = SearchScheduler()
+    calls = []
+    done = threading.Event()
+
+    def on_done(result, error):
+        calls.append((result, error))
+        done.set()
+        raise RuntimeError("Fehler in der GUI")
+
+    scheduler.submit(lambda cancel_token: 42, on_done=on_done)
+    assert done.wait(5)
+    scheduler.shutdown()
+    assert calls == [(42, None)]
+
+
+def test_cancelled_job_does_not_call_back():
+    scheduler = SearchScheduler()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+    token = scheduler.submit(_wait_job, started, release, on_done=lambda result, error: calls.append((result, error)))
+    assert started.wait(5)
+    scheduler.cancel()
+    release.set()
+    scheduler._executor.shutdown(wait=True)
+    assert token.is_cancelled()
+    assert calls == []
+
+
+def test_superseded_job_reports_only_newest():
+    scheduler = SearchScheduler()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+    done = threading.Event()
+
+    def on_done(result, error):
+        calls.append((result, error))
+        done.set()
+
+    scheduler.submit(_wait_job, started, release, on_done=on_done)
+    assert started.wait(5)
+    scheduler.submit(lambda cancel_token: 'neu', on_done=on_done)
+    release.set()
+    assert done.wait(5)
+    scheduler._executor.shutdown(wait=True)
+    assert calls == [('neu', None)]
+    assert not any(isinstance(error, SearchCancelled) for _, error in calls)
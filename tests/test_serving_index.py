@@ -0,0 +1,38 @@
+import pandas as pd
+from serving_index import build_serving_index, can_reach, direct_connection, rank_stop_pairs
+from transfers import build_transfer_model
+
+
+def _feed():
+    # Linie 1: A-B-C, Linie 2: C-D; E liegt nur zu Fuß neben D, F wird nicht bedient
+    stops = pd.DataFrame({'stop_id': list('ABCDEF'), 'stop_name': list('ABCDEF'),
+                          'stop_lat': [49.0, 49.1, 49.2, 49.3, 49.3003, 49.5], 'stop_lon': [8.4] * 6})
+    trips = {'T1': ['A', 'B', 'C'], 'T2': ['C', 'D']}
+    rows = [(trip_id, stop_id, k + 1) for trip_id, trip_stops in trips.items() for k, stop_id in enumerate(trip_stops)]
+    return {
+        'stops': stops,
+        'trips': pd.DataFrame({'trip_id': list(trips), 'route_id': ['R1', 'R2']}),
+        'stop_times': pd.DataFrame(rows, columns=['trip_id', 'stop_id', 'stop_sequence']),
+    }
+
+
+def test_direct_connection_follows_stop_order():
+    index = build_serving_index(_feed())
+    assert direct_connection(index, 'A', 'C') and direct_connection(index, 'C', 'D')
+    assert not direct_connection(index, 'A', 'D') and not direct_connection(index, 'C', 'A')
+
+
+def test_can_reach_with_transfers_and_footpaths():
+    gtfs = _feed()
+    index = build_serving_index(gtfs)
+    assert can_reach(index, 'A', 'D') and not can_reach(index, 'D', 'A')
+    assert not can_reach(index, 'A', 'E') and not can_reach(index, 'A', 'X')
+    assert can_reach(index, 'F', 'F') and not can_reach(index, 'F', 'A') and not can_reach(index, 'A', 'F')
+
+    index = build_serving_index(gtfs, build_transfer_model(gtfs['stops'], None))
+    assert can_reach(index, 'A', 'E') and can_reach(index, 'E', 'D') and not can_reach(index, 'E', 'A')
+
+
+def test_rank_stop_pairs_direct_first():
+    index = build_serving_index(_feed())
+    assert rank_stop_pairs(index, ['D', 'A'], ['D', 'C', 'A', 'F']) == [('A', 'C'), ('A', 'D')]
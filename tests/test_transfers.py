@@ -0,0 +1,22 @@
+import io
+import pandas as pd
+from transfers import build_transfer_model, get_footpaths, DEFAULT_CHANGE_TIME
+
+STOPS = pd.DataFrame({
+    'stop_id': ['A', 'B', 'C'],
+    'stop_name': ['A', 'B', 'C'],
+    'stop_lat': [49.0, 49.0, 49.1],
+    'stop_lon': [8.4, 8.4005, 8.5],
+})
+
+
+def test_empty_transfer_type_counts_as_type_0():
+    # Leere transfer_type-Zelle wird von pandas als NaN gelesen
+    transfers = pd.read_csv(io.StringIO(
+        "from_stop_id,to_stop_id,transfer_type,min_transfer_time\n"
+        "A,C,,\n"
+        "B,C,2,240\n"
+    ))
+    model = build_transfer_model(STOPS, transfers)
+    assert dict(get_footpaths(model, 'A'))['C'] == DEFAULT_CHANGE_TIME
+    assert dict(get_footpaths(model, 'B'))['C'] == 240
@@ -0,0 +1,36 @@
+import numpy as np
+from visualize_route import _group_geometry, simplify_polyline
+
+
+def test_simplify_polyline_drops_points_within_tolerance():
+    line = np.array([[0.0, 0.0], [1.0, 0.0001], [2.0, 0.0], [3.0, 1.0]])
+    assert simplify_polyline(line, 0.01).tolist() == [[0.0, 0.0], [2.0, 0.0], [3.0, 1.0]]
+    assert len(simplify_polyline(line, 0)) == 4
+    assert simplify_polyline(line, 10).tolist() == [[0.0, 0.0], [3.0, 1.0]]
+
+
+def _out_and_back_shape():
+    # Hin- und Rückweg auf derselben Straße: lat 0 -> 10 -> 0
+    lats = np.concatenate((np.arange(0, 11), np.arange(9, -1, -1))).astype(float)
+    return {'trip_shape': {'T': 'S'}, 'shapes': {'S': np.column_stack((lats, np.zeros(len(lats))))}}
+
+
+STOPS = {'A': (0.0, 0.0, 'A'), 'B': (8.0, 0.0, 'B'), 'M': (5.0, 0.0, 'M'), 'C': (2.0, 0.0, 'C'),
+         'W': (9.0, 0.0, 'W')}
+
+
+def test_group_geometry_uses_return_pass_of_out_and_back_shape():
+    # Fahrt auf dem Rückweg B -> M -> C: darf nicht über den Wendepunkt (lat 10) gezeichnet werden
+    group = [{'from_stop': 'B', 'to_stop': 'M', 'trip_id': 'T'}, {'from_stop': 'M', 'to_stop': 'C', 'trip_id': 'T'}]
+    geometry = _group_geometry(group, STOPS, _out_and_back_shape())
+    assert geometry[:, 0].tolist() == [8.0, 8.0, 7.0, 6.0, 5.0, 4.0, 3.0, 2.0, 2.0]
+
+
+def test_group_geometry_over_turning_point():
+    # M -> W auf dem Hinweg, dann über den Wendepunkt zurück nach C
+    group = [{'from_stop': 'M', 'to_stop': 'W', 'trip_id': 'T'}, {'from_stop': 'W', 'to_stop': 'C', 'trip_id': 'T'}]
+    geometry = _group_geometry(group, STOPS, _out_and_back_shape())
+    assert geometry[:, 0].tolist() == [5.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0, 9.0, 8.0, 7.0, 6.0, 5.0, 4.0, 3.0, 2.0, 2.0]
+    # Ohne Shape: gerade Linien zwischen den Halten
+    assert _group_geometry(group, STOPS, {'trip_shape': {}, 'shapes': {}}).tolist() == [[5.0, 0.0], [9.0, 0.0],
+                                                                                        [2.0, 0.0]]
@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+from gtfs_processing import gtfs_time_to_seconds
+from utils import get_valid_service_ids
+
+# Fallback-Texte wie in build_transit_graph
+UNKNOWN_ROUTE = "Unbekannt"
+UNKNOWN_DIRECTION = "Fahrtrichtungsdaten konnten nicht geladen werden, bitte informieren Sie sich an den Aushangfahrplänen an den Haltestellen"
+
+
+def build_timetable(gtfs, routing_date=None):
+    """
+    Baut den zeitabhängigen Fahrplan für die Connection-Scan-Suche.
+    Jede Fahrt wird in Connections (Abfahrt an Haltestelle A -> Ankunft an Haltestelle B) zerlegt,
+    die nach Abfahrtszeit sortiert als numpy-Arrays gespeichert werden.
+    Die Haltestellen-Reihenfolge entspricht gtfs['stops'] (wie im Umstiegsmodell).
+    Taktfahrten aus frequencies.txt werden nicht ausmultipliziert: ihre Vorlage (stop_times der Fahrt,
+    Zeiten relativ zur ersten Abfahrt) und die Takte (Beginn, Ende, Takt) werden gespeichert, die
+    einzelnen Abfahrten erzeugt erst die Suche (siehe plan_route_timed_multi).
+    """
+    stops = gtfs['stops']
+    stop_ids = stops['stop_id'].tolist()
+    stop_index = {stop_id: i for i, stop_id in enumerate(stop_ids)}
+
+    trips = gtfs['trips']
+    if routing_date is not None and 'calendar' in gtfs:
+        valid_services = get_valid_service_ids(gtfs['calendar'], routing_date)
+        trips = trips[trips['service_id'].isin(valid_services)]
+
+    # Nur die benötigten Spalten mergen (keine Kopie des ganzen stop_times-DataFrames im Aufrufer)
+    columns = ['trip_id', 'stop_id', 'stop_sequence', 'arrival_time', 'departure_time']
+    if 'stop_headsign' in gtfs['stop_times'].columns:
+        columns.append('stop_headsign')
+    stop_times = gtfs['stop_times'][columns]
+    trip_columns = [c for c in ['trip_id', 'route_id', 'trip_headsign'] if c in trips.columns]
+    route_columns = [c for c in ['route_id', 'route_short_name', 'route_long_name'] if c in gtfs['routes'].columns]
+    merged = stop_times.merge(trips[trip_columns], on='trip_id').merge(gtfs['routes'][route_columns], on='route_id')
+
+    merged = merged.assign(
+        stop_idx=merged['stop_id'].map(stop_index),
+        stop_sequence=pd.to_numeric(merged['stop_sequence'], errors='coerce'),
+        arr=gtfs_time_to_seconds(merged['arrival_time']),
+        dep=gtfs_time_to_seconds(merged['departure_time']),
+    )
+    merged = merged.dropna(subset=['stop_idx', 'stop_sequence'])
+    merged = merged[(merged['arr'] >= 0) & (merged['dep'] >= 0)]
+    merged = merged.sort_values(['trip_id', 'stop_sequence'], kind='stable')
+
+    trip_codes, trip_ids = pd.factorize(merged['trip_id'], sort=False)
+    stop_idx = merged['stop_idx'].to_numpy(dtype=np.int32)
+    arr = merged['arr'].to_numpy(dtype=np.int32)
+    dep = merged['dep'].to_numpy(dtype=np.int32)
+
+    # Linienname und Richtung je Fahrt (gleiche Logik wie beim Graphen)
+    first_rows = merged.drop_duplicates('trip_id')
+    route_name = pd.Series(UNKNOWN_ROUTE, index=first_rows.index)
+    for column in ['route_short_name', 'route_long_name']:
+        if column in first_rows.columns:
+            route_name = first_rows[column].where(first_rows[column].notna() & (first_rows[column].astype(str) != ''), route_name)
+    headsign = pd.Series(UNKNOWN_DIRECTION, index=first_rows.index)
+    for column in ['trip_headsign', 'stop_headsign']:
+        if column in first_rows.columns:
+            headsign = first_rows[column].where(first_rows[column].notna() & (first_rows[column].astype(str) != ''), headsign)
+
+    # Taktfahrten: Fahrten mit Einträgen in frequencies.txt sind nur Vorlagen
+    frequencies = gtfs.get('frequencies')
+    is_template = np.zeros(len(trip_ids), dtype=bool)
+    if frequencies is not None and not frequencies.empty:
+        freq_trip = pd.Index(trip_ids).get_indexer(frequencies['trip_id'])
+        freq_start = gtfs_time_to_seconds(frequencies['start_time'])
+        freq_end = gtfs_time_to_seconds(frequencies['end_time'])
+        freq_headway = pd.to_numeric(frequencies['headway_secs'], errors='coerce').fillna(0).to_numpy(dtype=np.int64)
+        valid = (freq_trip >= 0) & (freq_start >= 0) & (freq_end > freq_start) & (freq_headway > 0)
+        freq_trip, freq_start, freq_end, freq_headway = (freq_trip[valid], freq_start[valid],
+                                                         freq_end[valid], freq_headway[valid])
+        is_template[freq_trip] = True
+    else:
+        freq_trip = freq_start = freq_end = freq_headway = np.zeros(0, dtype=np.int64)
+
+    # Connections: aufeinanderfolgende Zeilen derselben Fahrt
+    same_trip = trip_codes[1:] == trip_codes[:-1]
+    template_rows = np.flatnonzero(same_trip & is_template[trip_codes[:-1]])
+    rows = np.flatnonzero(same_trip & ~is_template[trip_codes[:-1]])
+    conn_from = stop_idx[rows]
+    conn_to = stop_idx[rows + 1]
+    conn_dep = dep[rows]
+    conn_arr = arr[rows + 1]
+    conn_trip = trip_codes[rows].astype(np.int32)
+
+    # Stabile Sortierung nach Abfahrt, bei Gleichstand nach Ankunft
+    order = np.lexsort((conn_arr, conn_dep))
+    conn_from, conn_to = conn_from[order], conn_to[order]
+    conn_dep, conn_arr, conn_trip = conn_dep[order], conn_arr[order], conn_trip[order]
+
+    # Pro Fahrt die Connection-Indizes in Fahrtreihenfolge (CSR), für die Rekonstruktion der Legs
+    trip_order = np.lexsort((rows[order], conn_trip))
+    trip_conns = trip_order.astype(np.int32)
+    trip_offsets = np.zeros(len(trip_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(conn_trip, minlength=len(trip_ids)), out=trip_offsets[1:])
+    conn_pos = np.empty(len(conn_trip), dtype=np.int32)
+    conn_pos[trip_conns] = np.arange(len(trip_conns)) - trip_offsets[conn_trip[trip_conns]]
+
+    # Vorlagen der Taktfahrten (CSR je Fahrt, Zeiten relativ zur ersten Abfahrt der Vorlage)
+    first_dep = dep[np.flatnonzero(np.r_[True, trip_codes[1:] != trip_codes[:-1]])]
+    template_trip = trip_codes[template_rows]
+    template_offsets = np.zeros(len(trip_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(template_trip, minlength=len(trip_ids)), out=template_offsets[1:])
+
+    print(f"Fahrplan erstellt: {len(conn_dep)} Verbindungen, {len(trip_ids)} Fahrten, "
+          f"{len(freq_trip)} Takte aus frequencies.txt")
+    return {
+        'stop_ids': stop_ids,
+        'stop_index': stop_index,
+        'stop_lat': pd.to_numeric(stops['stop_lat'], errors='coerce').to_numpy(dtype=float),
+        'stop_lon': pd.to_numeric(stops['stop_lon'], errors='coerce').to_numpy(dtype=float),
+        'conn_dep': conn_dep,
+        'conn_arr': conn_arr,
+        'conn_from': conn_from,
+        'conn_to': conn_to,
+        'conn_trip': conn_trip,
+        'conn_pos': conn_pos,
+        'trip_ids': list(trip_ids),
+        'trip_route_name': [str(x) for x in route_name],
+        'trip_headsign': [str(x) for x in headsign],
+        'trip_offsets': trip_offsets,
+        'trip_conns': trip_conns,
+        'freq_trip': freq_trip.astype(np.int32),
+        'freq_start': freq_start.astype(np.int32),
+        'freq_end': freq_end.astype(np.int32),
+        'freq_headway': freq_headway.astype(np.int32),
+        'template_offsets': template_offsets,
+        'template_from': stop_idx[template_rows],
+        'template_to': stop_idx[template_rows + 1],
+        'template_dep': (dep[template_rows] - first_dep[template_trip]).astype(np.int32),
+        'template_arr': (arr[template_rows + 1] - first_dep[template_trip]).astype(np.int32),
+    }
+
+
+def trip_connections(timetable, trip, first_pos, last_pos):
+    """
+    Gibt die Connection-Indizes einer Fahrt zwischen zwei Positionen (inklusive) zurück.
+    """
+    start = timetable['trip_offsets'][trip]
+    return timetable['trip_conns'][start + first_pos:start + last_pos + 1]
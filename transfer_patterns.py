@@ -0,0 +1,278 @@
+import os
+import pickle
+import random
+import time
+import numpy as np
+from multiprocessing import Pool, cpu_count
+from routing import iterate_route_states, plan_route_with_transfers_ignore_time, make_ride_leg, make_walk_leg
+
+# Kodierung der Zielspalte 'target_trip'
+ENDS_AT_PREFIX = -1     # Ziel ist das Ende des Präfix (z.B. Fußweg als letzter Abschnitt)
+
+# Globale Daten der Worker-Prozesse (werden einmal pro Prozess gesetzt)
+_worker = {}
+
+
+def _init_worker(G, transfer_model, stop_ids, trip_ids, max_transfers, max_depth):
+    _worker['G'] = G
+    _worker['transfer_model'] = transfer_model
+    _worker['stop_index'] = {stop_id: i for i, stop_id in enumerate(stop_ids)}
+    _worker['trip_index'] = {trip_id: i for i, trip_id in enumerate(trip_ids)}
+    _worker['max_transfers'] = max_transfers
+    _worker['max_depth'] = max_depth
+
+
+def _patterns_for_source(source):
+    """
+    Führt eine vollständige Breitensuche ab source aus (gleiche Reihenfolge wie der Router) und
+    speichert für jedes Ziel nur das Umstiegsmuster: Präfix aus abgeschlossenen Abschnitten + letzte Fahrt.
+    Nur erreichbare Ziele werden zurückgegeben (nach Ziel sortiert -> eine CSR-Zeile je Start).
+    """
+    G = _worker['G']
+    stop_index = _worker['stop_index']
+    trip_index = _worker['trip_index']
+
+    targets, target_prefix, target_trip = [], [], []
+    # Präfix-Knoten: (Vorgänger, Fahrt oder -1 für Fußweg, Ausstiegs-Haltestelle, Gehzeit); Knoten 0 = Start
+    prefixes = [(-1, -1, stop_index[source], 0)]
+    prefix_ids = {}
+    summaries = {}      # id(Suchknoten) -> (Präfix, offene Fahrt oder None)
+
+    def prefix_node(parent, trip, alight, walk=0):
+        key = (parent, trip, alight, walk)
+        if key not in prefix_ids:
+            prefix_ids[key] = len(prefixes)
+            prefixes.append(key)
+        return prefix_ids[key]
+
+    def summarize(node):
+        # Zusammenfassung je Suchknoten einmal berechnen (Pfade teilen sich ihre Präfixe)
+        if node is None:
+            return 0, None
+        key = id(node)
+        if key in summaries:
+            return summaries[key][1]
+        parent, leg, _ = node
+        prefix, open_trip = summarize(parent)
+        if leg.get('walk', False):
+            if open_trip is not None:
+                prefix = prefix_node(prefix, open_trip, stop_index[leg['from_stop']])
+            walk = int(leg['duration'])
+            summary = (prefix_node(prefix, -1, stop_index[leg['to_stop']], walk), None)
+        else:
+            trip = trip_index[leg['trip']]
+            if open_trip is not None and trip != open_trip:
+                prefix = prefix_node(prefix, open_trip, stop_index[leg['from_stop']])
+            summary = (prefix, trip)
+        # Knoten mit ablegen, damit id() während der Suche eindeutig bleibt
+        summaries[key] = (node, summary)
+        return summary
+
+    seen = set()
+    for stop, _, _, node in iterate_route_states(G, source, _worker['max_transfers'], _worker['max_depth'],
+                                                 _worker['transfer_model']):
+        if stop in seen:
+            continue
+        seen.add(stop)
+        if node is None:
+            continue    # Start == Ziel -> der Router liefert eine leere Route
+        prefix, open_trip = summarize(node)
+        targets.append(stop_index[stop])
+        target_prefix.append(prefix)
+        target_trip.append(ENDS_AT_PREFIX if open_trip is None else open_trip)
+
+    order = np.argsort(np.array(targets, dtype=np.int32), kind='stable')
+    return (stop_index[source], np.array(targets, dtype=np.int32)[order], np.array(target_prefix, dtype=np.int32)[order],
+            np.array(target_trip, dtype=np.int32)[order], np.array(prefixes, dtype=np.int32).reshape(-1, 4))
+
+
+def build_transfer_patterns(G, folder='transfer_patterns', transfer_model=None, max_transfers=4, max_depth=200,
+                            processes=None, sources=None):
+    """
+    Offline-Vorberechnung: Umstiegsmuster für alle Start-Haltestellen, parallel über alle Kerne.
+    Ergebnis wird im Ordner folder gespeichert (numpy-Dateien, per Memory-Map ladbar).
+    Je Start nur die erreichbaren Ziele (CSR: target_offsets/target_stops mit Präfix und letzter Fahrt),
+    keine n x n-Tabellen -> Größe wächst mit der Zahl erreichbarer Paare, nicht quadratisch mit dem Netz.
+    """
+    stop_ids = list(G.nodes)
+    trip_ids = sorted({data['trip'] for _, _, data in G.edges(data=True)})
+    n = len(stop_ids)
+    if sources is None:
+        sources = stop_ids
+    os.makedirs(folder, exist_ok=True)
+
+    empty = np.zeros(0, dtype=np.int32)
+    target_rows = [(empty, empty, empty)] * n
+    prefix_tables = [np.zeros((0, 4), dtype=np.int32)] * n
+
+    started = time.time()
+    init_args = (G, transfer_model, stop_ids, trip_ids, max_transfers, max_depth)
+    with Pool(processes or cpu_count(), initializer=_init_worker, initargs=init_args) as pool:
+        for done, (row, targets, prefixes_row, trips_row, prefixes) in enumerate(
+                pool.imap_unordered(_patterns_for_source, sources, chunksize=16), 1):
+            target_rows[row] = (targets, prefixes_row, trips_row)
+            prefix_tables[row] = prefixes
+            if done % 500 == 0:
+                print(f"Umstiegsmuster: {done}/{len(sources)} Starts ({time.time() - started:.0f}s)")
+
+    # Ziele und Präfix-Tabellen aller Starts als CSR zusammenfassen
+    target_offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum([len(targets) for targets, _, _ in target_rows], out=target_offsets[1:])
+    for name, column in (('target_stops', 0), ('target_prefix', 1), ('target_trip', 2)):
+        np.save(f'{folder}/{name}.npy', np.concatenate([row[column] for row in target_rows]) if n else empty)
+    np.save(f'{folder}/target_offsets.npy', target_offsets)
+    prefix_offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum([len(p) for p in prefix_tables], out=prefix_offsets[1:])
+    np.save(f'{folder}/prefix_offsets.npy', prefix_offsets)
+    np.save(f'{folder}/prefixes.npy', np.concatenate(prefix_tables) if n else np.zeros((0, 4), dtype=np.int32))
+    with open(f'{folder}/meta.pkl', 'wb') as f:
+        pickle.dump({'stop_ids': stop_ids, 'trip_ids': trip_ids,
+                     'max_transfers': max_transfers, 'max_depth': max_depth}, f)
+    print(f"Umstiegsmuster gespeichert in {folder}/: {int(target_offsets[-1])} erreichbare Paare "
+          f"({time.time() - started:.0f}s)")
+
+
+def load_transfer_patterns(G, folder='transfer_patterns'):
+    """
+    Lädt vorberechnete Umstiegsmuster (große Tabellen per Memory-Map, nicht komplett in den Speicher).
+    """
+    with open(f'{folder}/meta.pkl', 'rb') as f:
+        meta = pickle.load(f)
+    # Nachfolger je (Haltestelle, Fahrt) -> Fahrtabschnitte ohne Suche rekonstruieren
+    successor = {}
+    for u, v, data in G.edges(data=True):
+        successor.setdefault((u, data['trip']), []).append(v)
+    return {
+        'graph': G,
+        'stop_ids': meta['stop_ids'],
+        'stop_index': {stop_id: i for i, stop_id in enumerate(meta['stop_ids'])},
+        'trip_ids': meta['trip_ids'],
+        'max_transfers': meta['max_transfers'],
+        'max_depth': meta['max_depth'],
+        'successor': successor,
+        'target_offsets': np.load(f'{folder}/target_offsets.npy'),
+        'target_stops': np.load(f'{folder}/target_stops.npy', mmap_mode='r'),
+        'target_prefix': np.load(f'{folder}/target_prefix.npy', mmap_mode='r'),
+        'target_trip': np.load(f'{folder}/target_trip.npy', mmap_mode='r'),
+        'prefix_offsets': np.load(f'{folder}/prefix_offsets.npy'),
+        'prefixes': np.load(f'{folder}/prefixes.npy', mmap_mode='r'),
+    }
+
+
+def _ride_legs(patterns, from_stop, trip_id, to_stop, transfer):
+    """
+    Fahrt entlang der Nachfolger-Tabelle bis zur Ausstiegs-Haltestelle.
+    Fährt eine Fahrt eine Haltestelle mehrfach an (Ringlinien), wird wie im Router der kürzeste Weg genommen.
+    """
+    G = patterns['graph']
+    successor = patterns['successor']
+    parents = {from_stop: None}
+    frontier = [from_stop]
+    while frontier and to_stop not in parents:
+        next_frontier = []
+        for stop in frontier:
+            for next_stop in successor.get((stop, trip_id), ()):
+                if next_stop not in parents:
+                    parents[next_stop] = stop
+                    next_frontier.append(next_stop)
+        frontier = next_frontier
+    if to_stop not in parents:
+        raise ValueError(f"Umstiegsmuster passt nicht zum Graphen (Fahrt {trip_id} ab {from_stop}).")
+
+    stops = [to_stop]
+    while parents[stops[-1]] is not None:
+        stops.append(parents[stops[-1]])
+    stops.reverse()
+    legs = []
+    for current, next_stop in zip(stops, stops[1:]):
+        legs.append(make_ride_leg(current, next_stop, G[current][next_stop], transfer))
+        transfer = False
+    return legs
+
+
+def query_transfer_patterns(patterns, start_stop, end_stop):
+    """
+    Beantwortet eine Eins-zu-Eins-Anfrage aus den Umstiegsmustern (gleiches Ergebnis wie
+    plan_route_with_transfers_ignore_time mit denselben Parametern, aber ohne Suche).
+    """
+    stop_index = patterns['stop_index']
+    if start_stop not in stop_index or end_stop not in stop_index:
+        return []
+    source, target = stop_index[start_stop], stop_index[end_stop]
+    # Ziel in der sortierten CSR-Zeile des Starts suchen
+    row_start, row_end = int(patterns['target_offsets'][source]), int(patterns['target_offsets'][source + 1])
+    position = row_start + int(np.searchsorted(patterns['target_stops'][row_start:row_end], target))
+    if position == row_end or patterns['target_stops'][position] != target:
+        return []
+    last_trip = int(patterns['target_trip'][position])
+
+    base = int(patterns['prefix_offsets'][source])
+    stop_ids, trip_ids = patterns['stop_ids'], patterns['trip_ids']
+    chain = []
+    prefix = int(patterns['target_prefix'][position])
+    while prefix > 0:
+        parent, trip, alight, walk = (int(x) for x in patterns['prefixes'][base + prefix])
+        chain.append((trip, alight, walk))
+        prefix = parent
+    chain.reverse()
+    if last_trip != ENDS_AT_PREFIX:
+        chain.append((last_trip, target, 0))
+
+    itinerary = []
+    current = start_stop
+    on_trip = False
+    for trip, alight, walk in chain:
+        to_stop = stop_ids[alight]
+        if trip == ENDS_AT_PREFIX:
+            itinerary.append(make_walk_leg(current, to_stop, walk, transfer=on_trip))
+            on_trip = False
+        else:
+            itinerary.extend(_ride_legs(patterns, current, trip_ids[trip], to_stop, transfer=on_trip))
+            on_trip = True
+        current = to_stop
+    return itinerary
+
+
+def verify_transfer_patterns(patterns, stops_df, transfer_model=None, sample=1000, seed=0):
+    """
+    Korrektheitsprüfung: vergleicht zufällige Anfragen mit dem Basis-Router.
+    Gibt die Anzahl der Abweichungen zurück (0 = alles identisch).
+    """
+    G = patterns['graph']
+    rng = random.Random(seed)
+    stop_ids = patterns['stop_ids']
+    mismatches = 0
+    pattern_time = router_time = 0.0
+    for _ in range(sample):
+        start, end = rng.choice(stop_ids), rng.choice(stop_ids)
+        t0 = time.perf_counter()
+        fast = query_transfer_patterns(patterns, start, end)
+        t1 = time.perf_counter()
+        expected = plan_route_with_transfers_ignore_time(G, start, end, stops_df, max_transfers=patterns['max_transfers'],
+                                                         max_depth=patterns['max_depth'], transfer_model=transfer_model)
+        t2 = time.perf_counter()
+        pattern_time += t1 - t0
+        router_time += t2 - t1
+        if fast != expected:
+            mismatches += 1
+            print(f"[WARN] Abweichung für {start} -> {end}")
+    print(f"Umstiegsmuster: {pattern_time / sample * 1000:.3f} ms/Anfrage, Router: {router_time / sample * 1000:.3f} ms/Anfrage, "
+          f"{mismatches} Abweichungen bei {sample} Anfragen")
+    return mismatches
+
+
+if __name__ == "__main__":
+    # Offline-Pipeline: Graph laden, Umstiegsmuster parallel berechnen, gegen den Router prüfen
+    from gtfs_processing import build_transit_graph, compact_transit_graph
+    from feed_merge import load_merged_gtfs_data
+    from transfers import build_transfer_model
+
+    gtfs = load_merged_gtfs_data()
+    if os.path.exists('graph.pkl'):
+        with open('graph.pkl', 'rb') as f:
+            graph = compact_transit_graph(pickle.load(f))
+    else:
+        graph = build_transit_graph(gtfs)
+    model = build_transfer_model(gtfs['stops'], gtfs.get('transfers')) if gtfs else None
+    build_transfer_patterns(graph, transfer_model=model)
+    verify_transfer_patterns(load_transfer_patterns(graph), gtfs.get('stops'), transfer_model=model)
@@ -0,0 +1,173 @@
+import math
+import numpy as np
+import pandas as pd
+from utils import haversine
+
+# Standardwerte für das Umstiegsmodell
+DEFAULT_CHANGE_TIME = 120       # Sekunden Mindestumstiegszeit an derselben Haltestelle
+STATION_CHANGE_TIME = 180       # Sekunden Mindestzeit zwischen Steigen derselben Station (parent_station)
+MAX_WALK_DISTANCE = 400         # Meter, maximale Länge eines Fußwegs zwischen Haltestellen
+WALKING_SPEED = 1.2             # Meter pro Sekunde (~4,3 km/h)
+FORBIDDEN_TRANSFER = 10 ** 9    # transfer_type 3 -> Umstieg nicht möglich
+
+
+def _walk_seconds(dist_km, walking_speed):
+    return np.ceil(np.asarray(dist_km) * 1000.0 / walking_speed).astype(np.int64)
+
+
+def _radius_links(lats, lons, max_walk_distance, walking_speed):
+    """
+    Findet alle Haltestellenpaare innerhalb von max_walk_distance (Raster-Buckets statt n^2 Vergleiche).
+    """
+    links = {}
+    if len(lats) == 0 or max_walk_distance <= 0:
+        return links
+    # Rasterzellen ungefähr so groß wie der Suchradius
+    cell_lat = max_walk_distance / 111320.0
+    cell_lon = cell_lat / max(math.cos(math.radians(float(np.mean(lats)))), 0.01)
+    cells = {}
+    for i, key in enumerate(zip((lats // cell_lat).astype(np.int64), (lons // cell_lon).astype(np.int64))):
+        cells.setdefault(key, []).append(i)
+
+    for (cx, cy), members in cells.items():
+        src = np.array(members)
+        neighbors = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                neighbors.extend(cells.get((cx + dx, cy + dy), ()))
+        dst = np.array(neighbors)
+        # Alle Paare zwischen der Zelle und ihren Nachbarzellen vektorisiert prüfen
+        a = np.repeat(src, len(dst))
+        b = np.tile(dst, len(src))
+        mask = a != b
+        a, b = a[mask], b[mask]
+        dist = haversine(lats[a], lons[a], lats[b], lons[b])
+        close = dist * 1000.0 <= max_walk_distance
+        for i, j, sec in zip(a[close], b[close], _walk_seconds(dist[close], walking_speed)):
+            links[(int(i), int(j))] = int(sec)
+    return links
+
+
+def build_transfer_model(stops_df, transfers_df=None, max_walk_distance=MAX_WALK_DISTANCE,
+                         walking_speed=WALKING_SPEED, default_change_time=DEFAULT_CHANGE_TIME,
+                         station_change_time=STATION_CHANGE_TIME):
+    """
+    Baut das vorberechnete Umstiegsmodell als CSR-Adjazenz (offsets/targets/durations).
+    Quellen, in aufsteigender Priorität:
+      1. Fußwege zwischen nahegelegenen Haltestellen (Radius + Gehgeschwindigkeit)
+      2. Umstiege innerhalb derselben Station (parent_station)
+      3. transfers.txt (falls vorhanden)
+    Zusätzlich enthält das Modell pro Haltestelle die Mindestumstiegszeit 'min_change_time'.
+    """
+    stop_ids = stops_df['stop_id'].tolist()
+    stop_index = {stop_id: i for i, stop_id in enumerate(stop_ids)}
+    n = len(stop_ids)
+    min_change_time = np.full(n, default_change_time, dtype=np.int64)
+
+    # 1. Fußwege im Umkreis (nur Haltestellen mit Koordinaten)
+    links = {}
+    if 'stop_lat' in stops_df.columns and 'stop_lon' in stops_df.columns:
+        lats = pd.to_numeric(stops_df['stop_lat'], errors='coerce').to_numpy(dtype=float)
+        lons = pd.to_numeric(stops_df['stop_lon'], errors='coerce').to_numpy(dtype=float)
+        has_coords = np.flatnonzero(~(np.isnan(lats) | np.isnan(lons)))
+        for (i, j), sec in _radius_links(lats[has_coords], lons[has_coords], max_walk_distance, walking_speed).items():
+            links[(int(has_coords[i]), int(has_coords[j]))] = sec
+
+    # 2. Steige derselben Station: alle Mitglieder inkl. der Station selbst untereinander verbinden
+    if 'parent_station' in stops_df.columns:
+        parents = stops_df['parent_station']
+        groups = {}
+        for i, parent in enumerate(parents):
+            if pd.notna(parent) and parent in stop_index:
+                groups.setdefault(stop_index[parent], [stop_index[parent]]).append(i)
+        for members in groups.values():
+            for i in members:
+                for j in members:
+                    if i != j:
+                        links[(i, j)] = max(links.get((i, j), 0), station_change_time)
+
+    # 3. transfers.txt überschreibt alles andere
+    if transfers_df is not None and not transfers_df.empty:
+        for row in transfers_df.itertuples(index=False):
+            i = stop_index.get(row.from_stop_id)
+            j = stop_index.get(row.to_stop_id)
+            if i is None or j is None:
+                continue
+            # Leere Zelle -> NaN (pandas), gilt wie fehlend als Typ 0
+            transfer_type = int(row.transfer_type) if pd.notna(getattr(row, 'transfer_type', None)) else 0
+            min_time = getattr(row, 'min_transfer_time', None)
+            if transfer_type == 3:
+                duration = FORBIDDEN_TRANSFER
+            elif transfer_type == 2 and pd.notna(min_time):
+                duration = int(min_time)
+            elif transfer_type == 1:
+                duration = 0
+            else:
+                duration = default_change_time
+            if i == j:
+                min_change_time[i] = duration
+            elif duration >= FORBIDDEN_TRANSFER:
+                links.pop((i, j), None)
+            else:
+                links[(i, j)] = duration
+
+    # CSR-Aufbau: Kanten nach Start-Haltestelle sortieren
+    if links:
+        pairs = np.array(list(links.keys()), dtype=np.int64)
+        durations = np.array(list(links.values()), dtype=np.int64)
+        order = np.lexsort((pairs[:, 1], pairs[:, 0]))
+        sources = pairs[order, 0]
+        targets = pairs[order, 1].astype(np.int32)
+        durations = durations[order].astype(np.int32)
+    else:
+        sources = np.empty(0, dtype=np.int64)
+        targets = np.empty(0, dtype=np.int32)
+        durations = np.empty(0, dtype=np.int32)
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=n), out=offsets[1:])
+    # Rückwärts-Adjazenz (wer läuft zu dieser Haltestelle?) für die bidirektionale Suche
+    reverse_order = np.lexsort((sources, targets))
+    reverse_offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(targets, minlength=n), out=reverse_offsets[1:])
+
+    print(f"Umstiegsmodell erstellt: {len(targets)} Fußwege zwischen {n} Haltestellen")
+    return {
+        'stop_ids': stop_ids,
+        'stop_index': stop_index,
+        'offsets': offsets,
+        'targets': targets,
+        'durations': durations,
+        'min_change_time': min_change_time.astype(np.int32),
+        'reverse_offsets': reverse_offsets,
+        'reverse_sources': sources[reverse_order].astype(np.int32),
+        'reverse_durations': durations[reverse_order],
+    }
+
+
+def get_footpaths(transfer_model, stop_id):
+    """
+    Gibt alle Fußwege ab einer Haltestelle als Liste von (ziel_stop_id, dauer_in_sekunden) zurück.
+    """
+    if not transfer_model:
+        return []
+    i = transfer_model['stop_index'].get(stop_id)
+    if i is None:
+        return []
+    start, end = transfer_model['offsets'][i], transfer_model['offsets'][i + 1]
+    stop_ids = transfer_model['stop_ids']
+    return [(stop_ids[j], int(d)) for j, d in zip(transfer_model['targets'][start:end], transfer_model['durations'][start:end])]
+
+
+def get_reverse_footpaths(transfer_model, stop_id):
+    """
+    Gibt alle Fußwege ZU einer Haltestelle als Liste von (start_stop_id, dauer_in_sekunden) zurück.
+    """
+    if not transfer_model:
+        return []
+    i = transfer_model['stop_index'].get(stop_id)
+    if i is None:
+        return []
+    start, end = transfer_model['reverse_offsets'][i], transfer_model['reverse_offsets'][i + 1]
+    stop_ids = transfer_model['stop_ids']
+    return [(stop_ids[j], int(d)) for j, d in zip(transfer_model['reverse_sources'][start:end],
+                                                  transfer_model['reverse_durations'][start:end])]
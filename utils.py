@@ -86,10 +86,10 @@ def geocode_address(address, stops_df, address_df):
         raise ValueError("Keine Adressdatenbank verfügbar.")
     coords = find_address_coords(address, address_df)
     if not stops_df.empty and 'stop_lat' in stops_df.columns and 'stop_lon' in stops_df.columns:
-        stops_df = stops_df.dropna(subset=['stop_lat', 'stop_lon'])
-        stops_df['dist'] = stops_df.apply(
-            lambda row: haversine(coords[0], coords[1], row['stop_lat'], row['stop_lon']), axis=1)
-        nearest_stop = stops_df.loc[stops_df['dist'].idxmin()]['stop_id']
+        # Entfernungen als lokales Array berechnen -> der (geteilte) stops_df wird nicht verändert
+        stops = stops_df.dropna(subset=['stop_lat', 'stop_lon'])
+        dist = haversine(coords[0], coords[1], stops['stop_lat'].to_numpy(dtype=float), stops['stop_lon'].to_numpy(dtype=float))
+        nearest_stop = stops['stop_id'].iloc[int(np.argmin(dist))]
         return coords, nearest_stop
     else:
         return coords, None
@@ -102,7 +102,6 @@ def choose_stop(name, stops_df, min_score=70):
     # 1. Exakte Übereinstimmung
     exact_matches = stops_df[stop_names_lower == name_lower]
     if not exact_matches.empty:
-        print(f"[MATCH] Exakt: {exact_matches.iloc[0]['stop_name']}")
         return exact_matches.iloc[0]['stop_id']
 
     # 2. Mapping-Varianten
@@ -119,13 +118,11 @@ def choose_stop(name, stops_df, min_score=70):
         for variant in common_mappings[name_lower]:
             partial_matches = stops_df[stop_names_lower.str.contains(variant, na=False, regex=False)]
             if not partial_matches.empty:
-                print(f"[MATCH] Mapping: {partial_matches.iloc[0]['stop_name']}")
                 return partial_matches.iloc[0]['stop_id']
 
     # 3. Teilstring-Suche
     partial_matches = stops_df[stop_names_lower.str.contains(name_lower, na=False, regex=False)]
     if not partial_matches.empty:
-        print(f"[MATCH] Teilstring: {partial_matches.iloc[0]['stop_name']}")
         return partial_matches.iloc[0]['stop_id']
 
     # 4. Fuzzy-Matching
@@ -135,38 +132,17 @@ def choose_stop(name, stops_df, min_score=70):
         best_name = result[0]
         best_row = stops_df[stop_names == best_name]
         if not best_row.empty:
-            print(f"[MATCH] Fuzzy: '{best_name}' (Score: {result[1]}) für Eingabe '{name}'")
             return best_row.iloc[0]['stop_id']
 
-    print(f"[WARN] Keine Haltestelle mit Namen ähnlich zu '{name}' gefunden.")
     raise ValueError(f"Keine Haltestelle mit Namen ähnlich zu '{name}' gefunden.")
     
-def get_opposite_direction_stop_id(stop_id):
+def get_all_direction_variants(stop_id, serving_index):
     """
-    Findet die stop_id für die Gegenrichtung
+    Gibt alle Steige derselben Station zurück, die tatsächlich von Linien bedient werden
+    (statt die stop_id-Endungen ':1:1', ':2:2', ... zu raten)
     """
-    if stop_id.endswith(":1:1"):
-        return stop_id.replace(":1:1", ":2:2")
-    elif stop_id.endswith(":2:2"):
-        return stop_id.replace(":2:2", ":1:1")
-    elif stop_id.endswith(":1:2"):
-        return stop_id.replace(":1:2", ":2:1")
-    elif stop_id.endswith(":2:1"):
-        return stop_id.replace(":2:1", ":1:2")
-    return stop_id
-
-def get_all_direction_variants(stop_id):
-    """
-    Gibt alle möglichen Richtungsvarianten einer stop_id zurück
-    """
-    base_id = stop_id.rsplit(":", 2)[0]  # Entfernt die letzten beiden Teile
-    variants = [
-        f"{base_id}:1:1",
-        f"{base_id}:1:2", 
-        f"{base_id}:2:1",
-        f"{base_id}:2:2"
-    ]
-    return variants
+    siblings = serving_index['station_stops'].get(stop_id, (stop_id,))
+    return [other for other in siblings if other in serving_index['stop_patterns']]
 
 def get_enhanced_line_info(trip_id, direction, gtfs, route_name):
     """
@@ -252,6 +228,25 @@ def format_time_with_day_hint(start_time, end_time):
     else:
         return end_dt.strftime("%H:%M")
 
+def time_to_seconds(value):
+    """
+    Wandelt datetime.time/datetime oder 'HH:MM'/'HH:MM:SS' in Sekunden seit Mitternacht um.
+    """
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, str):
+        parts = [int(p) for p in value.split(':')]
+        parts += [0] * (3 - len(parts))
+        return parts[0] * 3600 + parts[1] * 60 + parts[2]
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+def seconds_to_time_str(seconds):
+    """
+    Formatiert Sekunden seit Mitternacht als 'HH:MM' (Zeiten nach Mitternacht werden auf 0-23 Uhr umgebrochen).
+    """
+    seconds = int(seconds) % (24 * 3600)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}"
+
 def get_valid_service_ids(calendar_df, date):
     weekday = date.strftime('%A').lower()
     valid_services = calendar_df[
@@ -262,55 +257,65 @@ def get_valid_service_ids(calendar_df, date):
     
     return valid_services
 
+def get_active_service_ids(calendar_df, calendar_dates_df, date):
+    """
+    Wie get_valid_service_ids, berücksichtigt aber zusätzlich calendar_dates.txt
+    (exception_type 1 = Fahrt findet zusätzlich statt, 2 = Fahrt fällt aus).
+    """
+    services = set(get_valid_service_ids(calendar_df, date)) if calendar_df is not None else set()
+    if calendar_dates_df is not None and not calendar_dates_df.empty:
+        day = calendar_dates_df[pd.to_numeric(calendar_dates_df['date'], errors='coerce') == int(date.strftime('%Y%m%d'))]
+        exception = pd.to_numeric(day['exception_type'], errors='coerce')
+        services |= set(day.loc[exception == 1, 'service_id'])
+        services -= set(day.loc[exception == 2, 'service_id'])
+    return services
+
 def print_route_grouped(itinerary, stops_df):
     """
     Verbesserte Route-Anzeige mit Gruppierung nach Fahrten (trip_id).
     Zeigt durchgehende Fahrten kompakter an mit Zwischenhalten.
     """
+    print(format_route_grouped(itinerary, stops_df))
+
+def format_route_grouped(itinerary, stops_df, stop_names=None):
+    """
+    Wie print_route_grouped, gibt den Text aber als String zurück (ohne stdout, thread-sicher).
+    stop_names: optionales dict stop_id -> Name, spart die Suche im DataFrame.
+    """
     if not itinerary:
-        print("Keine Route gefunden.")
-        return
+        return "Keine Route gefunden."
 
     def stop_id_to_name(stop_id, stops_df):
         """Hilfsfunktion für Haltestellenname"""
+        if stop_names is not None:
+            return stop_names.get(stop_id, f"Unbekannte Haltestelle ({stop_id})")
         row = stops_df[stops_df['stop_id'] == stop_id]
         if not row.empty:
             return row.iloc[0]['stop_name']
         else:
             return f"Unbekannte Haltestelle ({stop_id})"
 
-    # Gruppiere Route nach Fahrten (trip_id)
+    # Gruppiere Route nach Fahrten (trip_id), Fußwege (trip_id None) bilden eigene Gruppen
     grouped_legs = []
     current_trip = None
-    current_group = []
 
     for leg in itinerary:
         trip_id = leg.get('trip_id')
 
-        if current_trip is None:
-            # Erste Fahrt
-            current_trip = trip_id
-            current_group = [leg]
-        elif trip_id == current_trip:
+        if grouped_legs and trip_id == current_trip and not leg.get('walk', False):
             # Gleiche Fahrt fortsetzen
-            current_group.append(leg)
+            grouped_legs[-1].append(leg)
         else:
-            # Neue Fahrt -> vorherige Gruppe abschließen
-            if current_group:
-                grouped_legs.append(current_group)
+            # Neue Fahrt -> neue Gruppe
+            grouped_legs.append([leg])
             current_trip = trip_id
-            current_group = [leg]
-
-    # Letzte Gruppe hinzufügen
-    if current_group:
-        grouped_legs.append(current_group)
 
-    print("Gefundene Route:")
+    lines = ["Gefundene Route:"]
     segment_count = 0
 
     for group_idx, group in enumerate(grouped_legs):
         if group_idx > 0:
-            print("--> UMSTIEG <--")
+            lines.append("--> UMSTIEG <--")
 
         # Erste Haltestelle = Abfahrt
         first_leg = group[0]
@@ -318,16 +323,26 @@ def print_route_grouped(itinerary, stops_df):
         from_name = stop_id_to_name(first_leg['from_stop'], stops_df)
         direction = first_leg.get('direction', 'Unbekannt')
 
-        print(f"{segment_count:02d}. Abfahrt: {from_name}, Richtung: {direction}")
+        # Fußwege (Umstieg zu Fuß) werden in einer Zeile angezeigt
+        if first_leg.get('walk', False):
+            to_name = stop_id_to_name(group[-1]['to_stop'], stops_df)
+            lines.append(f"{segment_count:02d}. Fußweg: {from_name} -> {to_name} ({direction})")
+            continue
+
+        time_hint = f" um {first_leg['departure_time']}" if first_leg.get('departure_time') else ""
+        lines.append(f"{segment_count:02d}. Abfahrt: {from_name}{time_hint}, Richtung: {direction}")
 
         # Zwischenhaltestellen (alle to_stop außer der letzten)
         for i, leg in enumerate(group):
             if i < len(group) - 1:  # Nicht die letzte Haltestelle
                 segment_count += 1
                 to_name = stop_id_to_name(leg['to_stop'], stops_df)
-                print(f"{segment_count:02d}. Zwischenhalt: {to_name}")
+                lines.append(f"{segment_count:02d}. Zwischenhalt: {to_name}")
 
         # Letzte Haltestelle = Ankunft
         last_leg = group[-1]
         to_name = stop_id_to_name(last_leg['to_stop'], stops_df)
-        print(f"    Ankunft: {to_name}")
\ No newline at end of file
+        time_hint = f" um {last_leg['arrival_time']}" if last_leg.get('arrival_time') else ""
+        lines.append(f"    Ankunft: {to_name}{time_hint}")
+
+    return "\n".join(lines)
\ No newline at end of file
@@ -1,84 +1,276 @@
+import math
+import numpy as np
 import folium
 
-def visualize_route(itinerary, stops_df, filename="route_map.html"):
+# Farben für mehrere Routen/Alternativen auf einer Karte
+ROUTE_COLORS = ['blue', 'purple', 'darkgreen', 'cadetblue', 'darkred', 'orange', 'black']
+
+# Darstellung der Haltestellenarten im GeoJSON-Layer
+MARKER_STYLES = {
+    'stop': {'color': 'blue', 'fillColor': 'blue', 'radius': 4},
+    'transfer': {'color': 'orange', 'fillColor': 'orange', 'radius': 7},
+    'start': {'color': 'green', 'fillColor': 'green', 'radius': 8},
+    'end': {'color': 'red', 'fillColor': 'red', 'radius': 8},
+}
+
+
+def build_stop_index(stops_df):
     """
-    Visualisiert eine ÖPNV-Route interaktiv mit Folium.
+    Baut einen Index stop_id -> (lat, lon, name), damit pro Leg nicht der ganze DataFrame gefiltert werden muss.
     """
-    if not itinerary or stops_df.empty:
-        print("Keine Route oder Haltestellen zum Visualisieren.")
-        return
+    if stops_df is None or stops_df.empty:
+        return {}
+    stops = stops_df.dropna(subset=['stop_lat', 'stop_lon'])
+    return {
+        stop_id: (float(lat), float(lon), name)
+        for stop_id, lat, lon, name in zip(stops['stop_id'], stops['stop_lat'], stops['stop_lon'], stops['stop_name'])
+    }
+
+
+def build_shape_index(gtfs):
+    """
+    Baut aus shapes.txt und trips.txt einen Index für die echte Streckengeometrie.
+    Rückgabe: {'trip_shape': {trip_id: shape_id}, 'shapes': {shape_id: ndarray (n, 2) mit lat/lon}}
+    Ohne shapes.txt wird ein leerer Index zurückgegeben -> es werden dann gerade Linien gezeichnet.
+    """
+    shape_index = {'trip_shape': {}, 'shapes': {}}
+    if not gtfs or 'shapes' not in gtfs or 'trips' not in gtfs or 'shape_id' not in gtfs['trips'].columns:
+        return shape_index
+
+    trips = gtfs['trips'].dropna(subset=['shape_id'])
+    shape_index['trip_shape'] = dict(zip(trips['trip_id'], trips['shape_id']))
+
+    # Einmal sortieren, danach an den Grenzen der shape_ids in Blöcke schneiden
+    shapes = gtfs['shapes'].sort_values(['shape_id', 'shape_pt_sequence'], kind='stable')
+    shape_ids = shapes['shape_id'].to_numpy()
+    points = shapes[['shape_pt_lat', 'shape_pt_lon']].to_numpy(dtype=float)
+    if len(shape_ids) == 0:
+        return shape_index
+    bounds = np.flatnonzero(shape_ids[1:] != shape_ids[:-1]) + 1
+    starts = np.concatenate(([0], bounds))
+    ends = np.concatenate((bounds, [len(shape_ids)]))
+    for start, end in zip(starts, ends):
+        shape_index['shapes'][shape_ids[start]] = points[start:end]
+    return shape_index
+
+
+def tolerance_for_zoom(zoom, lat=49.0):
+    """
+    Vereinfachungstoleranz (in Grad) für eine Zoomstufe: ca. ein Bildschirmpixel.
+    """
+    meters_per_pixel = 156543.03 * math.cos(math.radians(lat)) / (2 ** zoom)
+    return meters_per_pixel / 111320.0
+
+
+def simplify_polyline(points, tolerance):
+    """
+    Vereinfacht eine Linie mit dem Douglas-Peucker-Verfahren (iterativ, ohne Rekursion).
+    points: ndarray (n, 2), tolerance in Grad.
+    """
+    points = np.asarray(points, dtype=float)
+    n = len(points)
+    if n <= 2 or tolerance <= 0:
+        return points
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = points[first], points[last]
+        segment = points[first + 1:last]
+        direction = end - start
+        length = np.hypot(direction[0], direction[1])
+        if length == 0:
+            dists = np.hypot(segment[:, 0] - start[0], segment[:, 1] - start[1])
+        else:
+            # Abstand jedes Punktes zur Geraden start -> end
+            dists = np.abs(direction[0] * (segment[:, 1] - start[1]) - direction[1] * (segment[:, 0] - start[0])) / length
+        idx = int(np.argmax(dists))
+        if dists[idx] > tolerance:
+            split = first + 1 + idx
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return points[keep]
+
 
-    # Sammle alle Koordinaten der Route
-    coords = []
-    names = []
-    transfer_points = []
-    
+def group_legs_by_trip(itinerary):
+    """
+    Gruppiert aufeinanderfolgende Legs mit gleicher trip_id (wie in print_route_grouped).
+    """
+    groups = []
+    current_trip = None
     for leg in itinerary:
-        from_stop = leg['from_stop']
-        to_stop = leg['to_stop']
-
-        from_row = stops_df[stops_df['stop_id'] == from_stop]
-        to_row = stops_df[stops_df['stop_id'] == to_stop]
-
-        if not from_row.empty:
-            coords.append((from_row.iloc[0]['stop_lat'], from_row.iloc[0]['stop_lon']))
-            names.append(from_row.iloc[0]['stop_name'])
-        
-        # Ziel-Haltestelle nur beim letzten Leg hinzufügen
-        if leg == itinerary[-1] and not to_row.empty:
-            coords.append((to_row.iloc[0]['stop_lat'], to_row.iloc[0]['stop_lon']))
-            names.append(to_row.iloc[0]['stop_name'])
-        
-        # Umstiegserkennung
-        if leg.get('transfer', False):
-            transfer_points.append(len(coords) - 1)
-
-    # Kartenerstellung
-    m = folium.Map(location=coords[0], zoom_start=13, tiles="OpenStreetMap")
-
-    # Route als Linie
-    folium.PolyLine(coords, color='blue', weight=5, opacity=0.8, tooltip="Route").add_to(m)
-
-    # Marker für Start und Ziel
-    folium.Marker(coords[0], popup=f"🚌 Start: {names[0]}", 
-                  icon=folium.Icon(color='green', icon='play')).add_to(m)
-    folium.Marker(coords[-1], popup=f"🏁 Ziel: {names[-1]}", 
-                  icon=folium.Icon(color='red', icon='stop')).add_to(m)
-
-    # Umstiegspunkte
-    for transfer_idx in transfer_points:
-        if transfer_idx < len(coords):
-            folium.Marker(coords[transfer_idx], 
-                         popup=f"🔄 UMSTIEG: {names[transfer_idx]}", 
-                         icon=folium.Icon(color='orange', icon='refresh')).add_to(m)
-
-    # Normale Haltestellen
-    for i, (lat, lon) in enumerate(coords[1:-1], 1):
-        if i not in transfer_points:
-            folium.CircleMarker([lat, lon], radius=4, color='blue', fill=True,
-                               fill_color='blue', popup=f"🚏 {names[i]}").add_to(m)
-
-    # Legende - KORRIGIERTE VERSION
+        trip_id = leg.get('trip_id')
+        if groups and trip_id == current_trip:
+            groups[-1].append(leg)
+        else:
+            groups.append([leg])
+            current_trip = trip_id
+    return groups
+
+
+def _snap_to_shape(points, coords):
+    """
+    Ordnet alle Halte einer Fahrt (in Fahrtreihenfolge) Shape-Punkten zu, mit nicht fallenden Indizes
+    und minimaler Summe der Abstandsquadrate (dynamische Programmierung, flache Näherung).
+    So landet bei Schleifen oder Hin- und Rückweg auf einem Shape jeder Halt auf dem richtigen Durchgang.
+    """
+    coords = np.asarray(coords, dtype=float)
+    # costs[j][i] = kleinste Abstandssumme der Halte 0..j, wenn Halt j auf Shape-Punkt i liegt
+    costs = [(points[:, 0] - coords[0, 0]) ** 2 + (points[:, 1] - coords[0, 1]) ** 2]
+    for lat, lon in coords[1:]:
+        costs.append((points[:, 0] - lat) ** 2 + (points[:, 1] - lon) ** 2 + np.minimum.accumulate(costs[-1]))
+    indices = [int(np.argmin(costs[-1]))]
+    for cost in reversed(costs[:-1]):
+        # bei Gleichstand den spätesten Punkt (kein Umweg über eine ganze Schleife)
+        prefix = cost[:indices[-1] + 1]
+        indices.append(len(prefix) - 1 - int(np.argmin(prefix[::-1])))
+    indices.reverse()
+    return indices
+
+
+def _group_geometry(group, stop_index, shape_index):
+    """
+    Liefert die Geometrie einer Fahrt (Gruppe von Legs) als ndarray (n, 2).
+    Nutzt den passenden Abschnitt aus shapes.txt, sonst gerade Linien zwischen den Haltestellen.
+    """
+    stop_coords = []
+    for leg in group:
+        if not stop_coords and leg['from_stop'] in stop_index:
+            stop_coords.append(stop_index[leg['from_stop']][:2])
+        if leg['to_stop'] in stop_index:
+            stop_coords.append(stop_index[leg['to_stop']][:2])
+    if not stop_coords:
+        return np.empty((0, 2))
+
+    if shape_index:
+        shape_id = shape_index['trip_shape'].get(group[0].get('trip_id'))
+        points = shape_index['shapes'].get(shape_id) if shape_id is not None else None
+        if points is not None and len(points) >= 2 and len(stop_coords) >= 2:
+            snapped = _snap_to_shape(points, stop_coords)
+            first, last = snapped[0], snapped[-1]
+            if last > first:
+                return np.vstack((stop_coords[0], points[first:last + 1], stop_coords[-1]))
+    return np.asarray(stop_coords, dtype=float)
+
+
+def _stop_features(itinerary, stop_index, label):
+    """
+    Erzeugt GeoJSON-Features für Start, Ziel, Umstiege und Zwischenhalte einer Route.
+    """
+    features = []
+    last = len(itinerary) - 1
+
+    def add(stop_id, kind):
+        if stop_id not in stop_index:
+            return
+        lat, lon, name = stop_index[stop_id]
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+            'properties': {'name': str(name), 'kind': kind, 'route': label},
+        })
+
+    for i, leg in enumerate(itinerary):
+        if i == 0:
+            add(leg['from_stop'], 'start')
+        elif leg.get('transfer', False):
+            add(leg['from_stop'], 'transfer')
+        else:
+            add(leg['from_stop'], 'stop')
+        if i == last:
+            add(leg['to_stop'], 'end')
+    return features
+
+
+def _marker_style(feature):
+    style = MARKER_STYLES[feature['properties']['kind']]
+    return {'color': style['color'], 'fillColor': style['fillColor'], 'radius': style['radius'],
+            'fillOpacity': 0.9, 'weight': 2}
+
+
+def visualize_routes(itineraries, stops_df, filename="route_map.html", gtfs=None, labels=None,
+                     stop_index=None, shape_index=None, zoom_start=13):
+    """
+    Visualisiert mehrere ÖPNV-Routen (z.B. Alternativen) auf einer Karte.
+    stop_index/shape_index können vorab gebaut und für viele Karten wiederverwendet werden.
+    """
+    itineraries = [it for it in (itineraries or []) if it]
+    if stop_index is None:
+        stop_index = build_stop_index(stops_df)
+    if not itineraries or not stop_index:
+        print("Keine Route oder Haltestellen zum Visualisieren.")
+        return None
+    if shape_index is None:
+        shape_index = build_shape_index(gtfs)
+    if labels is None:
+        labels = [f"Route {i + 1}" for i in range(len(itineraries))]
+
+    first_stop = next((leg['from_stop'] for leg in itineraries[0] if leg['from_stop'] in stop_index), None)
+    if first_stop is None:
+        print("Keine Koordinaten für die Route gefunden.")
+        return None
+    center = stop_index[first_stop][:2]
+    tolerance = tolerance_for_zoom(zoom_start, center[0])
+
+    m = folium.Map(location=center, zoom_start=zoom_start, tiles="OpenStreetMap")
+
+    features = []
+    transfer_count = 0
+    for idx, (itinerary, label) in enumerate(zip(itineraries, labels)):
+        color = ROUTE_COLORS[idx % len(ROUTE_COLORS)]
+        layer = folium.FeatureGroup(name=label)
+        for group in group_legs_by_trip(itinerary):
+            geometry = simplify_polyline(_group_geometry(group, stop_index, shape_index), tolerance)
+            if len(geometry) < 2:
+                continue
+            is_walk = group[0].get('walk', False)
+            folium.PolyLine(geometry.tolist(), color=color, weight=3 if is_walk else 5, opacity=0.8,
+                            dash_array='6' if is_walk else None,
+                            tooltip=f"{label}: {group[0].get('direction', '')}").add_to(layer)
+        layer.add_to(m)
+        features.extend(_stop_features(itinerary, stop_index, label))
+        transfer_count += sum(1 for leg in itinerary if leg.get('transfer', False))
+
+    # Alle Haltestellen-Marker als ein einziger GeoJSON-Layer statt einzelner Marker-Objekte
+    folium.GeoJson(
+        {'type': 'FeatureCollection', 'features': features},
+        name="Haltestellen",
+        marker=folium.CircleMarker(),
+        style_function=_marker_style,
+        popup=folium.GeoJsonPopup(fields=['name', 'route'], labels=False),
+    ).add_to(m)
+
+    if len(itineraries) > 1:
+        folium.LayerControl(collapsed=False).add_to(m)
+
     legend_html = """
-    <div style="position: fixed; 
-                top: 10px; right: 10px; width: 200px; height: 120px; 
-                background-color: white; border:2px solid grey; z-index:9999; 
+    <div style="position: fixed;
+                top: 10px; right: 10px; width: 200px; height: 120px;
+                background-color: white; border:2px solid grey; z-index:9999;
                 font-size:14px; padding: 10px">
     <h4>Legende</h4>
-    <p><i class="fa fa-play" style="color:green"></i> Start</p>
-    <p><i class="fa fa-stop" style="color:red"></i> Ziel</p>
-    <p><i class="fa fa-refresh" style="color:orange"></i> Umstieg</p>
+    <p><i class="fa fa-circle" style="color:green"></i> Start</p>
+    <p><i class="fa fa-circle" style="color:red"></i> Ziel</p>
+    <p><i class="fa fa-circle" style="color:orange"></i> Umstieg</p>
     <p><i class="fa fa-circle" style="color:blue"></i> Haltestelle</p>
     </div>
     """
-    
-    # KORRIGIERTE METHODE - ohne .html
     m.get_root().add_child(folium.Element(legend_html))
 
-    # Route-Informationen
-    umstieg_count = len(transfer_points)
-    print(f"Route visualisiert mit {umstieg_count} Umstieg(en)")
-    
+    print(f"{len(itineraries)} Route(n) visualisiert mit {transfer_count} Umstieg(en)")
     m.save(filename)
     print(f"Interaktive Karte gespeichert als {filename}")
+    return m
+
 
+def visualize_route(itinerary, stops_df, filename="route_map.html", gtfs=None, stop_index=None, shape_index=None):
+    """
+    Visualisiert eine ÖPNV-Route interaktiv mit Folium.
+    """
+    return visualize_routes([itinerary], stops_df, filename=filename, gtfs=gtfs,
+                            stop_index=stop_index, shape_index=shape_index)